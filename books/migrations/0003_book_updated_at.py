@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:03
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# SQLite adds the column by rebuilding books_book, which drops the search index triggers
+search_index = import_module("books.migrations.0002_booksearch")
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for statement in search_index.SQLITE_SEARCH_INDEX[1:]:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0002_booksearch"),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name="book",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:14
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count
+
+search_index = import_module("books.migrations.0002_booksearch")
+
+
+def check_duplicate_books(apps, schema_editor):
+    """Books sharing title, author & cover are merged by a command, which reports what it merges"""
+    Book = apps.get_model("books", "Book")
+
+    duplicates = Book.objects.values("title", "author", "cover").annotate(
+        count=Count("id")
+    ).filter(count__gt=1).count()
+    if duplicates:
+        raise RuntimeError(
+            f"{duplicates} book(s) have duplicates by title, author & cover. "
+            f"Run `python manage.py merge_duplicate_books` & migrate again."
+        )
+
+
+def restore_search_triggers(apps, schema_editor):
+    # SQLite adds the constraint by rebuilding books_book, which drops the search index triggers
+    if schema_editor.connection.vendor == "sqlite":
+        for statement in search_index.SQLITE_SEARCH_INDEX[1:]:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0003_book_updated_at"),
+        ("borrowings", "0004_borrowing_hot_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_books, migrations.RunPython.noop),
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddConstraint(
+            model_name="book",
+            constraint=models.UniqueConstraint(
+                fields=("title", "author", "cover"), name="books_book_natural_key"
+            ),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
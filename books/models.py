@@ -1,7 +1,9 @@
 from django.db import models
 
+from library_service.models import TimestampedModel
 
-class Book(models.Model):
+
+class Book(TimestampedModel):
     class CoverType(models.TextChoices):
         HARD = "hard", "Hard"
         SOFT = "soft", "Soft"
@@ -12,5 +14,41 @@ class Book(models.Model):
     inventory = models.PositiveIntegerField()
     daily_fee = models.DecimalField(max_digits=5, decimal_places=2)
 
+    # natural key of a book, bulk imports upsert on it
+    NATURAL_KEY = ("title", "author", "cover")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["title", "author", "cover"], name="books_book_natural_key"),
+        ]
+
+    # fields of the book string, also built from values() rows by describe
+    STR_FIELDS = ("title", "author", "cover", "inventory")
+
     def __str__(self):
-        return f"{self.title} by {self.author} | {self.cover} cover | {self.inventory} pcs"
+        return self.describe(self.title, self.author, self.cover, self.inventory)
+
+    @staticmethod
+    def describe(title: str, author: str, cover: str, inventory: int) -> str:
+        return f"{title} by {author} | {cover} cover | {inventory} pcs"
+
+
+class BookSearch(models.Model):
+    """SQLite FTS5 index over book title & author, kept in sync by database triggers.
+    On PostgreSQL a GIN tsvector index over books_book is used instead"""
+
+    book = models.OneToOneField(
+        Book,
+        primary_key=True,
+        db_column="rowid",
+        on_delete=models.DO_NOTHING,
+        related_name="search",
+    )
+    title = models.TextField()
+    author = models.TextField()
+    match = models.TextField(db_column="books_book_fts")
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "books_book_fts"
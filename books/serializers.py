@@ -1,9 +1,45 @@
 from rest_framework import serializers
 
 from books.models import Book
+from library_service.fieldsets import FieldsetSerializerMixin
 
 
-class BookSerializer(serializers.ModelSerializer):
+IMPORT_FORMATS = {"csv": "csv", "ndjson": "ndjson", "jsonl": "ndjson"}
+
+
+class BookSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ("id", "title", "author", "cover", "inventory", "daily_fee", )
+
+    def update(self, instance, validated_data):
+        # only changed fields are saved, so an inventory change keeps cached catalog pages
+        changed = [field for field, value in validated_data.items() if getattr(instance, field) != value]
+        for field in changed:
+            setattr(instance, field, validated_data[field])
+        if changed:
+            instance.save(update_fields=changed)
+        return instance
+
+
+class BookImportSerializer(BookSerializer):
+    class Meta(BookSerializer.Meta):
+        # rows of existing books are upserted by the natural key, not rejected as duplicates
+        validators = []
+
+
+class BookImportFileSerializer(serializers.Serializer):
+    file = serializers.FileField(help_text="CSV with a header line or NDJSON, a book per line")
+    input_format = serializers.ChoiceField(
+        choices=sorted(set(IMPORT_FORMATS.values())),
+        required=False,
+        help_text="Taken from the file extension (.csv, .ndjson, .jsonl) by default",
+    )
+
+    def validate(self, data):
+        if "input_format" not in data:
+            extension = data["file"].name.rpartition(".")[2].lower()
+            if extension not in IMPORT_FORMATS:
+                raise serializers.ValidationError({"input_format": "Unknown file type, set input_format."})
+            data["input_format"] = IMPORT_FORMATS[extension]
+        return data
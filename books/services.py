@@ -0,0 +1,222 @@
+import csv
+import hashlib
+import io
+import json
+import re
+import time
+from itertools import batched
+from typing import Iterable, Iterator
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import QuerySet, F
+
+from rest_framework.exceptions import ValidationError
+
+from books.models import Book
+from books.serializers import BookImportSerializer
+
+SEARCH_CONFIG = "simple"
+
+# Cached catalog payloads are keyed by a generation, bumped on any book change but inventory.
+# Inventory is kept under its own key per book & laid over cached payloads on every read.
+# That key holds the version of the book's inventory: dropping the version on a write orphans
+# a count read before the write & cached after it.
+CATALOG_GENERATION_KEY = "books:generation"
+INVENTORY_VERSION_KEY = "books:inventory-version"
+
+
+def search_terms(query: str) -> list[str]:
+    """ Split user input into words, dropping search syntax characters
+        Return: list of words """
+    return re.findall(r"\w+", query.lower())
+
+
+def search_books(queryset: QuerySet, query: str) -> QuerySet:
+    """ Full-text search over title & author, every word matched as a prefix (autocomplete)
+        Return: queryset of matching books, best ranked first """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    if connection.vendor == "postgresql":
+        vector = SearchVector("title", "author", config=SEARCH_CONFIG)
+        search_query = SearchQuery(
+            " & ".join(f"{term}:*" for term in terms),
+            config=SEARCH_CONFIG,
+            search_type="raw",
+        )
+        return queryset.annotate(search_vector=vector).filter(
+            search_vector=search_query
+        ).annotate(
+            rank=SearchRank(vector, search_query)
+        ).order_by("-rank", "id")
+
+    # SQLite FTS5: bm25 rank, lower is better
+    return queryset.filter(
+        search__match=" ".join(f'"{term}"*' for term in terms)
+    ).annotate(
+        rank=F("search__rank")
+    ).order_by("rank", "id")
+
+
+def _counter(key: str) -> int:
+    counter = cache.get(key)
+    if counter is None:
+        # a clock based start never meets payloads of an evicted counter
+        cache.add(key, time.time_ns(), timeout=None)
+        counter = cache.get(key)
+    return counter
+
+
+def _bump(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def catalog_generation() -> int:
+    """ Current generation of cached catalog payloads
+        Return: generation number """
+    return _counter(CATALOG_GENERATION_KEY)
+
+
+def catalog_version() -> tuple[int, int]:
+    """ Version of the whole catalog, read from cache: changed by any book write
+        Return: (catalog generation, inventory version) """
+    return _counter(CATALOG_GENERATION_KEY), _counter(INVENTORY_VERSION_KEY)
+
+
+def _bump_generation() -> None:
+    _bump(CATALOG_GENERATION_KEY)
+
+
+def _inventory_key(book_id: int, version: int) -> str:
+    return f"books:inventory:{book_id}:{version}"
+
+
+def _inventory_version_key(book_id: int) -> str:
+    return f"books:inventory-version:{book_id}"
+
+
+def _inventory_versions(book_ids: list[int]) -> dict[int, int]:
+    """ Return: current inventory version by book id, missing ones are started from the clock """
+    keys = {_inventory_version_key(book_id): book_id for book_id in book_ids}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, time.time_ns(), timeout=None)
+    if len(versions) < len(keys):
+        versions = cache.get_many(keys)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def _delete_inventory(book_ids: tuple[int, ...]) -> None:
+    cache.delete_many([_inventory_version_key(book_id) for book_id in book_ids])
+    _bump(INVENTORY_VERSION_KEY)
+
+
+def invalidate_catalog() -> None:
+    """ Drop all cached list pages & details, again after commit:
+        a read between both could cache rows of the old snapshot """
+    _bump_generation()
+    transaction.on_commit(_bump_generation)
+
+
+def invalidate_inventory(*book_ids: int) -> None:
+    """ Drop the cached inventory of these books only, cached pages stay valid """
+    _delete_inventory(book_ids)
+    transaction.on_commit(lambda: _delete_inventory(book_ids))
+
+
+def catalog_cache_key(request, view: str) -> str:
+    """ Return: cache key of the response payload for the request url in the current generation """
+    url = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return f"books:{view}:{catalog_generation()}:{url}"
+
+
+def with_current_inventory(books: list[dict]) -> None:
+    """ Replace inventory of serialized books by cached values,
+        missing ones are read in one query & cached under the version read before the query """
+    versions = _inventory_versions([book["id"] for book in books if "inventory" in book])
+    keys = {_inventory_key(book["id"], versions[book["id"]]): book for book in books if "inventory" in book}
+    inventory = cache.get_many(keys)
+
+    missing = [book["id"] for key, book in keys.items() if key not in inventory]
+    if missing:
+        fresh = {
+            _inventory_key(book_id, versions[book_id]): count
+            for book_id, count in Book.objects.filter(id__in=missing).values_list("id", "inventory")
+        }
+        cache.set_many(fresh, settings.BOOK_CACHE_TTL)
+        inventory.update(fresh)
+
+    for key, book in keys.items():
+        book["inventory"] = inventory.get(key, book["inventory"])
+
+
+def upsert_books(books: list[Book]) -> list[Book]:
+    """ Insert new books, update inventory & daily fee of existing ones matched by the natural key
+        Return: books with primary keys set """
+    books = Book.objects.bulk_create(
+        books,
+        update_conflicts=True,
+        unique_fields=Book.NATURAL_KEY,
+        update_fields=["inventory", "daily_fee", "updated_at"],
+    )
+    # bulk_create sends no signals
+    invalidate_catalog()
+    invalidate_inventory(*(book.id for book in books))
+    return books
+
+
+def read_import_rows(stream, input_format: str) -> Iterator[dict | ValidationError]:
+    """ Stream rows of a binary CSV (with a header line) or NDJSON file, a line at a time
+        Return: iterator of row dicts, ValidationError for unreadable NDJSON lines """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if input_format == "csv":
+        yield from csv.DictReader(text)
+        return
+
+    for line in text:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as error:
+            yield ValidationError(f"Invalid JSON: {error.msg}")
+
+
+def import_books(rows: Iterable, batch_size: int = 1000, max_errors: int = 1000) -> dict:
+    """ Validate rows with BookSerializer rules & upsert valid ones batch by batch,
+        the last row of a natural key in a batch wins
+        Return: report with rows, imported & invalid counts, first errors by row number & rows/s """
+    started = time.perf_counter()
+    report = {"rows": 0, "invalid": 0, "errors": []}
+    serializer = BookImportSerializer()
+
+    for batch in batched(enumerate(rows, start=1), batch_size):
+        books = {}
+        for number, row in batch:
+            try:
+                if isinstance(row, ValidationError):
+                    raise row
+                book = Book(**serializer.run_validation(row))
+            except ValidationError as error:
+                report["invalid"] += 1
+                if len(report["errors"]) < max_errors:
+                    report["errors"].append({"row": number, "errors": error.detail})
+                continue
+            books[tuple(getattr(book, field) for field in Book.NATURAL_KEY)] = book
+
+        with transaction.atomic():
+            upsert_books(list(books.values()))
+        report["rows"] += len(batch)
+
+    report["imported"] = report["rows"] - report["invalid"]
+    seconds = time.perf_counter() - started
+    report["seconds"] = round(seconds, 3)
+    report["rows_per_second"] = round(report["rows"] / max(seconds, 1e-6))
+    return report
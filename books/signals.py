@@ -0,0 +1,22 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from books.models import Book
+from books.services import invalidate_catalog, invalidate_inventory
+
+
+@receiver(post_save, sender=Book)
+def invalidate_cache_after_save(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) - {"updated_at"} == {"inventory"}:
+        invalidate_inventory(instance.id)
+        return
+
+    # ids of deleted books may be reused (e.g. by the test database)
+    if created:
+        invalidate_inventory(instance.id)
+    invalidate_catalog()
+
+
+@receiver(post_delete, sender=Book)
+def invalidate_cache_after_delete(sender, instance, **kwargs):
+    invalidate_catalog()
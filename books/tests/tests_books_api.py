@@ -1,4 +1,14 @@
-from django.test import TestCase
+import tempfile
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
 
 from django.urls import reverse
 from rest_framework import status
@@ -6,10 +16,15 @@ from rest_framework.test import APITestCase, APIClient
 
 from books.models import Book
 from books.serializers import BookSerializer
+from books.services import catalog_generation, with_current_inventory, _inventory_key, _inventory_versions
+from borrowings.services import reserve_book
+from notifications.services import NotificationQueue
+from library_service.pagination import CountLimitOffsetPagination, KeysetPagination
 from tests.init_sample import (
     init_sample_user,
     init_sample_book,
-    init_sample_admin_user
+    init_sample_admin_user,
+    init_sample_borrowing,
 )
 
 BOOK_URL = reverse("books:book-list")
@@ -146,3 +161,293 @@ class AdminUserBooksAPITestCase(APITestCase):
         response = self.client.delete(detail_url(BOOK_DETAIL_URL, self.book1.pk))
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Book.objects.count(), book_count - 1)
+
+
+class BookPaginationAPITestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.books = [init_sample_book(title=f"Sample_book{index}") for index in range(7)]
+
+    def test_book_list_offset_pagination_default(self):
+        response = self.client.get(BOOK_URL, {"offset": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(response.data["count"], 7)
+        self.assertEqual(
+            [book["id"] for book in response.data["results"]],
+            [book.id for book in self.books[3:6]],
+        )
+
+    def test_book_list_cursor_pagination_walk_all_pages(self):
+        ids = []
+        url = BOOK_URL + "?pagination=cursor&limit=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            ids += [book["id"] for book in response.data["results"]]
+            url = response.data["next"]
+
+        self.assertEqual(ids, [book.id for book in self.books])
+
+    def test_book_list_count_skipped(self):
+        response = self.client.get(BOOK_URL, {"count": "false", "offset": 3})
+        self.assertIsNone(response.data["count"])
+        self.assertIn("offset=6", response.data["next"])
+
+        response = self.client.get(BOOK_URL, {"count": "false", "offset": 6})
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next"])
+
+    def test_book_list_count_approx(self):
+        response = self.client.get(BOOK_URL, {"count": "approx"})
+        self.assertEqual(response.data["count"], 7)
+
+    @patch.object(KeysetPagination, "max_page_size", 2)
+    @patch.object(CountLimitOffsetPagination, "max_limit", 2)
+    def test_book_list_limit_capped(self):
+        response = self.client.get(BOOK_URL, {"limit": 1000})
+        self.assertEqual(len(response.data["results"]), 2)
+
+        response = self.client.get(BOOK_URL, {"limit": 1000, "pagination": "cursor"})
+        self.assertEqual(len(response.data["results"]), 2)
+
+
+class BookSearchAPITestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.hobbit = init_sample_book(title="The Hobbit", author="J. R. R. Tolkien")
+        self.rings = init_sample_book(title="The Lord of the Rings", author="J. R. R. Tolkien")
+        self.dune = init_sample_book(title="Dune", author="Frank Herbert")
+
+    def search(self, query):
+        response = self.client.get(BOOK_URL, {"search": query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book["id"] for book in response.data["results"]]
+
+    def test_book_search_by_author_prefix(self):
+        self.assertCountEqual(self.search("tolk"), [self.hobbit.id, self.rings.id])
+
+    def test_book_search_all_words_matched(self):
+        self.assertEqual(self.search("tolkien hob"), [self.hobbit.id])
+
+    def test_book_search_ranked(self):
+        init_sample_book(title="Dune Messiah", author="Frank Herbert")
+        init_sample_book(title="Dune Dune Dune", author="Frank Herbert")
+
+        self.assertEqual(self.search("dune")[0], Book.objects.get(title="Dune Dune Dune").id)
+
+    def test_book_search_cursor_pagination_rejected(self):
+        response = self.client.get(BOOK_URL, {"search": "dune", "pagination": "cursor"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("pagination", response.data)
+
+    def test_book_search_syntax_ignored(self):
+        self.assertEqual(self.search('dune"*:'), [self.dune.id])
+        self.assertEqual(self.search('"*'), [])
+
+    def test_book_search_index_follow_changes(self):
+        self.dune.title = "Children of Dune"
+        self.dune.save()
+        self.hobbit.delete()
+        Book.objects.filter(pk=self.rings.pk).update(inventory=0)
+
+        self.assertEqual(self.search("children"), [self.dune.id])
+        self.assertEqual(self.search("tolkien"), [self.rings.id])
+
+
+class BookCacheAPITestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.book = init_sample_book()
+        self.admin = init_sample_admin_user(1)
+
+    def test_book_list_and_detail_served_from_cache(self):
+        self.client.get(BOOK_URL)
+        self.client.get(detail_url(BOOK_DETAIL_URL, self.book.id))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(BOOK_URL)
+            detail = self.client.get(detail_url(BOOK_DETAIL_URL, self.book.id))
+
+        self.assertEqual(response.data["results"][0]["title"], "Sample_book1")
+        self.assertEqual(detail.data["title"], "Sample_book1")
+
+    def test_book_change_invalidates_catalog(self):
+        self.client.get(BOOK_URL)
+
+        self.book.title = "Renamed"
+        self.book.save()
+        init_sample_book(title="Sample_book2")
+
+        response = self.client.get(BOOK_URL)
+        self.assertEqual([book["title"] for book in response.data["results"]], ["Renamed", "Sample_book2"])
+
+    def test_book_inventory_change_keeps_cached_pages(self):
+        self.client.get(BOOK_URL)
+        generation = catalog_generation()
+
+        reserve_book(self.book.id)
+        self.client.force_authenticate(self.admin)
+        self.client.patch(detail_url(BOOK_DETAIL_URL, self.book.id), {"inventory": 5})
+        self.client.force_authenticate(None)
+        reserve_book(self.book.id)
+
+        self.assertEqual(catalog_generation(), generation)
+        with self.assertNumQueries(1):
+            response = self.client.get(BOOK_URL)
+        self.assertEqual(response.data["results"][0]["inventory"], 4)
+        self.assertEqual(self.client.get(detail_url(BOOK_DETAIL_URL, self.book.id)).data["inventory"], 4)
+
+    def test_book_inventory_read_before_change_not_cached_after(self):
+        # a reader took the version & read the old count, a borrow commits before the count is cached
+        version = _inventory_versions([self.book.id])[self.book.id]
+        reserve_book(self.book.id)
+        cache.set(_inventory_key(self.book.id, version), 11)
+
+        books = [{"id": self.book.id, "inventory": None}]
+        with_current_inventory(books)
+        self.assertEqual(books[0]["inventory"], 10)
+
+    def test_book_not_modified_until_inventory_changes(self):
+        etag = self.client.get(BOOK_URL)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        reserve_book(self.book.id)
+
+        response = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["inventory"], 10)
+
+
+BOOK_IMPORT_URL = reverse("books:book-bulk-import")
+
+CATALOG_CSV = (
+    "title,author,cover,inventory,daily_fee\n"
+    "Dune,Frank Herbert,hard,5,1.50\n"
+    "Sample_book1,Author1,soft,40,2.00\n"
+    "Broken,,soft,-1,1\n"
+    "Dune,Frank Herbert,hard,7,1.50\n"
+)
+
+
+class BookImportAPITestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.book = init_sample_book()
+        self.client.force_authenticate(init_sample_admin_user(1))
+
+    def upload(self, name, content, **data):
+        return self.client.post(
+            BOOK_IMPORT_URL, {"file": SimpleUploadedFile(name, content.encode()), **data}, format="multipart"
+        )
+
+    def test_book_import_csv_upserted(self):
+        self.client.get(BOOK_URL)
+
+        response = self.upload("catalog.csv", CATALOG_CSV)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        counts = [response.data[key] for key in ("rows", "imported", "invalid")]
+        self.assertEqual(counts, [4, 3, 1])
+        self.assertEqual(response.data["errors"][0]["row"], 3)
+        self.assertEqual(set(response.data["errors"][0]["errors"]), {"author", "inventory"})
+        self.assertIn("rows_per_second", response.data)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 40)
+        self.assertEqual(Book.objects.get(title="Dune").inventory, 7)
+        self.assertEqual(Book.objects.count(), 2)
+        # cached catalog pages follow the import
+        self.assertEqual(
+            {book["title"]: book["inventory"] for book in self.client.get(BOOK_URL).data["results"]},
+            {"Sample_book1": 40, "Dune": 7},
+        )
+
+    def test_book_import_ndjson_invalid_line_reported(self):
+        content = (
+            '{"title": "Dune", "author": "Frank Herbert", "cover": "hard", '
+            '"inventory": 5, "daily_fee": "1.5"}\n'
+            "{not json\n"
+            '["title"]\n'
+        )
+
+        response = self.upload("catalog.upload", content, input_format="ndjson")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["imported"], 1)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [2, 3])
+
+    def test_book_import_unknown_format_rejected(self):
+        response = self.upload("catalog.xls", CATALOG_CSV)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_book_import_admin_only(self):
+        self.client.force_authenticate(init_sample_user(2))
+        self.assertEqual(self.upload("catalog.csv", CATALOG_CSV).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_book_import_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write(CATALOG_CSV)
+            file.flush()
+            out = StringIO()
+            call_command("import_books", file.name, "--batch-size", "2", stdout=out)
+
+        self.assertIn("Imported 3 of 4 rows", out.getvalue())
+        self.assertIn("Row 3:", out.getvalue())
+        self.assertEqual(Book.objects.get(title="Dune").inventory, 7)
+
+
+class MergeDuplicateBooksCommandTests(TransactionTestCase):
+    """Duplicates are only possible before the natural key constraint, it is dropped for the test"""
+
+    def setUp(self):
+        constraint = Book._meta.constraints[0]
+        # SQLite rebuilds the table from the model options, without the constraint
+        with patch.object(Book._meta, "constraints", []), connection.schema_editor() as editor:
+            editor.remove_constraint(Book, constraint)
+        self.addCleanup(self.restore_constraint)
+        # notifications are sent on commit, which is real here
+        patch.object(NotificationQueue, "push").start()
+        self.addCleanup(patch.stopall)
+
+        self.user = init_sample_user(1)
+        self.first = init_sample_book(inventory=2)
+        self.second = init_sample_book(inventory=3)
+        self.borrowing = init_sample_borrowing(self.second, self.user)
+
+    def restore_constraint(self):
+        Book.objects.all().delete()
+        with connection.schema_editor() as editor:
+            editor.add_constraint(Book, Book._meta.constraints[0])
+            if connection.vendor == "sqlite":
+                for statement in import_module("books.migrations.0002_booksearch").SQLITE_SEARCH_INDEX[1:]:
+                    editor.execute(statement)
+
+    def test_merge_duplicate_books(self):
+        out = StringIO()
+        call_command("merge_duplicate_books", "--dry-run", stdout=out)
+        self.assertIn(
+            f"Book {self.first.id} (Sample_book1): merged {self.second.id}, inventory 5", out.getvalue()
+        )
+        self.assertEqual(Book.objects.count(), 2)
+
+        call_command("merge_duplicate_books", stdout=StringIO())
+        self.assertEqual(list(Book.objects.values_list("id", "inventory")), [(self.first.id, 5)])
+        self.borrowing.refresh_from_db()
+        self.assertEqual(self.borrowing.book_id, self.first.id)
+
+    def test_merge_duplicate_books_different_fee_skipped(self):
+        Book.objects.filter(id=self.second.id).update(daily_fee=2)
+
+        out = StringIO()
+        call_command("merge_duplicate_books", stdout=out)
+        self.assertIn("differ in daily fee (2.00, 10.34), skipped", out.getvalue())
+        self.assertEqual(Book.objects.count(), 2)
+
+        call_command("merge_duplicate_books", "--keep-first-fee", stdout=StringIO())
+        self.assertEqual(Book.objects.get().daily_fee, Decimal("10.34"))
@@ -1,21 +1,72 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render
-from drf_spectacular.utils import extend_schema_view, extend_schema
-from rest_framework import viewsets
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter, inline_serializer
+from rest_framework import viewsets, serializers, status
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 
 from books.models import Book
 from books.permissions import IsAdminOrReadOnly
-from books.serializers import BookSerializer
+from books.serializers import BookSerializer, BookImportFileSerializer
+from books.services import (
+    search_books,
+    catalog_cache_key,
+    catalog_version,
+    with_current_inventory,
+    read_import_rows,
+    import_books,
+)
+from library_service.etags import ConditionalGetMixin
+from library_service.fieldsets import FIELDSET_PARAMETERS, FieldsetMixin
+from library_service.projections import ValuesRepresentation, ValuesListMixin
+
+
+class CachedCatalogMixin:
+    """Serve list & retrieve payloads from the catalog cache, current inventory laid over them"""
+
+    def list(self, request, *args, **kwargs):
+        key = catalog_cache_key(request, "list")
+        if (data := cache.get(key)) is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, settings.BOOK_CACHE_TTL)
+
+        with_current_inventory(data["results"])
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        key = catalog_cache_key(request, "detail")
+        if (data := cache.get(key)) is None:
+            data = super().retrieve(request, *args, **kwargs).data
+            cache.set(key, data, settings.BOOK_CACHE_TTL)
+
+        with_current_inventory([data])
+        return Response(data)
 
 
 @extend_schema_view(
     list=extend_schema(
         summary="List of all books",
+        parameters=[
+            OpenApiParameter(
+                "search",
+                type=OpenApiTypes.STR,
+                required=False,
+                description="Search books by title & author, words may be incomplete "
+                            "(ex. ?search=tolk hobb). Results are ordered by relevance.",
+            ),
+            *FIELDSET_PARAMETERS,
+        ]
     ),
     create=extend_schema(
         summary="Add new book",
     ),
     retrieve=extend_schema(
         summary="Get book object by id",
+        parameters=FIELDSET_PARAMETERS,
     ),
     update=extend_schema(
         summary="Update book",
@@ -27,8 +78,67 @@ from books.serializers import BookSerializer
     destroy=extend_schema(
         summary="Delete book",
     ),
+    bulk_import=extend_schema(
+        summary="Bulk import books ( only for Admin users )",
+        description="Upload a CSV (with a header line) or NDJSON file of books. "
+                    "Rows are validated like single books & upserted by title, author & cover: "
+                    "inventory & daily fee of existing books are updated.",
+        responses={
+            status.HTTP_200_OK: inline_serializer(
+                name="BookImportReport",
+                fields={
+                    "rows": serializers.IntegerField(),
+                    "imported": serializers.IntegerField(),
+                    "invalid": serializers.IntegerField(),
+                    "errors": serializers.ListField(child=serializers.DictField()),
+                    "seconds": serializers.FloatField(),
+                    "rows_per_second": serializers.IntegerField(),
+                }
+            ),
+        },
+    ),
 )
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(ConditionalGetMixin,
+                  CachedCatalogMixin,
+                  FieldsetMixin,
+                  ValuesListMixin,
+                  viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = (IsAdminOrReadOnly,)
+    values_representation = ValuesRepresentation(BookSerializer)
+
+    def get_serializer_class(self):
+        if self.action == "bulk_import":
+            return BookImportFileSerializer
+        return BookSerializer
+
+    def get_queryset(self):
+        queryset = self.queryset
+
+        search = self.request.query_params.get("search")
+        if search and self.action == "list":
+            queryset = search_books(queryset, search)
+
+        return queryset
+
+    @action(
+        methods=["POST", ],
+        detail=False,
+        url_path="import",
+        permission_classes=[IsAdminUser, ],
+        parser_classes=[MultiPartParser, ],
+    )
+    def bulk_import(self, request):
+        """Endpoint for bulk import & upsert of books from a streamed file"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        upload = serializer.validated_data["file"]
+        rows = read_import_rows(upload.file, serializer.validated_data["input_format"])
+        report = import_books(rows, batch_size=settings.BOOK_IMPORT_BATCH_SIZE)
+        return Response(report, status=status.HTTP_200_OK)
+
+    def get_version(self, queryset) -> tuple:
+        # kept in cache by signals & inventory updates: no database round trip on cached reads
+        return catalog_version()
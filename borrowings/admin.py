@@ -1,5 +1,24 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils import timezone
 
 from borrowings.models import Borrowing
+from borrowings.services import return_borrowings
 
-admin.site.register(Borrowing)
+
+@admin.register(Borrowing)
+class BorrowingAdmin(admin.ModelAdmin):
+    list_display = ("id", "book", "user", "borrow_date", "expected_return_date", "actual_return_date")
+    list_filter = ("actual_return_date", )
+    list_select_related = ("book", "user")
+    actions = ("mark_returned", )
+
+    @admin.action(description="Mark selected borrowings as returned today")
+    def mark_returned(self, request, queryset):
+        borrowings, fines = return_borrowings(
+            list(queryset.values_list("id", flat=True)), timezone.now().date(), request
+        )
+        self.message_user(
+            request,
+            f"{len(borrowings)} borrowing(s) returned, {len(fines)} fine(s) created.",
+            messages.SUCCESS,
+        )
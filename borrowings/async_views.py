@@ -0,0 +1,74 @@
+import json
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from borrowings.serializers import BorrowingCreateSerializer
+from borrowings.services import apending_count, reserve_book
+from payments.models import Payment
+from payments.services import (
+    acreate_checkout_session,
+    checkout_urls,
+    closes_stripe_client_under_wsgi,
+    create_borrowing_payment,
+)
+from payments.tasks import schedule_checkout_session
+from users.authentication import jwt_required
+
+
+def _borrow(serializer: BorrowingCreateSerializer) -> Payment | None:
+    """ Reserve the book, save the borrowing & its payment in one transaction
+        Return: Payment object or None, if the last copy was taken meanwhile """
+
+    with transaction.atomic():
+        if not reserve_book(serializer.validated_data["book"].id):
+            return None
+        return create_borrowing_payment(serializer.save())
+
+
+@csrf_exempt
+@require_POST
+@jwt_required
+@closes_stripe_client_under_wsgi
+async def borrowing_create(request):
+    """Async endpoint for adding new borrowing: the Stripe checkout session is created in the request,
+    awaited without holding a thread, & the reader is redirected straight to it"""
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error."}, status=400)
+    else:
+        data = request.POST
+
+    serializer = BorrowingCreateSerializer(data=data, context={"request": request})
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, status=400)
+
+    if (count := await apending_count(request.user)) > 0:
+        return JsonResponse(
+            {"Borrowing" : "Is not allowed.", "Count of pending payments" : count},
+            status=403
+        )
+
+    if (payment := await sync_to_async(_borrow)(serializer)) is None:
+        return JsonResponse({"book": ["The book cannot be borrowed: inventory=0."]}, status=400)
+
+    try:
+        created = await acreate_checkout_session(
+            [payment], *checkout_urls(request, "payments:payment-success-async")
+        )
+    except stripe.error.StripeError:
+        created = None
+
+    if created is None:
+        # Stripe is unavailable: the session is created by the worker with retries, the client polls
+        await sync_to_async(schedule_checkout_session)(payment, request)
+        return redirect("payments:payment-checkout", pk=payment.id)
+
+    return redirect(payment.session_url)
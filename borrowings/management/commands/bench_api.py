@@ -0,0 +1,329 @@
+import itertools
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+from unittest.mock import patch
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from books.models import Book
+from borrowings.models import Borrowing
+from library_service.celery import app as celery_app
+from notifications.services import NotificationQueue, TelegramSender
+
+ENDPOINTS = (
+    "token_obtain",
+    "book_list",
+    "book_retrieve",
+    "borrowing_create",
+    "borrowing_list",
+    "borrowing_detail",
+    "borrowing_return",
+    "payment_list",
+)
+# a server under test over HTTP has its own Stripe & Celery, endpoints creating payments are left out
+HTTP_ENDPOINTS = tuple(
+    endpoint for endpoint in ENDPOINTS if endpoint not in ("borrowing_create", "borrowing_return")
+)
+BENCH_PASSWORD = "benchpass"
+BENCH_EMAIL_DOMAIN = "bench.library.test"
+
+
+class LocalCheckoutSession:
+    """Stand-in for stripe.checkout.Session: an open session, no network round trip"""
+
+    numbers = itertools.count(1)
+
+    def __init__(self, *args, **kwargs):
+        self.id = f"cs_bench_{next(self.numbers)}_{time.time_ns()}"
+        self.url = f"https://checkout.stripe.com/c/pay/{self.id}"
+        self.status = "open"
+        self.payment_status = "unpaid"
+        self.expires_at = int(time.time()) + 24 * 60 * 60
+
+
+def percentile(values: list[float], percent: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+class HttpClient(requests.Session):
+    """Client of a running server with the test Client calls: get / post(path, data, **WSGI headers)"""
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+
+    @staticmethod
+    def headers_of(environ: dict) -> dict:
+        return {
+            name.removeprefix("HTTP_").replace("_", "-").title(): value for name, value in environ.items()
+        }
+
+    def get(self, path, data=None, **headers):
+        return super().get(self.base_url + path, params=data, headers=self.headers_of(headers))
+
+    def post(self, path, data=None, **headers):
+        return super().post(
+            self.base_url + path, data=data, headers=self.headers_of(headers), allow_redirects=False
+        )
+
+
+def bearer(user) -> dict:
+    token = AccessToken.for_user(user)
+    return {jwt_settings.AUTH_HEADER_NAME: f"{jwt_settings.AUTH_HEADER_TYPES[0]} {token}"}
+
+
+class Command(BaseCommand):
+    """Django command to drive key API endpoints concurrently & report latency percentiles"""
+
+    help = "Benchmark API endpoints against the current (seeded) database, Stripe & Telegram stubbed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per endpoint (default: 200)"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="Concurrent clients (default: 4)"
+        )
+        parser.add_argument(
+            "--endpoints",
+            help=f"Comma separated endpoints to run (default: all of {', '.join(ENDPOINTS)})",
+        )
+        parser.add_argument(
+            "--base-url",
+            help="Send requests over HTTP to a server on the same database (ex. http://127.0.0.1:8000) "
+                 f"instead of the in-process client: {', '.join(HTTP_ENDPOINTS)} only, no queries count",
+        )
+        parser.add_argument("--output", help="Save results to this JSON file")
+        parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed of picked objects (default: 1)")
+        parser.add_argument("--keep", action="store_true", help="Keep benchmark users, book & borrowings")
+
+    def handle(self, *args, **options):
+        self.base_url = options["base_url"]
+        available = HTTP_ENDPOINTS if self.base_url else ENDPOINTS
+        endpoints = options["endpoints"].split(",") if options["endpoints"] else available
+        if unknown := set(endpoints) - set(available):
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        self.rng = random.Random(options["seed"])
+        self.requests = options["requests"]
+        self.concurrency = options["concurrency"]
+
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                baseline = json.load(file)["results"]
+
+        with ExitStack() as stack:
+            stack.enter_context(patch("stripe.checkout.Session.create", LocalCheckoutSession))
+            stack.enter_context(patch("stripe.checkout.Session.retrieve", LocalCheckoutSession))
+            stack.enter_context(patch.object(TelegramSender, "send_message"))
+            stack.enter_context(patch.object(NotificationQueue, "push"))
+            toolbar_config = {**settings.DEBUG_TOOLBAR_CONFIG, "SHOW_TOOLBAR_CALLBACK": lambda request: False}
+            stack.enter_context(override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"], DEBUG_TOOLBAR_CONFIG=toolbar_config
+            ))
+            eager = celery_app.conf.task_always_eager
+            celery_app.conf.task_always_eager = True
+            stack.callback(setattr, celery_app.conf, "task_always_eager", eager)
+            # unexpected statuses are counted as errors, not logged per request
+            request_logger = logging.getLogger("django.request")
+            stack.callback(request_logger.setLevel, request_logger.level)
+            request_logger.setLevel(logging.ERROR)
+
+            self.prepare()
+            if not options["keep"]:
+                stack.callback(self.cleanup)
+
+            results = {}
+            self.stdout.write(
+                f"{'endpoint':>17} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                f"{'queries':>8} {'errors':>7}"
+            )
+            for endpoint in ENDPOINTS:
+                if endpoint in endpoints:
+                    results[endpoint] = self.run(getattr(self, f"requests_{endpoint}")())
+                    self.write_result(endpoint, results[endpoint], (baseline or {}).get(endpoint))
+
+        if options["output"]:
+            report = {
+                "started_at": timezone.now().isoformat(),
+                "database": connection.vendor,
+                "base_url": self.base_url,
+                "requests": self.requests,
+                "concurrency": self.concurrency,
+                "results": results,
+            }
+            with open(options["output"], "w") as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results saved to {options['output']}"))
+
+    def write_result(self, endpoint: str, result: dict, baseline: dict | None) -> None:
+        self.stdout.write(
+            f"{endpoint:>17} {result['throughput']:>8.1f} {result['p50']:>8.2f} {result['p95']:>8.2f} "
+            f"{result['p99']:>8.2f} {result['queries']:>8.1f} {result['errors']:>7}"
+        )
+        if baseline:
+            change = {
+                key: result[key] / baseline[key] - 1 if baseline[key] else 0
+                for key in ("throughput", "p50", "p95", "p99")
+            }
+            self.stdout.write(
+                f"{'':>17} {change['throughput']:>+8.0%} {change['p50']:>+8.0%} {change['p95']:>+8.0%} "
+                f"{change['p99']:>+8.0%} {result['queries'] - baseline['queries']:>+8.1f}"
+            )
+
+    def prepare(self) -> None:
+        """ Create one reader per borrowing to create (admission allows no pending payments)
+            & a book with enough copies for all of them """
+
+        User = get_user_model()
+        run = time.time_ns()
+        password = make_password(BENCH_PASSWORD)
+        self.bench_users = User.objects.bulk_create(
+            User(email=f"reader{number}-{run}@{BENCH_EMAIL_DOMAIN}", password=password)
+            for number in range(max(self.requests, self.concurrency))
+        )
+        self.bench_book = Book.objects.create(
+            title=f"API benchmark {run}",
+            author="bench_api",
+            cover=Book.CoverType.SOFT,
+            inventory=self.requests,
+            daily_fee=1,
+        )
+
+        readers = list(
+            User.objects.filter(is_staff=False, borrowings__isnull=False).distinct().order_by("id")[:1000]
+        )
+        self.readers = readers or self.bench_users
+        self.book_ids = list(Book.objects.values_list("id", flat=True)[:10_000])
+
+    def cleanup(self) -> None:
+        get_user_model().objects.filter(id__in=[user.id for user in self.bench_users]).delete()
+        self.bench_book.delete()
+
+    def requests_token_obtain(self) -> list[tuple]:
+        url = reverse("users:token_obtain_pair")
+        return [
+            ("post", url, {"email": self.bench_users[number % len(self.bench_users)].email,
+                           "password": BENCH_PASSWORD}, {}, 200)
+            for number in range(self.requests)
+        ]
+
+    def requests_book_list(self) -> list[tuple]:
+        return [("get", reverse("books:book-list"), {}, {}, 200)] * self.requests
+
+    def requests_book_retrieve(self) -> list[tuple]:
+        return [
+            ("get", reverse("books:book-detail", args=[self.rng.choice(self.book_ids)]), {}, {}, 200)
+            for _ in range(self.requests)
+        ]
+
+    def requests_borrowing_create(self) -> list[tuple]:
+        url = reverse("borrowings:borrowing-list")
+        data = {
+            "book": self.bench_book.id,
+            "expected_return_date": (timezone.now().date() + timedelta(days=7)).isoformat(),
+        }
+        return [("post", url, data, bearer(user), 302) for user in self.bench_users[:self.requests]]
+
+    def requests_borrowing_list(self) -> list[tuple]:
+        url = reverse("borrowings:borrowing-list")
+        return [("get", url, {}, bearer(self.rng.choice(self.readers)), 200) for _ in range(self.requests)]
+
+    def requests_borrowing_detail(self) -> list[tuple]:
+        borrowings = list(
+            Borrowing.objects.filter(user__in=self.readers).select_related("user").order_by("id")[:10_000]
+        )
+        if not borrowings:
+            raise CommandError("No borrowings to retrieve: seed the database or run borrowing_create too")
+        requests = []
+        for borrowing in self.rng.choices(borrowings, k=self.requests):
+            url = reverse("borrowings:borrowing-detail", args=[borrowing.id])
+            requests.append(("get", url, {}, bearer(borrowing.user), 200))
+        return requests
+
+    def requests_borrowing_return(self) -> list[tuple]:
+        borrowings = Borrowing.objects.filter(
+            user__in=self.bench_users, actual_return_date__isnull=True
+        ).select_related("user").order_by("id")
+        if not borrowings:
+            raise CommandError("No borrowings to return: run borrowing_create endpoint too")
+        requests = []
+        for borrowing in borrowings:
+            url = reverse("borrowings:borrowing-return-borrowing", args=[borrowing.id])
+            requests.append(("post", url, {}, bearer(borrowing.user), 200))
+        return requests
+
+    def requests_payment_list(self) -> list[tuple]:
+        url = reverse("payments:payment-list")
+        return [("get", url, {}, bearer(self.rng.choice(self.readers)), 200) for _ in range(self.requests)]
+
+    def run(self, requests: list[tuple]) -> dict:
+        """ Send requests from concurrent clients, each one in its thread & database connection
+            Return: throughput, latency percentiles (ms), average queries & errors count """
+
+        pending = iter(requests)
+        lock = threading.Lock()
+        latencies, queries, errors = [], [], []
+
+        def worker():
+            client = Client() if self.base_url is None else HttpClient(self.base_url)
+            try:
+                while True:
+                    with lock:
+                        request = next(pending, None)
+                    if request is None:
+                        break
+                    method, url, data, headers, expected_status = request
+
+                    with CaptureQueriesContext(connection) as context:
+                        started = time.perf_counter()
+                        response = getattr(client, method)(url, data, **headers)
+                        latency = (time.perf_counter() - started) * 1000
+
+                    with lock:
+                        latencies.append(latency)
+                        queries.append(len(context.captured_queries))
+                        if response.status_code != expected_status:
+                            errors.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.concurrency)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        return {
+            "requests": len(latencies),
+            "seconds": round(seconds, 3),
+            "throughput": round(len(latencies) / seconds, 1),
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "queries": round(statistics.mean(queries), 1) if queries else 0,
+            "errors": len(errors),
+        }
@@ -0,0 +1,129 @@
+import random
+import statistics
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Q
+
+from books.models import Book
+from books.services import search_books
+
+WORDS = (
+    "night river stone garden winter shadow empire silent golden secret "
+    "ocean crown forest letter station glass storm mirror harbor orchard "
+    "python django history tales journey memory island city fire machine"
+).split()
+NAMES = (
+    "Anna Boris Clara David Elena Frank Greta Hugo Irene Jonas "
+    "Karin Leon Marta Nikolai Olga Pavel Rosa Stefan Tara Victor"
+).split()
+SURNAMES = (
+    "Adams Brooks Carver Dalton Ellis Fischer Grant Holm Ivanova Jensen "
+    "Kowalski Lindqvist Moreau Novak Olsen Petrov Quinn Rossi Schulz Tolkien"
+).split()
+QUERIES = ("tolk", "river stone", "gard", "anna silent", "emp cro", "machine his", "zzz")
+
+
+class Command(BaseCommand):
+    """Django command to fill a synthetic catalog and time indexed search against a LIKE scan"""
+
+    help = "Benchmark book catalog search on a large synthetic catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--books",
+            type=int,
+            default=1_000_000,
+            help="Synthetic books to create (default: 1000000)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Runs of every query (default: 20)",
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the synthetic books after the benchmark",
+        )
+
+    def handle(self, *args, **options):
+        first_id = (Book.objects.aggregate(last_id=Max("id"))["last_id"] or 0) + 1
+
+        started = time.perf_counter()
+        self.fill(options["books"])
+        seconds = time.perf_counter() - started
+        created = Book.objects.filter(id__gte=first_id).count()
+        self.stdout.write(
+            f"Created {created} books in {seconds:.1f} s "
+            f"({created / seconds:.0f} books/s, search index included)"
+        )
+
+        # a ?search= list request costs one page plus COUNT(*) for the pagination
+        self.stdout.write(
+            f"{'query':>14} {'hits':>8} {'index p50 ms':>13} {'index p95 ms':>13} {'LIKE p50 ms':>12}"
+        )
+        for query in QUERIES:
+            hits = search_books(Book.objects.all(), query).count()
+            indexed = self.timings(
+                lambda: self.list_page(search_books(Book.objects.all(), query)), options["repeat"]
+            )
+            scanned = self.timings(
+                lambda: self.list_page(self.like_scan(query)), max(options["repeat"] // 10, 1)
+            )
+            self.stdout.write(
+                f"{query:>14} {hits:>8} {self.percentile(indexed, 50):>13.2f} "
+                f"{self.percentile(indexed, 95):>13.2f} {self.percentile(scanned, 50):>12.2f}"
+            )
+
+        if not options["keep"]:
+            Book.objects.filter(id__gte=first_id).delete()
+
+    def fill(self, count: int, batch_size: int = 10_000) -> None:
+        rng = random.Random(1)
+        for start in range(0, count, batch_size):
+            with transaction.atomic():
+                Book.objects.bulk_create(
+                    [
+                        Book(
+                            title=" ".join(rng.choices(WORDS, k=rng.randint(2, 5))).capitalize(),
+                            author=f"{rng.choice(NAMES)} {rng.choice(SURNAMES)}",
+                            cover=rng.choice(Book.CoverType.values),
+                            inventory=rng.randint(0, 20),
+                            daily_fee=rng.randint(1, 300) / 100,
+                        )
+                        for _ in range(min(batch_size, count - start))
+                    ],
+                    batch_size=1000,
+                    # repeated title, author & cover (the natural key) are skipped
+                    ignore_conflicts=True,
+                )
+
+    @staticmethod
+    def list_page(queryset, size: int = 20) -> None:
+        queryset.count()
+        list(queryset[:size])
+
+    @staticmethod
+    def like_scan(query: str):
+        condition = Q()
+        for word in query.split():
+            condition &= Q(title__icontains=word) | Q(author__icontains=word)
+        return Book.objects.filter(condition).order_by("id")
+
+    @staticmethod
+    def timings(run, repeat: int) -> list[float]:
+        result = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            result.append((time.perf_counter() - started) * 1000)
+        return result
+
+    @staticmethod
+    def percentile(values: list[float], percent: int) -> float:
+        if len(values) < 2:
+            return values[0]
+        return statistics.quantiles(values, n=100)[percent - 1]
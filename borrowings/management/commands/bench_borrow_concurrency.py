@@ -0,0 +1,97 @@
+import threading
+import time
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.utils import OperationalError
+
+from books.models import Book
+from borrowings.services import reserve_book
+
+
+class Command(BaseCommand):
+    """Django command to hammer one book from many threads and check the borrow path never oversells"""
+
+    help = "Benchmark concurrent inventory reservation of a single book"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            default="1,2,4,8,16",
+            help="Comma separated thread counts to run (default: 1,2,4,8,16)",
+        )
+        parser.add_argument(
+            "--inventory",
+            type=int,
+            default=500,
+            help="Copies of the benchmark book available for each run (default: 500)",
+        )
+
+    def handle(self, *args, **options):
+        thread_counts = [int(value) for value in options["threads"].split(",")]
+        inventory = options["inventory"]
+
+        self.stdout.write(
+            f"{'threads':>8} {'reserved':>9} {'left':>6} {'errors':>7} {'seconds':>8} {'ops/s':>9}"
+        )
+        failed = False
+        for threads in thread_counts:
+            result = self.run(threads, inventory)
+            self.stdout.write(
+                f"{threads:>8} {result['reserved']:>9} {result['left']:>6} {result['errors']:>7} "
+                f"{result['seconds']:>8.3f} {result['reserved'] / result['seconds']:>9.1f}"
+            )
+            if result["reserved"] > inventory or result["reserved"] + result["left"] != inventory:
+                failed = True
+                self.stdout.write(self.style.ERROR(f"Oversell detected with {threads} threads"))
+
+        if not failed:
+            self.stdout.write(self.style.SUCCESS("No oversell: every reserved copy was accounted for"))
+
+    def run(self, threads: int, inventory: int) -> dict:
+        book = Book.objects.create(
+            title="Concurrency benchmark",
+            author="bench_borrow_concurrency",
+            cover=Book.CoverType.SOFT,
+            inventory=inventory,
+            daily_fee=1,
+        )
+        reserved = [0] * threads
+        errors = [0] * threads
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(index):
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        with transaction.atomic():
+                            if not reserve_book(book.id):
+                                break
+                    except OperationalError:
+                        errors[index] += 1
+                        continue
+                    reserved[index] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(index, )) for index in range(threads)]
+        for thread in workers:
+            thread.start()
+
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        book.refresh_from_db()
+        left = book.inventory
+        book.delete()
+
+        return {
+            "reserved": sum(reserved),
+            "left": left,
+            "errors": sum(errors),
+            "seconds": seconds,
+        }
@@ -0,0 +1,89 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from books.models import Book
+from books.serializers import BookSerializer
+from books.views import BookViewSet
+from borrowings.models import Borrowing
+from borrowings.serializers import BorrowingSerializer
+from borrowings.views import BorrowingsViewSet
+from payments.models import Payment
+from payments.serializers import PaymentSerializer
+from payments.views import PaymentsViewSet
+
+
+class Command(BaseCommand):
+    """Django command to time list serialization by serializers against the values() read path"""
+
+    help = "Benchmark list serialization: rows/s of serializers & of values() rows (run seed_library first)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=10_000,
+            help="Rows of a serialized page (default: 10000)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Runs of every path, the best one is reported (default: 3)",
+        )
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        lists = {
+            "books": (
+                Book.objects.order_by("id"), BookSerializer, BookViewSet()
+            ),
+            "borrowings": (
+                Borrowing.objects.select_related("book", "user").prefetch_related(
+                    Prefetch("payments", queryset=Payment.objects.order_by("id"))
+                ).order_by("id"),
+                BorrowingSerializer,
+                BorrowingsViewSet(),
+            ),
+            "payments": (
+                Payment.objects.order_by("id"), PaymentSerializer, PaymentsViewSet()
+            ),
+        }
+
+        self.stdout.write(
+            f"{'list':>10} {'rows':>7} {'serializer rows/s':>18} {'values rows/s':>14} {'speedup':>8}"
+        )
+        for name, (queryset, serializer_class, view) in lists.items():
+            page = queryset[:rows]
+
+            def serialized():
+                return JSONRenderer().render(serializer_class(page, many=True).data)
+
+            def projected():
+                representation = view.values_representation
+                data = representation.represent(page.prefetch_related(None).values(*representation.lookups))
+                view.list_values(data)
+                return JSONRenderer().render(data)
+
+            expected, serializer_seconds = self.best(serialized, options["repeat"])
+            content, values_seconds = self.best(projected, options["repeat"])
+            if content != expected:
+                raise CommandError(f"{name}: values() representation differs from the serializer one")
+
+            count = min(rows, queryset.count())
+            self.stdout.write(
+                f"{name:>10} {count:>7} {count / serializer_seconds:>18.0f} {count / values_seconds:>14.0f} "
+                f"{serializer_seconds / values_seconds:>7.1f}x"
+            )
+
+    @staticmethod
+    def best(run, repeat: int) -> tuple[bytes, float]:
+        """ Return: output of run & its best time in seconds """
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            content = run()
+            timings.append(time.perf_counter() - started)
+        return content, min(timings)
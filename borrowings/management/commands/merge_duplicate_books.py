@@ -0,0 +1,71 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from books.models import Book
+from books.services import invalidate_catalog, invalidate_inventory
+from borrowings.models import Borrowing
+
+
+class Command(BaseCommand):
+    """Django command to merge books sharing the natural key (title, author & cover),
+    required before the books_book_natural_key constraint is added"""
+
+    help = "Merge duplicate books into the first one: inventory is added up, borrowings are moved to it"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report duplicates & what would be merged",
+        )
+        parser.add_argument(
+            "--keep-first-fee",
+            action="store_true",
+            help="Merge duplicates with different daily fees too, keeping the fee of the first book "
+                 "(default: such duplicates are skipped)",
+        )
+
+    def handle(self, *args, **options):
+        duplicates = Book.objects.values(*Book.NATURAL_KEY).annotate(
+            count=Count("id")
+        ).filter(count__gt=1).order_by(*Book.NATURAL_KEY)
+
+        merged = skipped = 0
+        for duplicate in duplicates:
+            with transaction.atomic():
+                books = list(
+                    Book.objects.select_for_update().filter(
+                        **{field: duplicate[field] for field in Book.NATURAL_KEY}
+                    ).order_by("id")
+                )
+                first, others = books[0], books[1:]
+                ids = ", ".join(str(book.id) for book in others)
+
+                fees = sorted({book.daily_fee for book in books})
+                if len(fees) > 1 and not options["keep_first_fee"]:
+                    self.stdout.write(self.style.WARNING(
+                        f"Book {first.id} ({first.title}): duplicates {ids} differ in daily fee "
+                        f"({', '.join(str(fee) for fee in fees)}), skipped"
+                    ))
+                    skipped += 1
+                    continue
+
+                inventory = sum(book.inventory for book in books)
+                borrowings = Borrowing.objects.filter(book__in=others)
+                self.stdout.write(
+                    f"Book {first.id} ({first.title}): merged {ids}, inventory {inventory}, "
+                    f"{borrowings.count()} borrowing(s) moved, daily fee {first.daily_fee}"
+                )
+                merged += 1
+                if options["dry_run"]:
+                    continue
+
+                borrowings.update(book_id=first.id)
+                Book.objects.filter(id=first.id).update(inventory=inventory)
+                Book.objects.filter(id__in=[book.id for book in others]).delete()
+                invalidate_catalog()
+                invalidate_inventory(first.id)
+
+        action = "found" if options["dry_run"] else "merged"
+        self.stdout.write(self.style.SUCCESS(f"Duplicate books {action}: {merged}, skipped: {skipped}"))
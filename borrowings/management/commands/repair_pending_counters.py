@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from payments.models import Payment
+
+
+class Command(BaseCommand):
+    """Django command to recompute users pending payments counters from payments"""
+
+    help = "Recompute & repair denormalized pending payments counters of users"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report users with wrong counters",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Users updated per query (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+
+        with transaction.atomic():
+            totals = {
+                total["borrowing__user_id"]: (total["count"], total["amount"])
+                for total in Payment.objects.filter(
+                    status=Payment.StatusType.PENDING
+                ).values("borrowing__user_id").annotate(
+                    count=Count("id"), amount=Sum("money_to_pay")
+                ).order_by()
+            }
+
+            wrong = []
+            users = User.objects.select_for_update().only("id", "pending_payments", "pending_amount")
+            for user in users.iterator(chunk_size=options["batch_size"]):
+                count, amount = totals.get(user.id, (0, Decimal(0)))
+                if (user.pending_payments, user.pending_amount) != (count, amount):
+                    self.stdout.write(
+                        f"User {user.id}: {user.pending_payments} / {user.pending_amount} "
+                        f"-> {count} / {amount}"
+                    )
+                    user.pending_payments, user.pending_amount = count, amount
+                    wrong.append(user)
+
+            if not options["dry_run"]:
+                User.objects.bulk_update(
+                    wrong, ["pending_payments", "pending_amount"], batch_size=options["batch_size"]
+                )
+
+        action = "found" if options["dry_run"] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"Pending counters {action}: {len(wrong)} user(s)"))
@@ -0,0 +1,287 @@
+import itertools
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from books.models import Book
+from books.services import upsert_books
+from borrowings.models import Borrowing
+from payments.models import CheckoutSession, Payment
+
+TITLE_WORDS = (
+    "night river stone garden winter shadow empire silent golden secret ocean crown "
+    "forest letter station glass storm mirror harbor orchard history tales journey "
+    "memory island city fire machine north summer house bridge song road"
+).split()
+FIRST_NAMES = (
+    "Anna Boris Clara David Elena Frank Greta Hugo Irene Jonas Karin Leon "
+    "Marta Nikolai Olga Pavel Rosa Stefan Tara Victor Wanda Yuri Zoe Adam"
+).split()
+LAST_NAMES = (
+    "Adams Brooks Carver Dalton Ellis Fischer Grant Holm Ivanova Jensen Kowalski "
+    "Lindqvist Moreau Novak Olsen Petrov Quinn Rossi Schulz Tolkien Umarov Vance"
+).split()
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """ Parse "paid=0.85,pending=0.1,expired=0.05" into weights by payment status """
+
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in Payment.StatusType.values:
+            raise CommandError(f"Unknown payment status in mix: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def power_law_weights(size: int, exponent: float) -> list[float]:
+    """ Cumulative Zipf weights: item of rank k is chosen proportionally to 1 / k ** exponent """
+
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+@contextmanager
+def keep_auto_now_add(model, field_name: str):
+    """ Let bulk_create store historical dates into an auto_now_add field """
+
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    """Django command to generate a large deterministic library dataset with bulk inserts"""
+
+    help = "Seed books, users, borrowings & payments for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=100_000, help="Books to create (default: 100000)")
+        parser.add_argument("--users", type=int, default=10_000, help="Users to create (default: 10000)")
+        parser.add_argument(
+            "--borrowings", type=int, default=1_000_000, help="Borrowings to create (default: 1000000)"
+        )
+        parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+        parser.add_argument(
+            "--days", type=int, default=365, help="Borrow dates spread over last days (default: 365)"
+        )
+        parser.add_argument(
+            "--active-ratio",
+            type=float,
+            default=0.1,
+            help="Share of borrowings not returned yet (default: 0.1)",
+        )
+        parser.add_argument(
+            "--overdue-ratio",
+            type=float,
+            default=0.05,
+            help="Share of borrowings kept or returned after the expected date (default: 0.05)",
+        )
+        parser.add_argument(
+            "--payment-mix",
+            default="paid=0.85,pending=0.1,expired=0.05",
+            help="Payment status weights (default: paid=0.85,pending=0.1,expired=0.05)",
+        )
+        parser.add_argument(
+            "--popularity",
+            type=float,
+            default=1.1,
+            help="Power law exponent of book popularity (default: 1.1)",
+        )
+        parser.add_argument("--password", default="testpass", help="Password of every seeded user")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per INSERT (default: 5000)")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.today = timezone.now().date()
+        self.options = options
+        self.payment_mix = parse_mix(options["payment_mix"])
+
+        email_domain = f"seed{options['seed']}.library.test"
+        if get_user_model().objects.filter(email__endswith=f"@{email_domain}").exists():
+            raise CommandError(f"Users of seed {options['seed']} already exist, use another --seed")
+
+        started = time.perf_counter()
+        books = self.seed_books(options["books"])
+        self.report("books", len(books), started)
+
+        started = time.perf_counter()
+        users = self.seed_users(options["users"], email_domain)
+        self.report("users", len(users), started)
+
+        started = time.perf_counter()
+        borrowings, payments = self.seed_borrowings(options["borrowings"], books, users)
+        self.report("borrowings", borrowings, started)
+        self.stdout.write(f"  with {payments} payments")
+
+    def report(self, name: str, count: int, started: float) -> None:
+        seconds = time.perf_counter() - started
+        self.stdout.write(f"Created {count} {name} in {seconds:.1f} s ({count / max(seconds, 1e-6):.0f}/s)")
+
+    def batches(self, count: int):
+        for start in range(0, count, self.batch_size):
+            yield min(self.batch_size, count - start)
+
+    def new_book(self, volumes: Counter) -> Book:
+        rng = self.rng
+        book = Book(
+            title=" ".join(rng.choices(TITLE_WORDS, k=rng.randint(1, 4))).capitalize(),
+            author=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            cover=rng.choice(Book.CoverType.values),
+            inventory=rng.randint(1, 30),
+            daily_fee=Decimal(rng.randint(10, 300)) / 100,
+        )
+        # title, author & cover are the natural key of a book
+        key = (book.title, book.author, book.cover)
+        volumes[key] += 1
+        if volumes[key] > 1:
+            book.title = f"{book.title} vol. {volumes[key]}"
+        return book
+
+    def seed_books(self, count: int) -> list[tuple[int, Decimal]]:
+        """ Books of another seed with the same natural key are updated, not duplicated
+            Return: (id, daily_fee) of seeded books, most popular first """
+
+        volumes = Counter()
+        books = []
+        for size in self.batches(count):
+            with transaction.atomic():
+                created = upsert_books([self.new_book(volumes) for _ in range(size)])
+            books += [(book.id, book.daily_fee) for book in created]
+        return books
+
+    def seed_users(self, count: int, email_domain: str) -> list:
+        # hashing is slow by design, one hash is shared by all seeded users
+        password = make_password(self.options["password"])
+        User = get_user_model()
+
+        users = []
+        for start, size in zip(itertools.count(0, self.batch_size), self.batches(count)):
+            with transaction.atomic():
+                users += User.objects.bulk_create(
+                    User(
+                        email=f"reader{number}@{email_domain}",
+                        password=password,
+                        first_name=self.rng.choice(FIRST_NAMES),
+                        last_name=self.rng.choice(LAST_NAMES),
+                    )
+                    for number in range(start, start + size)
+                )
+        return users
+
+    def new_borrowing(self, book_id: int, user_id: int) -> Borrowing:
+        rng = self.rng
+        duration = rng.randint(1, 30)
+        active = rng.random() < self.options["active_ratio"]
+        overdue = rng.random() < self.options["overdue_ratio"]
+
+        if active and not overdue:
+            borrow_date = self.today - timedelta(days=rng.randint(0, duration - 1))
+        else:
+            oldest = max(self.options["days"], duration + 1)
+            borrow_date = self.today - timedelta(days=rng.randint(duration + 1, oldest))
+        expected_return_date = borrow_date + timedelta(days=duration)
+
+        actual_return_date = None
+        if not active:
+            if overdue:
+                actual_return_date = expected_return_date + timedelta(days=rng.randint(1, 14))
+            else:
+                actual_return_date = borrow_date + timedelta(days=rng.randint(0, duration))
+            actual_return_date = min(actual_return_date, self.today)
+
+        return Borrowing(
+            book_id=book_id,
+            user_id=user_id,
+            borrow_date=borrow_date,
+            expected_return_date=expected_return_date,
+            actual_return_date=actual_return_date,
+        )
+
+    def new_payment(self, borrowing: Borrowing, payment_type: str, money_to_pay: Decimal, number: int):
+        status = self.rng.choices(list(self.payment_mix), weights=list(self.payment_mix.values()))[0]
+        session_id = f"cs_seed{self.options['seed']}_{number}"
+        session_url = f"https://checkout.stripe.com/c/pay/{session_id}"
+        if status == Payment.StatusType.PENDING:
+            expires_at = timezone.now() + timedelta(hours=self.rng.randint(1, 24))
+        else:
+            # a day after the borrowing, checkout sessions live for 24 hours
+            expires_at = timezone.now() - timedelta(days=(self.today - borrowing.borrow_date).days - 1)
+
+        return Payment(
+            borrowing=borrowing,
+            type=payment_type,
+            status=status,
+            money_to_pay=money_to_pay.quantize(Decimal("0.01")),
+            checkout_session=CheckoutSession(session_id=session_id, url=session_url, expires_at=expires_at),
+            session_url=session_url,
+            expires_at=expires_at,
+        )
+
+    def borrowing_payments(self, borrowing: Borrowing, daily_fee: Decimal, number: int) -> list[Payment]:
+        """ Payment for the borrowing period & fine, if the book was returned late """
+
+        days = (borrowing.expected_return_date - borrowing.borrow_date).days + 1
+        payments = [self.new_payment(borrowing, Payment.Type.PAYMENT, daily_fee * days, number)]
+
+        if borrowing.actual_return_date:
+            overdue_days = (borrowing.actual_return_date - borrowing.expected_return_date).days
+            if overdue_days > 0:
+                fine = daily_fee * overdue_days * Decimal(Payment.FINE_MULTIPLIER)
+                payments.append(self.new_payment(borrowing, Payment.Type.FINE, fine, number + 1))
+        return payments
+
+    def seed_borrowings(self, count: int, books: list, users: list) -> tuple[int, int]:
+        rng = self.rng
+        book_weights = power_law_weights(len(books), self.options["popularity"])
+        user_weights = power_law_weights(len(users), 0.5)
+        pending = {}
+        payments_count = 0
+
+        with keep_auto_now_add(Borrowing, "borrow_date"):
+            for size in self.batches(count):
+                picked_books = rng.choices(books, cum_weights=book_weights, k=size)
+                picked_users = rng.choices(users, cum_weights=user_weights, k=size)
+
+                with transaction.atomic():
+                    borrowings = Borrowing.objects.bulk_create(
+                        self.new_borrowing(book_id, user.id)
+                        for (book_id, _), user in zip(picked_books, picked_users)
+                    )
+
+                    payments = []
+                    for borrowing, (_, daily_fee) in zip(borrowings, picked_books):
+                        number = payments_count + len(payments)
+                        payments += self.borrowing_payments(borrowing, daily_fee, number)
+                    # primary keys are set on the sessions, the payments are bound to them on insert
+                    CheckoutSession.objects.bulk_create(payment.checkout_session for payment in payments)
+                    Payment.objects.bulk_create(payments)
+                    payments_count += len(payments)
+
+                for payment in payments:
+                    if payment.status == Payment.StatusType.PENDING:
+                        user_id = payment.borrowing.user_id
+                        pending_payments, pending_amount = pending.get(user_id, (0, Decimal(0)))
+                        pending[user_id] = (pending_payments + 1, pending_amount + payment.money_to_pay)
+
+        # bulk_create skips Payment.save, so pending counters are set here
+        for user in users:
+            user.pending_payments, user.pending_amount = pending.get(user.id, (0, Decimal(0)))
+        get_user_model().objects.bulk_update(
+            users, ["pending_payments", "pending_amount"], batch_size=self.batch_size
+        )
+
+        return count, payments_count
@@ -1,11 +1,12 @@
 from django.contrib.auth import get_user_model
 from django.db import models
-from django.db.models import CheckConstraint, Q, F
+from django.db.models import CheckConstraint, Q, F, Index
 
 from books.models import Book
+from library_service.models import TimestampedModel
 
 
-class Borrowing(models.Model):
+class Borrowing(TimestampedModel):
     borrow_date = models.DateField(auto_now_add=True)
     expected_return_date = models.DateField()
     actual_return_date = models.DateField(null=True, blank=True)
@@ -23,6 +24,22 @@ class Borrowing(models.Model):
                 name="check_expected_date",
             ),
         ]
+        indexes = [
+            # keyset pages of a reader's borrowings: WHERE user_id = ? AND id > ? ORDER BY id
+            Index(fields=["user", "id"], name="borrowings_user_id_idx"),
+            # ?is_active= borrowings of a reader: WHERE user_id = ? AND actual_return_date IS NULL
+            Index(
+                fields=["user", "id"],
+                condition=Q(actual_return_date__isnull=True),
+                name="borrowings_user_active_idx",
+            ),
+            # check_overdue: WHERE actual_return_date IS NULL AND expected_return_date <= ?
+            Index(
+                fields=["expected_return_date", "id"],
+                condition=Q(actual_return_date__isnull=True),
+                name="borrowings_overdue_idx",
+            ),
+        ]
 
     @property
     def is_active(self) -> bool:
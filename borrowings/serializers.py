@@ -1,14 +1,20 @@
+from collections import Counter
 from datetime import datetime
+from functools import cached_property
 
+from django.conf import settings
 from rest_framework import serializers, pagination
 from rest_framework.utils.serializer_helpers import ReturnList
 
+from books.models import Book
+from books.serializers import BookSerializer
 from borrowings.models import Borrowing
+from library_service.fieldsets import FieldsetSerializerMixin
 from payments.models import Payment
 from payments.serializers import PaymentSerializer
 
 
-class BorrowingSerializer(serializers.ModelSerializer):
+class BorrowingSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     user = serializers.SlugRelatedField(slug_field="email", read_only=True)
     book = serializers.StringRelatedField()
     payments = PaymentSerializer(many=True, read_only=True)
@@ -26,9 +32,10 @@ class BorrowingSerializer(serializers.ModelSerializer):
             "payments",
         )
         read_only_fields = ("is_active", )
+        expandable = {"book": BookSerializer}
 
 
-class BorrowingDetailSerializer(serializers.ModelSerializer):
+class BorrowingDetailSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     user = serializers.SlugRelatedField(slug_field="email", read_only=True)
     book = serializers.StringRelatedField()
     payments = serializers.SerializerMethodField("borrowing_payments")
@@ -46,14 +53,23 @@ class BorrowingDetailSerializer(serializers.ModelSerializer):
             "payments",
         )
         read_only_fields = ("is_active", )
+        expandable = {"book": BookSerializer}
+
+    @cached_property
+    def payments_paginator(self) -> pagination.PageNumberPagination:
+        return pagination.PageNumberPagination()
 
     def borrowing_payments(self, obj) -> ReturnList:
-        ''' Pggination by related payments'''
-        payments = Payment.objects.filter(borrowing=obj).order_by("borrowing__borrow_date")
-        if self.context.get("request"):
-            paginator = pagination.PageNumberPagination()
-            page = paginator.paginate_queryset(payments, self.context["request"])
-            serializer = PaymentSerializer(page, many=True, context={"request": self.context["request"]})
+        ''' Related payments ordered by id, paginated with a request.
+            Prefetched payments are reused, otherwise read with one query by the borrowing_id index,
+            a borrowing has a few payments: the page & its count are taken from the same rows '''
+        payments = obj.payments.all()
+        if "payments" not in getattr(obj, "_prefetched_objects_cache", {}):
+            payments = list(payments.order_by("id"))
+
+        if request := self.context.get("request"):
+            page = self.payments_paginator.paginate_queryset(payments, request)
+            serializer = PaymentSerializer(page, many=True, context={"request": request})
         else:
             serializer = PaymentSerializer(payments, many=True)
         return serializer.data
@@ -79,6 +95,32 @@ class BorrowingCreateSerializer(serializers.ModelSerializer):
         return data
 
 
+class BorrowingBulkCreateSerializer(serializers.Serializer):
+    books = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=settings.BORROWING_BULK_MAX_BOOKS,
+    )
+    expected_return_date = serializers.DateField()
+
+    def validate_expected_return_date(self, data):
+        if data < datetime.today().date():
+            raise serializers.ValidationError("Expected return date must be at least today.")
+        return data
+
+    def validate_books(self, data):
+        """ Books read with one query, a repeated id borrows several copies
+            Return: Book objects in the requested order """
+        books = Book.objects.in_bulk(data)
+        if missing := sorted(set(data) - set(books)):
+            raise serializers.ValidationError(f"Invalid pk {missing} - object does not exist.")
+
+        copies = Counter(data)
+        if exhausted := [books[pk].title for pk, count in copies.items() if books[pk].inventory < count]:
+            raise serializers.ValidationError(f"Not enough copies to borrow: {exhausted}.")
+        return [books[pk] for pk in data]
+
+
 class BorrowingReturnSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -96,3 +138,21 @@ class BorrowingReturnSerializer(serializers.ModelSerializer):
         if not attrs.get("actual_return_date"):
             attrs["actual_return_date"] = datetime.now().date()
         return attrs
+
+
+class BorrowingBulkReturnSerializer(serializers.Serializer):
+    borrowings = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=settings.BORROWING_BULK_RETURN_MAX,
+    )
+    actual_return_date = serializers.DateField(required=False)
+
+    def validate_actual_return_date(self, value):
+        if value < datetime.now().date():
+            raise serializers.ValidationError("Actual return date must not be less than today.")
+        return value
+
+    def validate(self, attrs):
+        attrs.setdefault("actual_return_date", datetime.now().date())
+        return attrs
@@ -1,16 +1,167 @@
+from collections import Counter, defaultdict
+from datetime import date
+
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField
+from django.http import HttpRequest
+
+from books.models import Book
+from books.services import invalidate_inventory
 from borrowings.models import Borrowing
+from notifications.services import escape_markdown, notify
 from payments.models import Payment
+from payments.services import create_borrowing_fines, detail_payment_info
+from payments.tasks import schedule_payments_checkout_session
 from users.models import User
 
 
-def pending_count(reader: User):
-    count = Borrowing.objects.filter(user=reader).filter(payments__status=Payment.StatusType.PENDING).count()
-    return count
+def pending_count(reader: User) -> int:
+    """ Pending payments of the reader, read from the denormalized counter by primary key
+        Return: number of pending payments """
+
+    return User.objects.values_list("pending_payments", flat=True).get(pk=reader.pk)
+
+
+async def apending_count(reader: User) -> int:
+    """ Async pending_count
+        Return: number of pending payments """
+
+    return await User.objects.values_list("pending_payments", flat=True).aget(pk=reader.pk)
+
+
+def reserve_book(book_id: int) -> bool:
+    """ Take one copy of the book with a single conditional UPDATE.
+        Return: True if a copy was available, False if inventory is exhausted """
+
+    updated = Book.objects.filter(pk=book_id, inventory__gt=0).update(inventory=F("inventory") - 1)
+    if updated:
+        invalidate_inventory(book_id)
+    return updated == 1
+
+
+def _copies_of(copies: Counter) -> Case:
+    """ Return: copies count of the book row, for a single UPDATE of several books """
+    return Case(
+        *(When(pk=book_id, then=Value(count)) for book_id, count in copies.items()),
+        output_field=IntegerField(),
+    )
+
+
+def reserve_books(book_ids: list[int]) -> bool:
+    """ Take one copy per book id (a repeated id takes several copies) with a single conditional UPDATE.
+        All or nothing: on False the caller's transaction must be rolled back
+        Return: True if every book had enough copies """
+
+    copies = Counter(book_ids)
+    wanted = _copies_of(copies)
+    updated = Book.objects.filter(pk__in=copies, inventory__gte=wanted).update(
+        inventory=F("inventory") - wanted
+    )
+    if updated:
+        invalidate_inventory(*copies)
+    return updated == len(copies)
+
+
+def release_book(book_id: int) -> None:
+    """ Put one copy of the book back with a single atomic UPDATE """
+
+    Book.objects.filter(pk=book_id).update(inventory=F("inventory") + 1)
+    invalidate_inventory(book_id)
+
+
+def release_books(book_ids: list[int]) -> None:
+    """ Put one copy per book id back (a repeated id puts several copies) with a single UPDATE """
+
+    copies = Counter(book_ids)
+    Book.objects.filter(pk__in=copies).update(inventory=F("inventory") + _copies_of(copies))
+    invalidate_inventory(*copies)
+
+
+RETURN_ATTEMPTS = 3
+
+
+class ConcurrentReturn(Exception):
+    """Borrowings read for return were returned by a concurrent transaction before the UPDATE"""
+
+
+def _mark_returned(borrowing_ids: list[int], actual_return_date: date) -> int:
+    """ Conditional like the locking read: a borrowing is returned once
+        Return: count of borrowings returned """
+    return Borrowing.objects.filter(
+        pk__in=borrowing_ids, actual_return_date__isnull=True
+    ).update(actual_return_date=actual_return_date)
+
+
+def return_borrowings(
+        borrowing_ids: list[int], actual_return_date: date, request: HttpRequest
+) -> tuple[list[Borrowing], list[Payment]]:
+    """ Mark active borrowings returned with one UPDATE, put their copies back with one UPDATE
+        & create fines of the overdue ones with one INSERT, in one transaction.
+        Fine checkout sessions (one per reader) & notifications are queued once it commits
+        Return: returned borrowings (already returned or unknown ids are skipped) & created fines """
+
+    for _ in range(RETURN_ATTEMPTS - 1):
+        try:
+            return _return_borrowings(borrowing_ids, actual_return_date, request)
+        except ConcurrentReturn:
+            pass
+    return _return_borrowings(borrowing_ids, actual_return_date, request)
+
+
+def _return_borrowings(
+        borrowing_ids: list[int], actual_return_date: date, request: HttpRequest
+) -> tuple[list[Borrowing], list[Payment]]:
+    with transaction.atomic():
+        borrowings = list(
+            Borrowing.objects.select_for_update(of=("self", )).select_related("book", "user").filter(
+                pk__in=borrowing_ids, actual_return_date__isnull=True
+            ).order_by("id")
+        )
+        if not borrowings:
+            return [], []
+
+        if _mark_returned([borrowing.pk for borrowing in borrowings], actual_return_date) != len(borrowings):
+            # returned by another transaction after the read (select_for_update locks nothing on SQLite):
+            # rolled back & read again, so only the borrowings returned here are released & fined
+            raise ConcurrentReturn
+        for borrowing in borrowings:
+            borrowing.actual_return_date = actual_return_date
+        release_books([borrowing.book_id for borrowing in borrowings])
+
+        fines = create_borrowing_fines(borrowings)
+        readers_fines = defaultdict(list)
+        for fine in fines:
+            readers_fines[fine.borrowing.user_id].append(fine)
+        for reader_fines in readers_fines.values():
+            schedule_payments_checkout_session(reader_fines, request)
+
+        notify(
+            *(f"*Return* Borrowing id: {borrowing.id} \n"
+              f"Book: {escape_markdown(borrowing.book)} \n"
+              f"User: {escape_markdown(borrowing.user)} \n" for borrowing in borrowings),
+            *(detail_payment_info(fine) for fine in fines),
+        )
+
+    return borrowings, fines
+
+
+def bulk_borrowing_info(borrowings: list, payments: list) -> str:
+    lines = "\n".join(
+        f"Borrowing id: {borrowing.id} | Book: {escape_markdown(borrowing.book)} | "
+        f"Amount: {payment.money_to_pay}"
+        for borrowing, payment in zip(borrowings, payments)
+    )
+    return (f"*{len(borrowings)} borrowings have been created.* \n"
+            f"User: {escape_markdown(borrowings[0].user)}\n"
+            f"{lines}\n"
+            f"Date: {borrowings[0].borrow_date}\n"
+            f"Expected Return: {borrowings[0].expected_return_date}\n"
+            f"Total: {sum(payment.money_to_pay for payment in payments)}")
 
 
 def detail_borrowing_info(instance):
     return (f"Borrowing id: {instance.id}\n"
-            f"Book: {instance.book}\n"
-            f"User: {instance.user}\n"
+            f"Book: {escape_markdown(instance.book)}\n"
+            f"User: {escape_markdown(instance.user)}\n"
             f"Date: {instance.borrow_date}\n"
             f"Expected Return: {instance.expected_return_date}")
@@ -1,29 +1,78 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 
+from celery import group
 from celery.app import shared_task
+from django.conf import settings
+from django.db.models import Count, Min, Max
 
 from borrowings.models import Borrowing
-from borrowings.services import detail_borrowing_info
-from notifications.services import bot
+from notifications.services import escape_markdown, notify, TELEGRAM_MESSAGE_LIMIT
+
+
+def overdue_borrowings(due_date: date):
+    return Borrowing.objects.filter(
+        actual_return_date__isnull=True,
+        expected_return_date__lte=due_date,
+    )
+
+
+def overdue_line(borrowing: Borrowing) -> str:
+    return (f"{borrowing.id} | {escape_markdown(borrowing.book.title)} | {escape_markdown(borrowing.user)} | "
+            f"expected: {borrowing.expected_return_date}")
 
 
 @shared_task
 def check_overdue() -> int:
-    # filter(is_active=True)
-    borrowings = Borrowing.objects.filter(
-        actual_return_date__isnull=True
-    ).filter(
-        expected_return_date__lte=datetime.now().date() + timedelta(days=1)
-    ).order_by("borrow_date").select_related()
-
-    if borrowings_count := borrowings.count():
-        msg = f"*Overdue borrowings qty = {borrowings_count}*"
-        bot.send_message(msg)
-
-        for borrowing in borrowings:
-            bot.send_message(f"*Overdue* {detail_borrowing_info(borrowing)}")
-    else:
-        msg = "*No borrowings overdue today*"
-        bot.send_message(msg)
+    '''Count overdue borrowings & fan out their digest by id range shards'''
+
+    due_date = datetime.now().date() + timedelta(days=1)
+    stats = overdue_borrowings(due_date).aggregate(
+        count=Count("id"), first_id=Min("id"), last_id=Max("id")
+    )
+
+    if not (borrowings_count := stats["count"]):
+        notify("*No borrowings overdue today*")
+        return 0
+
+    notify(f"*Overdue borrowings qty = {borrowings_count}*")
+
+    shard_size = settings.OVERDUE_SHARD_SIZE
+    last_id = stats["last_id"]
+    group(
+        check_overdue_shard.s(due_date.isoformat(), first_id, min(first_id + shard_size - 1, last_id))
+        for first_id in range(stats["first_id"], last_id + 1, shard_size)
+    ).apply_async()
 
     return borrowings_count
+
+
+@shared_task
+def check_overdue_shard(due_date: str, first_id: int, last_id: int) -> int:
+    '''Stream overdue borrowings with ids in [first_id, last_id] into paginated digest messages'''
+
+    borrowings = overdue_borrowings(date.fromisoformat(due_date)).filter(
+        id__range=(first_id, last_id)
+    ).select_related("book", "user").order_by("id")
+
+    count = 0
+    page = 1
+    header = f"*Overdue borrowings* ids {first_id}-{last_id} | page {page}"
+    lines = []
+    size = len(header)
+
+    for borrowing in borrowings.iterator(chunk_size=settings.OVERDUE_CHUNK_SIZE):
+        line = overdue_line(borrowing)[:TELEGRAM_MESSAGE_LIMIT - len(header) - 1]
+        if lines and size + len(line) + 1 > TELEGRAM_MESSAGE_LIMIT:
+            notify("\n".join([header, *lines]))
+            page += 1
+            header = f"*Overdue borrowings* ids {first_id}-{last_id} | page {page}"
+            lines = []
+            size = len(header)
+        lines.append(line)
+        size += len(line) + 1
+        count += 1
+
+    if lines:
+        notify("\n".join([header, *lines]))
+
+    return count
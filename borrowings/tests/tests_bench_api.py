@@ -0,0 +1,31 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from books.models import Book
+from borrowings.management.commands.bench_api import ENDPOINTS
+
+
+class BenchApiCommandTests(TransactionTestCase):
+    def test_bench_api_report_all_endpoints(self):
+        call_command("seed_library", books=10, users=3, borrowings=20, stdout=StringIO())
+        output = os.path.join(tempfile.mkdtemp(), "bench.json")
+
+        call_command("bench_api", requests=3, concurrency=1, output=output, stdout=StringIO())
+
+        with open(output) as file:
+            results = json.load(file)["results"]
+        self.assertEqual(list(results), list(ENDPOINTS))
+        for endpoint, result in results.items():
+            self.assertEqual(result["requests"], 3, endpoint)
+            self.assertEqual(result["errors"], 0, endpoint)
+            self.assertGreater(result["queries"], 0, endpoint)
+            self.assertLessEqual(result["p50"], result["p99"], endpoint)
+
+        self.assertEqual(get_user_model().objects.count(), 3)
+        self.assertEqual(Book.objects.count(), 10)
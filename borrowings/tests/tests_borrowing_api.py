@@ -1,18 +1,25 @@
 from datetime import timedelta
-from unittest.mock import patch
+from decimal import Decimal
+from unittest.mock import patch, Mock
 
+from django.db import transaction
+from django.db.models import Prefetch
 from django.test import TestCase
 
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.exceptions import ErrorDetail
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
 
+from books.models import Book
 from borrowings.models import Borrowing
 from borrowings.serializers import BorrowingSerializer, BorrowingDetailSerializer
-from borrowings.services import pending_count
-from borrowings.tasks import check_overdue
+from borrowings import services as borrowing_services
+from borrowings.services import pending_count, reserve_book, reserve_books, release_book
+from borrowings.tasks import check_overdue, check_overdue_shard
+from library_service.celery import app as celery_app
 from tests.init_mock_classes import Session_Mock
 from tests.init_sample import (
     init_sample_user,
@@ -21,14 +28,18 @@ from tests.init_sample import (
     init_sample_borrowing,
     init_sample_payment
 )
-from notifications.services import TelegramSender
+from notifications.services import TelegramSender, NotificationQueue, TELEGRAM_MESSAGE_LIMIT
 from payments.models import Payment
+from payments.tasks import create_payments_checkout_session
 
 BORROWING_URL = reverse("borrowings:borrowing-list")
 BORROWING_DETAIL_URL = "borrowings:borrowing-detail"
 BORROWING_RETURN_URL = "borrowings:borrowing-return-borrowing"
 BORROWING_OVERDUE_URL = reverse("borrowings:borrowing-overdue")
 BORROWING_PENDING_URL = reverse("borrowings:borrowing-pending")
+BORROWING_EXPORT_URL = reverse("borrowings:borrowing-export")
+BORROWING_BULK_URL = reverse("borrowings:borrowing-bulk-create")
+BORROWING_BULK_RETURN_URL = reverse("borrowings:borrowing-bulk-return")
 
 
 def detail_url(url, instance_id):
@@ -177,6 +188,29 @@ class BorrowingAPITestCase(APITestCase):
 
         self.assertEqual(inventory_before - inventory_after, 1)
 
+    def test_reserve_book_never_oversells(self):
+        book = init_sample_book(title="Book2", inventory=1)
+
+        self.assertTrue(reserve_book(book.id))
+        self.assertFalse(reserve_book(book.id))
+
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 0)
+
+        release_book(book.id)
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 1)
+
+    @patch("borrowings.views.reserve_book", return_value=False)
+    def test_create_borrowing_inventory_exhausted_on_reserve_error(self, mock_method):
+        borrowings_before = Borrowing.objects.count()
+
+        response = self.client.post(BORROWING_URL, self.payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIsInstance(response.data["book"][0], ErrorDetail)
+
+        self.assertEqual(Borrowing.objects.count(), borrowings_before)
+
     def test_borrowing_book_inventory_increment(self):
         inventory_before = self.book1.inventory
 
@@ -228,6 +262,23 @@ class BorrowingAPITestCase(APITestCase):
         serializer = BorrowingDetailSerializer(self.borrowing1)
         self.assertEqual(response.data["actual_return_date"], serializer.data["actual_return_date"])
 
+    def test_borrowing_book_return_concurrent_returned_once(self):
+        # the view validated a stale row: a concurrent return has been committed meanwhile
+        stale = Borrowing.objects.get(pk=self.borrowing1.pk)
+        Borrowing.objects.filter(pk=self.borrowing1.pk).update(
+            actual_return_date=timezone.now().date() + timedelta(days=2)
+        )
+        inventory_before = Book.objects.get(pk=self.book1.pk).inventory
+
+        payload = {"actual_return_date": timezone.now().date() + timedelta(days=2), }
+        with patch("borrowings.views.BorrowingsViewSet.get_object", return_value=stale):
+            response = self.client.post(detail_url(BORROWING_RETURN_URL, self.borrowing1.pk), payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIsInstance(response.data["actual_return_date"][0], ErrorDetail)
+
+        self.assertEqual(Book.objects.get(pk=self.book1.pk).inventory, inventory_before)
+        self.assertFalse(Payment.objects.filter(borrowing=self.borrowing1, type=Payment.Type.FINE).exists())
+
 
 class AdminUserBorrowingAPITestCase(APITestCase):
     def setUp(self):
@@ -297,34 +348,49 @@ class BorrowingTasksTestCase(APITestCase):
         response = self.client.get(BORROWING_OVERDUE_URL)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
-    @patch.object(TelegramSender, "send_message")
+    @patch("borrowings.tasks.check_overdue.delay")
     def test_check_overdue_api_admin(self, mock_method):
         self.client.force_authenticate(self.user1)
-
-        expected_borrowings_count = Borrowing.objects.filter(
-            actual_return_date__isnull=True).filter(
-            expected_return_date__lte=timezone.now().date() + timedelta(days=1)).order_by(
-            "borrow_date").count()
+        mock_method.return_value = Mock(id="task-1")
 
         response = self.client.get(BORROWING_OVERDUE_URL)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        self.assertEqual(response.data, {"task_id": "task-1"})
+        mock_method.assert_called_once()
+
+    @patch("borrowings.tasks.check_overdue.AsyncResult")
+    def test_check_overdue_api_admin_job_result(self, mock_method):
+        self.client.force_authenticate(self.user1)
+        mock_method.return_value = Mock(status="SUCCESS", result=2, successful=Mock(return_value=True))
+
+        response = self.client.get(BORROWING_OVERDUE_URL + "?task_id=task-1")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        self.assertEqual(list(response.data.values()), [expected_borrowings_count, ])
-        mock_method.assert_called()
+        self.assertEqual(response.data, {"task_id": "task-1", "status": "SUCCESS", "Overdue": 2})
+        mock_method.assert_called_once_with("task-1")
 
-    @patch.object(TelegramSender, "send_message")
+    @patch.object(NotificationQueue, "push")
     def test_check_overdue_task_gt_0(self, mock_method):
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+
         expected_borrowings_count = Borrowing.objects.filter(
             actual_return_date__isnull=True).filter(
             expected_return_date__lte=timezone.now().date() + timedelta(days=1)).order_by(
             "borrow_date").count()
-        borrowings_count = check_overdue()
+        with self.captureOnCommitCallbacks(execute=True):
+            borrowings_count = check_overdue()
         self.assertGreater(borrowings_count, 0)
         self.assertEqual(expected_borrowings_count, borrowings_count)
 
-        mock_method.assert_called()
+        # qty header + one digest page listing every overdue borrowing
+        self.assertEqual(mock_method.call_count, 2)
+        digest = mock_method.call_args_list[1].args[0]
+        self.assertIn(str(self.borrowing1.id), digest)
+        self.assertIn(str(self.borrowing3.id), digest)
 
-    @patch.object(TelegramSender, "send_message")
+    @patch.object(NotificationQueue, "push")
     def test_check_overdue_task_eq_0(self, mock_method):
         self.borrowing1.expected_return_date = timezone.now().date() + timedelta(days=3)
         self.borrowing1.save()
@@ -335,12 +401,31 @@ class BorrowingTasksTestCase(APITestCase):
             actual_return_date__isnull=True).filter(
             expected_return_date__lte=timezone.now().date() + timedelta(days=1)).order_by(
             "borrow_date").count()
-        borrowings_count = check_overdue()
+        with self.captureOnCommitCallbacks(execute=True):
+            borrowings_count = check_overdue()
         self.assertEqual(borrowings_count, 0)
         self.assertEqual(expected_borrowings_count, borrowings_count)
 
         mock_method.assert_called()
 
+    @patch.object(NotificationQueue, "push")
+    def test_check_overdue_shard_paginated_digest(self, mock_method):
+        Borrowing.objects.bulk_create(
+            Borrowing(book=self.book1, user=self.user2, expected_return_date=timezone.now().date())
+            for _ in range(100)
+        )
+        due_date = (timezone.now().date() + timedelta(days=1)).isoformat()
+        last_id = Borrowing.objects.order_by("-id").first().id
+
+        with self.captureOnCommitCallbacks(execute=True):
+            count = check_overdue_shard(due_date, self.borrowing3.id, last_id)
+        self.assertEqual(count, 101)
+
+        messages = [call.args[0] for call in mock_method.call_args_list if "page" in call.args[0]]
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(all(len(message) <= TELEGRAM_MESSAGE_LIMIT for message in messages))
+        self.assertEqual(sum(message.count("\n") for message in messages), count)
+
     def test_pending_count_api_user(self):
         self.client.force_authenticate(self.user1)
 
@@ -376,3 +461,346 @@ class BorrowingTasksTestCase(APITestCase):
         current_pending_count = pending_count(self.user2)
         self.assertEqual(expected_pending_count, 0)
         self.assertEqual(expected_pending_count, current_pending_count)
+
+
+class BorrowingConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        self.user = init_sample_user(1)
+        self.client.force_authenticate(self.user)
+        self.book = init_sample_book()
+        self.borrowing = init_sample_borrowing(self.book, self.user)
+        self.payment = init_sample_payment(self.borrowing)
+        self.past = timezone.now() - timedelta(days=1)
+
+    def test_updated_at_kept_on_every_write_path(self):
+        Payment.objects.update(updated_at=self.past)
+
+        self.payment.status = Payment.StatusType.PAID
+        self.payment.save(update_fields=["status"])
+        self.payment.refresh_from_db()
+        self.assertGreater(self.payment.updated_at, self.past)
+
+        Borrowing.objects.update(updated_at=self.past)
+        Borrowing.objects.bulk_update([self.borrowing], ["expected_return_date"])
+        self.borrowing.refresh_from_db()
+        self.assertGreater(self.borrowing.updated_at, self.past)
+
+        Book.objects.update(updated_at=self.past)
+        release_book(self.book.id)
+        self.book.refresh_from_db()
+        self.assertGreater(self.book.updated_at, self.past)
+
+    def test_borrowing_not_modified(self):
+        for url in (BORROWING_URL, detail_url(BORROWING_DETAIL_URL, self.borrowing.id)):
+            etag = self.client.get(url)["ETag"]
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(response.content, b"")
+
+    def test_borrowing_etag_changed_by_related_payment(self):
+        etag = self.client.get(BORROWING_URL)["ETag"]
+
+        self.payment.status = Payment.StatusType.PAID
+        self.payment.save(update_fields=["status"])
+
+        response = self.client.get(BORROWING_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def assertModified(self, change):
+        urls = (BORROWING_URL, detail_url(BORROWING_DETAIL_URL, self.borrowing.id))
+        etags = [self.client.get(url)["ETag"] for url in urls]
+
+        change()
+
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response["ETag"], etag)
+
+    def test_borrowing_etag_changed_by_deleted_payment(self):
+        # the latest updated_at of the payments left is the same
+        init_sample_payment(self.borrowing, type=Payment.Type.FINE)
+        self.assertModified(self.payment.delete)
+
+    def test_borrowing_etag_changed_by_user_email(self):
+        def change_email():
+            self.user.email = "changed@test.com"
+            self.user.save()
+
+        self.assertModified(change_email)
+
+    def test_borrowing_etag_depends_on_user(self):
+        etag = self.client.get(BORROWING_URL)["ETag"]
+
+        self.client.force_authenticate(init_sample_user(2))
+
+        response = self.client.get(BORROWING_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class BorrowingDetailPaymentsTestCase(APITestCase):
+    def setUp(self):
+        self.user = init_sample_user(1)
+        self.client.force_authenticate(self.user)
+        self.borrowing = init_sample_borrowing(init_sample_book(), self.user)
+        self.payments = [init_sample_payment(self.borrowing, money_to_pay=number) for number in range(1, 5)]
+
+    def test_borrowing_detail_payments_page_from_prefetch(self):
+        url = detail_url(BORROWING_DETAIL_URL, self.borrowing.id)
+
+        # borrowing with its book & user, prefetched payments
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {"page": 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([payment["id"] for payment in response.data["payments"]], [self.payments[3].id])
+
+    def test_borrowing_detail_payments_one_query(self):
+        request = APIRequestFactory().get("/", {"page": 1})
+        serializer = BorrowingDetailSerializer(self.borrowing, context={"request": Request(request)})
+
+        with self.assertNumQueries(1):
+            payments = serializer.data["payments"]
+
+        self.assertEqual([payment["id"] for payment in payments], [p.id for p in self.payments[:3]])
+
+    def test_borrowing_detail_payments_prefetched_without_request(self):
+        borrowing = Borrowing.objects.select_related("book", "user").prefetch_related(
+            Prefetch("payments", queryset=Payment.objects.order_by("id"))
+        ).get(pk=self.borrowing.pk)
+
+        with self.assertNumQueries(0):
+            payments = BorrowingDetailSerializer(borrowing).data["payments"]
+
+        self.assertEqual([payment["id"] for payment in payments], [payment.id for payment in self.payments])
+
+
+class BorrowingExportAPITestCase(APITestCase):
+    def setUp(self):
+        self.user = init_sample_user(1)
+        self.client.force_authenticate(self.user)
+        book = init_sample_book()
+        today = timezone.now().date()
+        self.overdue = init_sample_borrowing(book, self.user)
+        # borrow_date is auto_now_add, backdate it past the expected return date
+        Borrowing.objects.filter(pk=self.overdue.pk).update(
+            borrow_date=today - timedelta(days=10), expected_return_date=today - timedelta(days=1)
+        )
+        self.returned = init_sample_borrowing(book, self.user, actual_return_date=today)
+        self.active = init_sample_borrowing(book, self.user, expected_return_date=today + timedelta(days=3))
+        init_sample_borrowing(book, init_sample_user(2))
+
+    def export_ids(self, **params):
+        response = self.client.get(BORROWING_EXPORT_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        return [int(line.split(",")[0]) for line in lines[1:]]
+
+    def test_borrowing_export_by_status(self):
+        self.assertEqual(self.export_ids(), [self.overdue.id, self.returned.id, self.active.id])
+        self.assertEqual(self.export_ids(status="overdue"), [self.overdue.id])
+        self.assertEqual(self.export_ids(status="active"), [self.overdue.id, self.active.id])
+        self.assertEqual(self.export_ids(status="returned"), [self.returned.id])
+
+    def test_borrowing_export_by_date_range(self):
+        today = timezone.now().date()
+        self.assertEqual(self.export_ids(date_to=(today - timedelta(days=1)).isoformat()), [self.overdue.id])
+
+
+class BorrowingBulkCreateAPITestCase(APITestCase):
+    def setUp(self):
+        self.user = init_sample_user(1)
+        self.client.force_authenticate(self.user)
+        self.book1 = init_sample_book(title="Book1", inventory=2, daily_fee=1)
+        self.book2 = init_sample_book(title="Book2", inventory=1, daily_fee=2)
+        self.payload = {
+            "books": [self.book1.id, self.book2.id, self.book1.id],
+            "expected_return_date": timezone.now().date() + timedelta(days=1),
+        }
+
+    def assertInventory(self, *inventory):
+        self.assertEqual(
+            list(Book.objects.filter(pk__in=[self.book1.id, self.book2.id]).order_by("id")
+                 .values_list("inventory", flat=True)),
+            list(inventory),
+        )
+
+    @patch("payments.services.stripe.checkout.Session.create", return_value=Session_Mock())
+    @patch("borrowings.views.notify")
+    def test_bulk_borrowing_one_checkout_session(self, mock_notify, mock_session):
+        delay = "payments.tasks.create_payments_checkout_session.delay"
+        with patch(delay, create_payments_checkout_session), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(BORROWING_BULK_URL, self.payload, format="json")
+
+        payments = list(Payment.objects.filter(borrowing__user=self.user).order_by("id"))
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response.url, reverse("payments:payment-checkout", args=[payments[0].id]))
+        self.assertInventory(0, 0)
+        self.assertEqual(
+            [payment.borrowing.book_id for payment in payments], [self.book1.id, self.book2.id, self.book1.id]
+        )
+        self.assertEqual({payment.checkout_session.session_id for payment in payments}, {Session_Mock().id})
+
+        mock_session.assert_called_once()
+        self.assertEqual(len(mock_session.call_args.kwargs["line_items"]), 3)
+        self.assertEqual(
+            mock_session.call_args.kwargs["client_reference_id"], "-".join(str(p.id) for p in payments)
+        )
+        mock_notify.assert_called_once()
+
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.pending_payments, self.user.pending_amount), (3, 8))
+
+    def test_bulk_borrowing_not_enough_copies_error(self):
+        self.payload["books"].append(self.book2.id)
+
+        response = self.client.post(BORROWING_BULK_URL, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("books", response.data)
+        self.assertFalse(Borrowing.objects.exists())
+        self.assertInventory(2, 1)
+
+    @patch("borrowings.views.reserve_books", return_value=False)
+    def test_bulk_borrowing_inventory_exhausted_on_reserve_error(self, mock_method):
+        response = self.client.post(BORROWING_BULK_URL, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Borrowing.objects.exists())
+        self.assertFalse(Payment.objects.exists())
+
+    def test_bulk_borrowing_pending_payments_forbidden(self):
+        init_sample_payment(init_sample_borrowing(self.book1, self.user))
+
+        response = self.client.post(BORROWING_BULK_URL, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_reserve_books_all_or_nothing(self):
+        with transaction.atomic():
+            self.assertFalse(reserve_books([self.book1.id, self.book2.id, self.book2.id]))
+            transaction.set_rollback(True)
+        self.assertInventory(2, 1)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(reserve_books([self.book1.id, self.book2.id, self.book1.id]))
+        self.assertInventory(0, 0)
+
+
+@patch.object(NotificationQueue, "push")
+@patch("payments.tasks.create_payments_checkout_session.delay")
+class BorrowingBulkReturnTestCase(APITestCase):
+    def setUp(self):
+        self.admin = init_sample_admin_user(3)
+        self.user1 = init_sample_user(1)
+        self.user2 = init_sample_user(2)
+        self.book1 = init_sample_book(title="Book1", inventory=5)
+        self.book2 = init_sample_book(title="Book2", inventory=5)
+        today = timezone.now().date()
+
+        self.on_time = init_sample_borrowing(self.book1, self.user1)
+        self.overdue1 = init_sample_borrowing(
+            self.book1, self.user1, expected_return_date=today + timedelta(days=2)
+        )
+        self.overdue2 = init_sample_borrowing(self.book2, self.user2)
+        self.returned = init_sample_borrowing(self.book2, self.user2, actual_return_date=today)
+        # borrow_date is auto_now_add, backdate it past the expected return date
+        Borrowing.objects.filter(pk__in=[self.overdue1.pk, self.overdue2.pk]).update(
+            borrow_date=today - timedelta(days=10), expected_return_date=today - timedelta(days=2)
+        )
+        self.ids = [self.on_time.id, self.overdue1.id, self.overdue2.id, self.returned.id, 9999]
+
+    def assertInventory(self, *inventory):
+        self.assertEqual(
+            list(Book.objects.filter(pk__in=[self.book1.id, self.book2.id]).order_by("id")
+                 .values_list("inventory", flat=True)),
+            list(inventory),
+        )
+
+    def test_bulk_return(self, mock_delay, mock_push):
+        self.client.force_authenticate(self.admin)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(BORROWING_BULK_RETURN_URL, {"borrowings": self.ids}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["returned"], [self.on_time.id, self.overdue1.id, self.overdue2.id])
+        self.assertEqual(response.data["skipped"], [self.returned.id, 9999])
+        self.assertEqual(len(response.data["fines"]), 2)
+        self.assertFalse(Borrowing.objects.filter(actual_return_date__isnull=True).exists())
+        self.assertInventory(7, 6)
+
+        fines = Payment.objects.filter(type=Payment.Type.FINE).order_by("id")
+        self.assertEqual([fine.borrowing_id for fine in fines], [self.overdue1.id, self.overdue2.id])
+        self.assertEqual(fines[0].money_to_pay, Decimal("41.36"))
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.pending_payments, 1)
+
+        # one fine checkout session per reader, notifications queued with one push
+        fine_sessions = sorted(call.args[0] for call in mock_delay.call_args_list)
+        self.assertEqual(fine_sessions, [[fine.id] for fine in fines])
+        mock_push.assert_called_once()
+        self.assertEqual(len(mock_push.call_args.args), 5)
+
+    def test_bulk_return_concurrent_return_released_and_fined_once(self, mock_delay, mock_push):
+        self.client.force_authenticate(self.admin)
+        return_borrowings = borrowing_services._return_borrowings
+        mark_returned = borrowing_services._mark_returned
+        attempts = []
+
+        def concurrent_return():
+            Borrowing.objects.filter(pk=self.overdue2.pk).update(actual_return_date=timezone.now().date())
+
+        def attempt(*args):
+            attempts.append(args)
+            if len(attempts) > 1:
+                # committed by the other transaction, the rollback of the first attempt does not undo it
+                concurrent_return()
+            return return_borrowings(*args)
+
+        def returned_meanwhile(*args):
+            # the other transaction returns overdue2 after the first attempt read it, before its UPDATE
+            if len(attempts) == 1:
+                concurrent_return()
+            return mark_returned(*args)
+
+        with (patch("borrowings.services._return_borrowings", side_effect=attempt),
+              patch("borrowings.services._mark_returned", side_effect=returned_meanwhile)):
+            response = self.client.post(BORROWING_BULK_RETURN_URL, {"borrowings": self.ids}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(response.data["returned"], [self.on_time.id, self.overdue1.id])
+        self.assertInventory(7, 5)
+        self.assertEqual(
+            list(Payment.objects.filter(type=Payment.Type.FINE).values_list("borrowing_id", flat=True)),
+            [self.overdue1.id],
+        )
+
+    def test_bulk_return_non_admin_forbidden(self, mock_delay, mock_push):
+        self.client.force_authenticate(self.user1)
+
+        response = self.client.post(BORROWING_BULK_RETURN_URL, {"borrowings": self.ids}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(Borrowing.objects.get(pk=self.on_time.pk).is_active)
+
+    def test_bulk_return_admin_action(self, mock_delay, mock_push):
+        self.client.force_login(self.admin)
+
+        response = self.client.post(
+            reverse("admin:borrowings_borrowing_changelist"),
+            {"action": "mark_returned", "_selected_action": [self.on_time.id, self.overdue1.id]},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(
+            set(Borrowing.objects.filter(actual_return_date__isnull=True).values_list("id", flat=True)),
+            {self.overdue2.id},
+        )
+        self.assertInventory(7, 5)
+        self.assertEqual(Payment.objects.filter(type=Payment.Type.FINE).count(), 1)
@@ -0,0 +1,76 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command, CommandError
+from django.db.models import Count, Sum
+from django.test import TestCase
+
+from books.models import Book
+from borrowings.models import Borrowing
+from payments.models import CheckoutSession, Payment
+
+
+def seed_library(**options):
+    defaults = {"books": 50, "users": 20, "borrowings": 300, "batch_size": 70, "stdout": StringIO()}
+    defaults.update(options)
+    call_command("seed_library", **defaults)
+
+
+def dataset():
+    return (
+        list(Book.objects.order_by("id").values_list("title", "author", "inventory", "daily_fee")),
+        list(Borrowing.objects.order_by("id").values_list(
+            "book__title", "user__email", "borrow_date", "expected_return_date", "actual_return_date"
+        )),
+        list(Payment.objects.order_by("id").values_list("type", "status", "money_to_pay")),
+    )
+
+
+class SeedLibraryCommandTests(TestCase):
+    def test_seed_library_create_requested_objects(self):
+        seed_library()
+
+        self.assertEqual(Book.objects.count(), 50)
+        self.assertEqual(get_user_model().objects.count(), 20)
+        self.assertEqual(Borrowing.objects.count(), 300)
+        self.assertGreaterEqual(Payment.objects.count(), 300)
+        self.assertTrue(get_user_model().objects.first().check_password("testpass"))
+
+    def test_seed_library_deterministic(self):
+        seed_library(seed=7)
+        first = dataset()
+        get_user_model().objects.all().delete()
+        Book.objects.all().delete()
+        CheckoutSession.objects.all().delete()
+
+        seed_library(seed=7)
+        self.assertEqual(dataset(), first)
+
+    def test_seed_library_ratios(self):
+        seed_library(active_ratio=0, overdue_ratio=1, payment_mix="paid=1")
+
+        self.assertFalse(Borrowing.objects.filter(actual_return_date__isnull=True).exists())
+        self.assertEqual(Payment.objects.filter(type=Payment.Type.FINE).count(), 300)
+        self.assertFalse(Payment.objects.exclude(status=Payment.StatusType.PAID).exists())
+
+    def test_seed_library_popular_books_borrowed_more(self):
+        seed_library()
+
+        borrowed = Borrowing.objects.values("book_id").annotate(count=Count("id")).order_by("book_id")
+        self.assertGreater(borrowed[0]["count"], borrowed.last()["count"])
+
+    def test_seed_library_pending_counters(self):
+        seed_library(payment_mix="pending=1")
+
+        for user in get_user_model().objects.all():
+            pending = Payment.objects.filter(
+                borrowing__user=user, status=Payment.StatusType.PENDING
+            ).aggregate(count=Count("id"), amount=Sum("money_to_pay"))
+            self.assertEqual(user.pending_payments, pending["count"])
+            self.assertEqual(user.pending_amount, pending["amount"] or 0)
+
+    def test_seed_library_same_seed_twice_error(self):
+        seed_library(books=1, users=1, borrowings=1)
+
+        with self.assertRaises(CommandError):
+            seed_library(books=1, users=1, borrowings=1)
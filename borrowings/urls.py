@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework import routers
 
+from borrowings.async_views import borrowing_create
 from borrowings.views import BorrowingsViewSet
 
 app_name = "borrowings"
@@ -9,5 +10,7 @@ router = routers.DefaultRouter()
 router.register("", BorrowingsViewSet)
 
 urlpatterns = [
+    # async variants for an ASGI server, ahead of the router detail routes
+    path("async/", borrowing_create, name="borrowing-create-async"),
     path("", include(router.urls)),
 ]
@@ -1,24 +1,83 @@
 from django.db import transaction
+from django.db.models import Prefetch, Q
 from django.shortcuts import render, redirect
+from django.utils import timezone
 from drf_spectacular.types import OpenApiTypes
-from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter, inline_serializer
+from drf_spectacular.utils import (
+    extend_schema_view,
+    extend_schema,
+    OpenApiParameter,
+    OpenApiResponse,
+    inline_serializer,
+)
 from rest_framework import viewsets, status, mixins, serializers
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from books.models import Book
 from borrowings.models import Borrowing
 from borrowings.serializers import (
     BorrowingSerializer,
     BorrowingCreateSerializer,
+    BorrowingBulkCreateSerializer,
     BorrowingReturnSerializer,
+    BorrowingBulkReturnSerializer,
     BorrowingDetailSerializer
 )
-from borrowings.services import pending_count
+from borrowings.services import (
+    pending_count,
+    reserve_book,
+    reserve_books,
+    return_borrowings,
+    bulk_borrowing_info,
+)
 from borrowings.tasks import check_overdue
-from notifications.services import bot
-from payments.services import create_payment_stripe_checkout_session, create_fine_stripe_checkout_session
+from library_service.etags import ConditionalGetMixin
+from library_service.exports import ExportParamsSerializer, export_response
+from library_service.fieldsets import FIELDSET_PARAMETERS, FieldsetMixin
+from library_service.projections import ValuesRepresentation, ValuesListMixin
+from notifications.services import notify
+from payments.models import Payment
+from payments.serializers import PaymentSerializer
+from payments.services import create_borrowing_payment, create_borrowing_payments
+from payments.tasks import schedule_checkout_session, schedule_payments_checkout_session
+
+
+BORROWING_EXPORT_COLUMNS = {
+    "id": "id",
+    "book_id": "book_id",
+    "book": "book__title",
+    "user": "user__email",
+    "borrow_date": "borrow_date",
+    "expected_return_date": "expected_return_date",
+    "actual_return_date": "actual_return_date",
+    "updated_at": "updated_at",
+}
+BORROWING_EXPORT_STATUSES = ("active", "returned", "overdue")
+
+
+def borrowing_status_filter(status_name: str) -> Q:
+    if status_name == "returned":
+        return Q(actual_return_date__isnull=False)
+    if status_name == "overdue":
+        return Q(actual_return_date__isnull=True, expected_return_date__lt=timezone.now().date())
+    return Q(actual_return_date__isnull=True)
+
+
+BOOK_STR_LOOKUPS = tuple(f"book__{field}" for field in Book.STR_FIELDS)
+
+BORROWING_VALUES = ValuesRepresentation(
+    BorrowingSerializer,
+    computed={
+        "book": (BOOK_STR_LOOKUPS, lambda row: Book.describe(*(row[lookup] for lookup in BOOK_STR_LOOKUPS))),
+        "is_active": (("actual_return_date", ), lambda row: not row["actual_return_date"]),
+        # filled by BorrowingsViewSet.list_values, a query for the page
+        "payments": ((), lambda row: []),
+    },
+)
+PAYMENT_VALUES = ValuesRepresentation(PaymentSerializer)
 
 
 @extend_schema_view(
@@ -39,11 +98,18 @@ from payments.services import create_payment_stripe_checkout_session, create_fin
                             "(ex. ?is_active=value - for borrowings still not returned "
                             "or nothing - for all borrowings).",
             ),
+            *FIELDSET_PARAMETERS,
         ]
     ),
     create=extend_schema(
         summary="Add new borrowing",
     ),
+    bulk_create=extend_schema(
+        summary="Borrow several books at once",
+        description="All books are reserved or none. One payment per borrowing, "
+                    "all paid in one checkout session: redirects to the checkout of the first payment.",
+        responses={status.HTTP_302_FOUND: OpenApiResponse(description="Redirect to the payment checkout")},
+    ),
     retrieve=extend_schema(
         summary="Get borrowing object by id",
         parameters=[
@@ -53,18 +119,65 @@ from payments.services import create_payment_stripe_checkout_session, create_fin
                 description="Page related payments "
                             "(ex. ?page=value ) "
             ),
+            *FIELDSET_PARAMETERS,
         ]
 
     ),
+    export=extend_schema(
+        summary="Stream borrowings as CSV or NDJSON",
+        description="Filter by borrowing date range & status (also by ?user_id= for Admin users). "
+                    "Rows are streamed from a database cursor, export size is not limited.",
+        parameters=[
+            OpenApiParameter("output", type=OpenApiTypes.STR, enum=["csv", "ndjson"],
+                             description="Export format (default: csv)"),
+            OpenApiParameter("date_from", type=OpenApiTypes.DATE, description="Borrowed on or after"),
+            OpenApiParameter("date_to", type=OpenApiTypes.DATE, description="Borrowed on or before"),
+            OpenApiParameter("status", type=OpenApiTypes.STR, enum=list(BORROWING_EXPORT_STATUSES)),
+        ],
+        responses={status.HTTP_200_OK: OpenApiResponse(description="CSV with a header line or NDJSON")},
+    ),
     return_borrowing=extend_schema(
         summary="Return borrowing by id",
     ),
+    bulk_return=extend_schema(
+        summary="Return several borrowings at once ( only for Admin users )",
+        description="Active borrowings are returned in one transaction, already returned ids are skipped. "
+                    "Fine checkout sessions & notifications are created afterwards, in the background.",
+        responses={
+            status.HTTP_200_OK: inline_serializer(
+                name="BulkReturn",
+                fields={
+                    "returned": serializers.ListField(child=serializers.IntegerField()),
+                    "skipped": serializers.ListField(child=serializers.IntegerField()),
+                    "fines": serializers.ListField(child=serializers.IntegerField()),
+                }
+            ),
+        }
+    ),
     overdue=extend_schema(
         summary="Check overdue borrowings ( only for Admin users )",
+        description="Start the overdue borrowings digest job. "
+                    "With ?task_id=value - get the job status & overdue borrowings count.",
+        parameters=[
+            OpenApiParameter(
+                "task_id",
+                type=OpenApiTypes.STR,
+                required=False,
+                description="Job handle returned when the job was started",
+            ),
+        ],
         responses={
+            status.HTTP_202_ACCEPTED: inline_serializer(
+                name="OverdueJob",
+                fields={"task_id": serializers.CharField()}
+            ),
             status.HTTP_200_OK: inline_serializer(
                 name="Overdue",
-                fields={"Overdue": serializers.IntegerField(default=8)}
+                fields={
+                    "task_id": serializers.CharField(),
+                    "status": serializers.CharField(default="SUCCESS"),
+                    "Overdue": serializers.IntegerField(default=8),
+                }
             ),
         }
     ),
@@ -81,24 +194,36 @@ from payments.services import create_payment_stripe_checkout_session, create_fin
         },
     ),
 )
-class BorrowingsViewSet(mixins.CreateModelMixin,
+class BorrowingsViewSet(ConditionalGetMixin,
+                        FieldsetMixin,
+                        ValuesListMixin,
+                        mixins.CreateModelMixin,
                         mixins.RetrieveModelMixin,
                         mixins.ListModelMixin,
                         GenericViewSet):
     queryset = Borrowing.objects.all()
     permission_classes = (IsAuthenticated, )
+    values_representation = BORROWING_VALUES
 
     def get_serializer_class(self):
         if self.action in ("create", ):
             return BorrowingCreateSerializer
+        if self.action == "bulk_create":
+            return BorrowingBulkCreateSerializer
         if self.action in ("retrieve", ):
             return BorrowingDetailSerializer
         if self.action == "return_borrowing":
             return BorrowingReturnSerializer
+        if self.action == "bulk_return":
+            return BorrowingBulkReturnSerializer
         return BorrowingSerializer
 
     def get_queryset(self):
-        queryset = self.queryset.select_related("book", "user").prefetch_related("payments")
+        queryset = self.queryset.select_related("book", "user")
+        if self.requested("payments"):
+            queryset = queryset.prefetch_related(
+                Prefetch("payments", queryset=Payment.objects.order_by("id"))
+            )
 
         if not self.request.user.is_staff:
             queryset = queryset.filter(user_id=self.request.user.id)
@@ -113,6 +238,18 @@ class BorrowingsViewSet(mixins.CreateModelMixin,
 
         return queryset
 
+    def list_values(self, data: list[dict]) -> None:
+        if not self.requested("payments"):
+            return
+
+        payments = Payment.objects.filter(
+            borrowing_id__in=[item["id"] for item in data]
+        ).order_by("id").values(*PAYMENT_VALUES.lookups)
+
+        borrowings = {item["id"]: item for item in data}
+        for payment in PAYMENT_VALUES.represent(payments):
+            borrowings[payment["borrowing"]]["payments"].append(payment)
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -124,16 +261,49 @@ class BorrowingsViewSet(mixins.CreateModelMixin,
             )
 
         with transaction.atomic():
-            serializer.save()
+            if not reserve_book(serializer.validated_data["book"].id):
+                raise serializers.ValidationError({"book": ["The book cannot be borrowed: inventory=0."]})
+
+            borrowing = serializer.save()
+
+            payment = create_borrowing_payment(borrowing)
+            schedule_checkout_session(payment, self.request)
+
+        return redirect("payments:payment-checkout", pk=payment.id)
+
+    @action(
+        methods=["POST", ],
+        detail=False,
+        url_path="bulk",
+    )
+    def bulk_create(self, request):
+        """Endpoint for borrowing several books at once, paid in one checkout session"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        books = serializer.validated_data["books"]
+        expected_return_date = serializer.validated_data["expected_return_date"]
+
+        if (count := pending_count(request.user)) > 0:
+            return Response(
+                {"Borrowing" : "Is not allowed.", "Count of pending payments" : count},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        with transaction.atomic():
+            if not reserve_books([book.id for book in books]):
+                raise serializers.ValidationError({"books": ["The books cannot be borrowed: inventory=0."]})
 
-            borrowing = Borrowing.objects.get(pk=serializer["id"].value)
-            book = borrowing.book
-            book.inventory -= 1
-            book.save()
+            # bulk_create skips the per-borrowing & per-payment notifications, one message is sent instead
+            borrowings = Borrowing.objects.bulk_create(
+                Borrowing(book=book, user=request.user, expected_return_date=expected_return_date)
+                for book in books
+            )
+            payments = create_borrowing_payments(borrowings)
+            schedule_payments_checkout_session(payments, self.request)
 
-            payment = create_payment_stripe_checkout_session(borrowing, self.request)
+        notify(bulk_borrowing_info(borrowings, payments))
 
-        return redirect(payment.session_url)
+        return redirect("payments:payment-checkout", pk=payments[0].id)
 
     @action(
         methods=["POST", ],
@@ -146,23 +316,66 @@ class BorrowingsViewSet(mixins.CreateModelMixin,
         serializer = self.get_serializer(borrowing, data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        with transaction.atomic():
-            serializer.save()
+        # the check above is not locked: the conditional UPDATE decides, a concurrent return is skipped
+        returned, fines = return_borrowings(
+            [borrowing.id], serializer.validated_data["actual_return_date"], request
+        )
+        if not returned:
+            raise serializers.ValidationError({"actual_return_date": ["Borrowing already returned."]})
+
+        if fines:
+            return redirect("payments:payment-checkout", pk=fines[0].id)
+        else:
+            return Response(self.get_serializer(returned[0]).data, status=status.HTTP_200_OK)
+
+    @action(
+        methods=["POST", ],
+        detail=False,
+        url_path="return",
+        permission_classes=[IsAdminUser, ]
+    )
+    def bulk_return(self, request):
+        """Endpoint for returning several borrowings at once"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        borrowing_ids = serializer.validated_data["borrowings"]
 
-            book = borrowing.book
-            book.inventory += 1
-            book.save()
+        borrowings, fines = return_borrowings(
+            borrowing_ids, serializer.validated_data["actual_return_date"], request
+        )
 
-            payment_fine = create_fine_stripe_checkout_session(borrowing, self.request)
+        returned = [borrowing.id for borrowing in borrowings]
+        return Response(
+            {
+                "returned": returned,
+                "skipped": sorted(set(borrowing_ids) - set(returned)),
+                "fines": [fine.id for fine in fines],
+            },
+            status=status.HTTP_200_OK
+        )
 
-        bot.send_message(f"*Return* Borrowing id: {borrowing.id} \n"
-                         f"Book: {borrowing.book} \n"
-                         f"User: {borrowing.user} \n")
+    @action(
+        methods=["GET", ],
+        detail=False,
+        url_path="export",
+    )
+    def export(self, request):
+        """Endpoint for streaming export of borrowings"""
+        params = ExportParamsSerializer(data=request.query_params, statuses=BORROWING_EXPORT_STATUSES)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
 
-        if payment_fine:
-            return redirect(payment_fine.session_url)
-        else:
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        borrowings = self.get_queryset().prefetch_related(None)
+        if "date_from" in filters:
+            borrowings = borrowings.filter(borrow_date__gte=filters["date_from"])
+        if "date_to" in filters:
+            borrowings = borrowings.filter(borrow_date__lte=filters["date_to"])
+        if "status" in filters:
+            borrowings = borrowings.filter(borrowing_status_filter(filters["status"]))
+
+        return export_response(
+            borrowings.order_by("id"), BORROWING_EXPORT_COLUMNS, filters["output"], "borrowings"
+        )
 
     @action(
         methods=["GET", ],
@@ -171,9 +384,16 @@ class BorrowingsViewSet(mixins.CreateModelMixin,
         permission_classes=[IsAdminUser, ]
     )
     def overdue(self, request, pk=None):
-        """Endpoint for check overdue borrowings"""
-        result = {"Overdue": check_overdue()}
-        return Response(result, status=status.HTTP_200_OK)
+        """Endpoint for check overdue borrowings: runs as a background job"""
+        if task_id := request.query_params.get("task_id"):
+            job = check_overdue.AsyncResult(task_id)
+            result = {"task_id": task_id, "status": job.status}
+            if job.successful():
+                result["Overdue"] = job.result
+            return Response(result, status=status.HTTP_200_OK)
+
+        job = check_overdue.delay()
+        return Response({"task_id": job.id}, status=status.HTTP_202_ACCEPTED)
 
     @action(
         methods=["GET", ],
@@ -0,0 +1,64 @@
+"""
+gunicorn entry point of the production profile:
+    gunicorn -c gunicorn.conf.py
+
+Sync views wait on PostgreSQL, Redis & Stripe most of the time: gthread workers overlap these waits
+with threads, processes use the cores. Every thread keeps its own persistent database connection,
+so workers * threads connections are open per web container.
+
+With GUNICORN_ASGI=True the ASGI application runs in uvicorn workers: the async borrowing checkout & payment
+endpoints await Stripe on the event loop, sync views run in a thread of the worker. Run it with
+DB_CONN_MAX_AGE=0, connections of the sync_to_async threads are not reused between requests.
+"""
+import multiprocessing
+import os
+import shutil
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "library_service.settings_production")
+
+asgi = os.environ.get("GUNICORN_ASGI") == "True"
+
+wsgi_app = "library_service.asgi:application" if asgi else "library_service.wsgi:application"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+
+worker_class = "uvicorn.workers.UvicornWorker" if asgi else "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# requests longer than a Stripe checkout call with retries are stuck
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+# workers are recycled, spread in time, so slow memory growth of a process is bounded
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def on_starting(server):
+    """Startup self-check: deploy checks & database connection, an error stops the server.
+    Metrics files of a previous run are removed, as prometheus_client requires"""
+    if directory := os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+    import django
+    from django.core.management import call_command
+    from django.db import connections
+
+    django.setup()
+    try:
+        call_command("check", deploy=True, databases=["default"], fail_level="ERROR")
+    finally:
+        # forked workers must not share the connection of the master
+        connections.close_all()
+
+
+def child_exit(server, worker):
+    """Metrics of a dead worker are merged into the totals, its live gauges are dropped"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class LibraryServiceConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "library_service"
+
+    def ready(self):
+        import library_service.checks
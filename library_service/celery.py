@@ -1,7 +1,6 @@
 import os
 from celery import Celery
-
-from library_service import settings
+from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "library_service.settings")
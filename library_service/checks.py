@@ -0,0 +1,73 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+from django.db import connections
+from django.db.utils import OperationalError
+
+# Startup self-check of the production profile (see gunicorn.conf.py):
+#   python manage.py check --deploy --database default --fail-level ERROR
+
+
+@register(Tags.security, deploy=True)
+def check_debug_tooling(app_configs, **kwargs):
+    errors = []
+    if "debug_toolbar" in settings.INSTALLED_APPS or any(
+        middleware.startswith("debug_toolbar.") for middleware in settings.MIDDLEWARE
+    ):
+        errors.append(Error(
+            "django-debug-toolbar is installed.",
+            hint="Run with DJANGO_SETTINGS_MODULE=library_service.settings_production.",
+            id="library.E001",
+        ))
+    return errors
+
+
+@register(Tags.database, deploy=True)
+def check_persistent_connections(app_configs, **kwargs):
+    database = settings.DATABASES["default"]
+    if database["ENGINE"].endswith("sqlite3") or database.get("CONN_MAX_AGE", 0):
+        return []
+    return [Warning(
+        "CONN_MAX_AGE is 0: every request opens a new database connection.",
+        hint="Set DB_CONN_MAX_AGE (seconds) with the production settings profile.",
+        id="library.W001",
+    )]
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if not settings.CACHES["default"]["BACKEND"].endswith("LocMemCache"):
+        return []
+    return [Warning(
+        "The default cache is local to a process.",
+        hint="Catalog pages & authenticated users are invalidated in one worker only, "
+             "run with DEV=True to use the Redis cache.",
+        id="library.W002",
+    )]
+
+
+@register(deploy=True)
+def check_metrics_directory(app_configs, **kwargs):
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory is None:
+        return [Warning(
+            "PROMETHEUS_MULTIPROC_DIR is not set: /metrics reports the worker serving the scrape only.",
+            id="library.W003",
+        )]
+    if not os.path.isdir(directory) or not os.access(directory, os.W_OK):
+        return [Error(
+            f"PROMETHEUS_MULTIPROC_DIR {directory} is not a writable directory.", id="library.E002"
+        )]
+    return []
+
+
+@register(Tags.database)
+def check_database_connection(app_configs, databases=None, **kwargs):
+    errors = []
+    for alias in databases or ():
+        try:
+            connections[alias].ensure_connection()
+        except OperationalError as error:
+            errors.append(Error(f"Database {alias} is unavailable: {error}", id="library.E003"))
+    return errors
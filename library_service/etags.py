@@ -0,0 +1,53 @@
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ConditionalGetMixin:
+    """Strong ETags of list & retrieve responses, a request with a matching If-None-Match gets 304.
+    A view knowing the version of its rows without reading them (get_version, e.g. kept in cache) answers
+    before the rows are read. Otherwise the ETag is a digest of the page data, before it is rendered:
+    it costs the page only & changes with every rendered source (related rows, deletes)"""
+
+    def get_version(self, queryset) -> tuple | None:
+        """ Return: version of the queryset rows known without reading them or None """
+        return None
+
+    def get_etag(self, version) -> str:
+        """ Return: quoted ETag of the request url, user, media type & version """
+        request = self.request
+        key = "|".join(
+            [request.get_full_path(), str(request.user.pk), str(request.accepted_media_type)]
+            + [str(value) for value in version]
+        )
+        return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
+    def conditional_response(self, queryset, handler, request, *args, **kwargs):
+        version = self.get_version(queryset)
+        if version is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            etag = self.get_etag([json.dumps(response.data, cls=JSONEncoder)])
+            response = get_conditional_response(request, etag=etag, response=response)
+        else:
+            etag = self.get_etag(version)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = handler(request, *args, **kwargs)
+        response["ETag"] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(queryset, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        return self.conditional_response(queryset, super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,69 @@
+import csv
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import serializers
+
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class ExportParamsSerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=sorted(EXPORT_CONTENT_TYPES), default="csv")
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def __init__(self, *args, statuses=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["status"] = serializers.ChoiceField(choices=statuses, required=False)
+
+    def validate(self, data):
+        if "date_from" in data and "date_to" in data and data["date_from"] > data["date_to"]:
+            raise serializers.ValidationError({"date_to": "Must not be before date_from."})
+        return data
+
+
+class Echo:
+    """Write-only file: csv.writer returns each line instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
+def plain(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def export_rows(queryset, columns: dict[str, str], output: str):
+    """ Rows of the queryset projected with values_list, read by chunks from a database cursor:
+        no model instances, memory does not grow with the export size
+        Return: iterator of CSV (header first) or NDJSON lines """
+    rows = queryset.values_list(*columns.values()).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    names = list(columns)
+
+    if output == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(names)
+        for row in rows:
+            yield writer.writerow([plain(value) for value in row])
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(names, map(plain, row)))) + "\n"
+
+
+def export_response(queryset, columns: dict[str, str], output: str, name: str) -> StreamingHttpResponse:
+    """ Return: streamed attachment of the exported queryset """
+    response = StreamingHttpResponse(
+        export_rows(queryset, columns, output), content_type=EXPORT_CONTENT_TYPES[output]
+    )
+    response["Content-Disposition"] = f'attachment; filename="{name}.{output}"'
+    return response
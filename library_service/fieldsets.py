@@ -0,0 +1,126 @@
+from functools import cached_property
+
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import serializers
+
+from library_service.projections import expandable_fields
+
+FIELDSET_PARAMETERS = [
+    OpenApiParameter(
+        "fields",
+        type=OpenApiTypes.STR,
+        required=False,
+        description="Comma separated fields of the response, id is always included "
+                    "(ex. ?fields=id,borrow_date). Only their columns & relations are read.",
+    ),
+    OpenApiParameter(
+        "expand",
+        type=OpenApiTypes.STR,
+        required=False,
+        description="Comma separated relations rendered as nested objects (ex. ?expand=book)",
+    ),
+]
+
+
+def split_names(value: str) -> list[str]:
+    return list(dict.fromkeys(name for name in (part.strip() for part in value.split(",")) if name))
+
+
+class FieldsetParamsSerializer(serializers.Serializer):
+    fields = serializers.CharField(required=False, allow_blank=True)
+    expand = serializers.CharField(required=False, allow_blank=True)
+
+    def __init__(self, *args, serializer_class=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.readable = [name for name, field in serializer_class().fields.items() if not field.write_only]
+        self.expandable = expandable_fields(serializer_class)
+
+    def validate_fields(self, value) -> list[str]:
+        names = split_names(value)
+        if unknown := [name for name in names if name not in self.readable]:
+            raise serializers.ValidationError(f"Unknown fields {unknown}, available: {self.readable}.")
+        return names
+
+    def validate_expand(self, value) -> list[str]:
+        names = split_names(value)
+        if unknown := [name for name in names if name not in self.expandable]:
+            raise serializers.ValidationError(
+                f"Fields {unknown} can not be expanded, expandable: {list(self.expandable)}."
+            )
+        return names
+
+
+class FieldsetSerializerMixin:
+    """Serializer fields narrowed to the "fieldset" of the context: requested "fields" only
+    (id is always kept) & "expand" fields rendered by their Meta.expandable serializer"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fieldset = self.context.get("fieldset")
+        if fieldset is None:
+            return
+
+        for name in fieldset["expand"]:
+            self.fields[name] = expandable_fields(type(self))[name](read_only=True)
+        if fieldset["fields"] is not None:
+            keep = {"id", *fieldset["fields"], *fieldset["expand"]}
+            for name in [name for name in self.fields if name not in keep]:
+                self.fields.pop(name)
+
+
+class FieldsetMixin:
+    """?fields= & ?expand= of list & retrieve actions: the serializer renders the requested fields
+    & expands the requested relations, the queryset reads only their columns & joins,
+    taken from the lookups of values_representation"""
+
+    fieldset_actions = ("list", "retrieve")
+
+    @cached_property
+    def fieldset(self) -> dict | None:
+        """ Return: requested "fields" (None for all of them) & "expand" names,
+            None for actions without fieldsets """
+        if self.action not in self.fieldset_actions:
+            return None
+
+        params = FieldsetParamsSerializer(
+            data=self.request.query_params, serializer_class=self.get_serializer_class()
+        )
+        params.is_valid(raise_exception=True)
+        return {
+            "fields": params.validated_data.get("fields"),
+            "expand": params.validated_data.get("expand", []),
+        }
+
+    def requested(self, name: str) -> bool:
+        """ Return: True, if the response renders the field """
+        fieldset = self.fieldset
+        return (
+            fieldset is None
+            or fieldset["fields"] is None
+            or name in fieldset["fields"]
+            or name in fieldset["expand"]
+        )
+
+    def get_values_representation(self):
+        representation = super().get_values_representation()
+        if self.fieldset is None:
+            return representation
+        return representation.narrow(**self.fieldset)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.fieldset is not None:
+            context["fieldset"] = self.fieldset
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.fieldset is None:
+            return queryset
+
+        lookups = self.get_values_representation().lookups
+        queryset = queryset.select_related(None)
+        if relations := {lookup.rpartition("__")[0] for lookup in lookups if "__" in lookup}:
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*lookups)
@@ -0,0 +1,240 @@
+import os
+import time
+from contextlib import contextmanager
+
+import redis
+import stripe
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from celery.signals import before_task_publish, task_prerun, task_postrun
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Metrics are written to PROMETHEUS_MULTIPROC_DIR files when it is set (several gunicorn
+# workers / celery processes), so every process adds up to one /metrics scrape.
+
+REQUEST_LATENCY = Histogram(
+    "library_http_request_duration_seconds",
+    "HTTP request latency",
+    ["view", "action", "method", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "library_http_request_db_queries",
+    "Database queries per HTTP request",
+    ["view", "action"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, float("inf")),
+)
+REQUEST_DB_TIME = Histogram(
+    "library_http_request_db_duration_seconds",
+    "Database time per HTTP request",
+    ["view", "action"],
+)
+STRIPE_LATENCY = Histogram(
+    "library_stripe_request_duration_seconds",
+    "Stripe API call latency",
+    ["operation"],
+)
+STRIPE_ERRORS = Counter(
+    "library_stripe_errors_total",
+    "Stripe API call errors",
+    ["operation", "error"],
+)
+TELEGRAM_LATENCY = Histogram(
+    "library_telegram_send_duration_seconds",
+    "Telegram sendMessage latency",
+)
+TELEGRAM_FAILURES = Counter(
+    "library_telegram_send_failures_total",
+    "Telegram sendMessage failures",
+    ["reason"],
+)
+TASK_DURATION = Histogram(
+    "library_celery_task_duration_seconds",
+    "Celery task run time",
+    ["task", "state"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800, float("inf")),
+)
+TASKS_PUBLISHED = Counter(
+    "library_celery_tasks_published_total",
+    "Celery tasks sent to the broker",
+    ["task"],
+)
+
+
+def view_labels(request) -> tuple[str, str]:
+    """ Viewset (or view) name & action of a resolved request, bounded label values
+        Return: (view, action) """
+
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched", ""
+
+    view = match.func
+    method = request.method.lower()
+    view_class = getattr(view, "cls", None)
+    if view_class is None:
+        return match.view_name or view.__name__, method
+
+    actions = getattr(view, "actions", None) or {}
+    return view_class.__name__, actions.get(method, method)
+
+
+class QueryStats:
+    """Database execute wrapper counting queries & their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Observe latency & database usage of every request, labelled by viewset and action.
+    Async capable: under ASGI the sync views & the queries of async views of a request run
+    in one thread sensitive worker thread, queries are counted on its connection"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        queries = QueryStats()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+
+        view, action = view_labels(request)
+        REQUEST_LATENCY.labels(view, action, request.method, response.status_code).observe(seconds)
+        REQUEST_QUERIES.labels(view, action).observe(queries.count)
+        REQUEST_DB_TIME.labels(view, action).observe(queries.seconds)
+        return response
+
+    async def __acall__(self, request):
+        queries = QueryStats()
+        # connection is looked up in the worker thread, the event loop thread has a connection of its own
+        await sync_to_async(lambda: connection.execute_wrappers.append(queries))()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(lambda: connection.execute_wrappers.remove(queries))()
+        seconds = time.perf_counter() - started
+
+        view, action = view_labels(request)
+        REQUEST_LATENCY.labels(view, action, request.method, response.status_code).observe(seconds)
+        REQUEST_QUERIES.labels(view, action).observe(queries.count)
+        REQUEST_DB_TIME.labels(view, action).observe(queries.seconds)
+        return response
+
+
+@contextmanager
+def stripe_call(operation: str):
+    """ Observe latency & errors of a Stripe API call, errors are re-raised """
+
+    started = time.perf_counter()
+    try:
+        yield
+    except stripe.error.StripeError as error:
+        STRIPE_ERRORS.labels(operation, type(error).__name__).inc()
+        raise
+    finally:
+        STRIPE_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+
+@before_task_publish.connect
+def count_published_task(sender=None, **kwargs):
+    TASKS_PUBLISHED.labels(sender).inc()
+
+
+_task_started = {}
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def observe_task_duration(task_id=None, task=None, state=None, **kwargs):
+    if (started := _task_started.pop(task_id, None)) is not None:
+        TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
+
+class QueueDepthCollector:
+    """Messages waiting in Celery broker queues & the notifications buffer, read at scrape time"""
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.Redis.from_url(settings.CELERY_BROKER_URL, socket_timeout=1)
+        return self._client
+
+    @staticmethod
+    def queues() -> list[str]:
+        routed = {route["queue"] for route in settings.CELERY_TASK_ROUTES.values()}
+        return sorted({"celery", *routed})
+
+    def collect(self):
+        depth = GaugeMetricFamily(
+            "library_celery_queue_depth", "Messages waiting in a queue", labels=["queue"]
+        )
+        try:
+            for queue in self.queues():
+                depth.add_metric([queue], self.client.llen(queue))
+            # imported here: notifications.services itself reports Telegram metrics
+            from notifications.services import queue as notifications
+            depth.add_metric(["telegram_buffer"], len(notifications))
+        except redis.RedisError:
+            return
+        yield depth
+
+
+queue_depth = QueueDepthCollector()
+
+
+def metrics_registry() -> CollectorRegistry:
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(queue_depth)
+    return registry
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    return HttpResponse(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    REGISTRY.register(queue_depth)
@@ -0,0 +1,26 @@
+from django.db import models
+from django.utils import timezone
+
+
+class TimestampedQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # bulk_update() & F() updates skip Model.save, updated_at is set here for them
+        kwargs.setdefault("updated_at", timezone.now())
+        return super().update(**kwargs)
+
+
+class TimestampedModel(models.Model):
+    """Abstract model with updated_at kept on every write path: save, update_fields saves,
+    bulk_create, bulk_update & queryset updates"""
+
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = TimestampedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if kwargs.get("update_fields"):
+            kwargs["update_fields"] = {*kwargs["update_fields"], "updated_at"}
+        return super().save(*args, **kwargs)
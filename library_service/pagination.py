@@ -0,0 +1,164 @@
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+from rest_framework.pagination import (
+    BasePagination,
+    CursorPagination,
+    LimitOffsetPagination,
+    replace_query_param,
+)
+
+COUNT_EXACT = "exact"
+COUNT_APPROX = "approx"
+COUNT_SKIP = "false"
+
+
+def estimate_count(queryset) -> int:
+    """ Cheap count of queryset rows:
+        planner estimate for a whole table on PostgreSQL,
+        otherwise exact count capped at APPROX_COUNT_LIMIT
+        Return: number of rows """
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql" and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    return queryset.order_by()[:settings.APPROX_COUNT_LIMIT].count()
+
+
+class CountLimitOffsetPagination(LimitOffsetPagination):
+    """Limit & offset pagination, ?count=false skips COUNT(*), ?count=approx estimates it"""
+
+    count_query_param = "count"
+    max_limit = settings.MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = request.query_params.get(self.count_query_param, COUNT_EXACT)
+        if self.count_mode not in (COUNT_SKIP, COUNT_APPROX):
+            self.count_mode = COUNT_EXACT
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        self.count = estimate_count(queryset) if self.count_mode == COUNT_APPROX else None
+
+        # one extra row tells whether the next page exists without counting
+        page = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(page) > self.limit
+        return page[:self.limit]
+
+    def get_next_link(self):
+        if self.count_mode == COUNT_EXACT:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count"]["nullable"] = True
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Total count of results: exact (default), approx or false (skip)",
+                "schema": {"type": "string", "enum": [COUNT_EXACT, COUNT_APPROX, COUNT_SKIP]},
+            },
+        ]
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination on a unique indexed ordering, every page costs the same.
+    Ordering is taken from view.cursor_ordering, id by default. Results with an ordering
+    of their own (?search= relevance) are rejected, cursor ordering would drop it"""
+
+    ordering = ("id",)
+    page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+    page_size_query_param = "limit"
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(getattr(view, "cursor_ordering", self.ordering))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = self.get_ordering(request, queryset, view)
+        if queryset.query.order_by and tuple(queryset.query.order_by) != ordering:
+            raise serializers.ValidationError(
+                {"pagination": ["Cursor pagination is not available for ranked results, use offset."]}
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+
+class LibraryPagination(BasePagination):
+    """Limit & offset pagination by default (backwards compatible),
+    keyset pagination with ?pagination=cursor"""
+
+    mode_query_param = "pagination"
+    cursor_mode = "cursor"
+
+    def __init__(self):
+        self.offset_pagination = CountLimitOffsetPagination()
+        self.cursor_pagination = KeysetPagination()
+        self.pagination = self.offset_pagination
+
+    @property
+    def display_page_controls(self):
+        return self.pagination.display_page_controls
+
+    def is_cursor_mode(self, request) -> bool:
+        return (
+            request.query_params.get(self.mode_query_param) == self.cursor_mode
+            or self.cursor_pagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.pagination = (
+            self.cursor_pagination if self.is_cursor_mode(request) else self.offset_pagination
+        )
+        return self.pagination.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.pagination.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.offset_pagination.get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.pagination.to_html()
+
+    def get_results(self, data):
+        return data["results"]
+
+    def get_schema_operation_parameters(self, view):
+        cursor_parameters = [
+            parameter
+            for parameter in self.cursor_pagination.get_schema_operation_parameters(view)
+            if parameter["name"] == self.cursor_pagination.cursor_query_param
+        ]
+        return [
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Pagination mode: offset (default) or cursor",
+                "schema": {"type": "string", "enum": ["offset", self.cursor_mode]},
+            },
+            *self.offset_pagination.get_schema_operation_parameters(view),
+            *cursor_parameters,
+        ]
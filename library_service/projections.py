@@ -0,0 +1,200 @@
+import copy
+import decimal
+from datetime import datetime
+from functools import cached_property, partial
+from typing import Callable, Iterable
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+# to_representation of these fields returns the database value itself
+PLAIN_FIELDS = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+def iso_datetime(value: datetime) -> str:
+    value = value.isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+
+def value_converter(field: serializers.Field) -> Callable:
+    """ Converter equal to field.to_representation for database values of dates, datetimes & decimals,
+        with the field settings (output format, time zone, decimal context) resolved once, not per value
+        Return: converter of a non-empty value """
+
+    if isinstance(field, serializers.DateTimeField):
+        if getattr(field, "format", api_settings.DATETIME_FORMAT) != ISO_8601:
+            return field.to_representation
+        field_timezone = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+        if field_timezone is None:
+            return lambda value: (
+                iso_datetime(value) if value.tzinfo is None else field.to_representation(value)
+            )
+        return lambda value: (
+            iso_datetime(value.astimezone(field_timezone)) if value.tzinfo else field.to_representation(value)
+        )
+
+    if isinstance(field, serializers.DateField):
+        if getattr(field, "format", api_settings.DATE_FORMAT) != ISO_8601:
+            return field.to_representation
+        return lambda value: value.isoformat()
+
+    if isinstance(field, serializers.DecimalField):
+        coerce_to_string = getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+        if not coerce_to_string or field.localize or field.normalize_output or field.decimal_places is None:
+            return field.to_representation
+        exponent = decimal.Decimal(".1") ** field.decimal_places
+        context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            context.prec = field.max_digits
+        return lambda value: "{:f}".format(value.quantize(exponent, rounding=field.rounding, context=context))
+
+    return field.to_representation
+
+
+def expandable_fields(serializer_class) -> dict:
+    """ Return: serializer classes of the Meta.expandable fields, rendering related objects in full """
+    return getattr(getattr(serializer_class, "Meta", None), "expandable", {})
+
+
+def represent_row(columns: list, row: dict) -> dict:
+    item = {}
+    for name, lookup, convert in columns:
+        if lookup is None:
+            item[name] = convert(row)
+            continue
+        value = row[lookup]
+        item[name] = value if value is None or convert is None else convert(value)
+    return item
+
+
+class ValuesRepresentation:
+    """Representation of a serializer rebuilt from values() rows: the same keys in the same order
+    & the same field formatting, without a model instance & serializer fields walk per row.
+    Fields a row can not provide directly (string of a related object, nested lists, properties)
+    are computed by functions of the row, from extra lookups"""
+
+    def __init__(self, serializer_class, computed: dict[str, tuple[tuple[str, ...], Callable]] = None):
+        self.serializer_class = serializer_class
+        self.computed = computed or {}
+
+    @cached_property
+    def columns(self) -> list[tuple[str, str | None, Callable | serializers.Field | None]]:
+        """ Return: (output name, values() lookup, converter) per readable serializer field,
+            lookup is None for computed & expanded fields, the field itself stands for its value_converter
+            & converter is None for plain values """
+        columns = []
+        for name, field in self.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if name in self.computed:
+                columns.append((name, None, self.computed[name][1]))
+                continue
+
+            source = field.source.replace(".", "__")
+            if isinstance(field, serializers.SlugRelatedField):
+                columns.append((name, f"{source}__{field.slug_field}", None))
+            elif isinstance(field, PLAIN_FIELDS):
+                columns.append((name, source, None))
+            elif isinstance(field, (serializers.RelatedField, serializers.ManyRelatedField,
+                                    serializers.BaseSerializer, serializers.SerializerMethodField)):
+                raise ImproperlyConfigured(
+                    f"{self.serializer_class.__name__}.{name} can not be read from values(), compute it."
+                )
+            else:
+                columns.append((name, source, field))
+        return columns
+
+    @cached_property
+    def lookups(self) -> list[str]:
+        lookups = []
+        for name, lookup, convert in self.columns:
+            if lookup is not None:
+                lookups.append(lookup)
+            elif isinstance(convert, ValuesRepresentation):
+                lookups.extend(convert.lookups)
+            else:
+                lookups.extend(self.computed[name][0])
+        return list(dict.fromkeys(lookups))
+
+    @cached_property
+    def expanded(self) -> dict[str, "ValuesRepresentation"]:
+        """ Return: nested representation per Meta.expandable field, read from related lookups of a row """
+        return {
+            name: ValuesRepresentation(serializer_class).prefixed(f"{name}__")
+            for name, serializer_class in expandable_fields(self.serializer_class).items()
+        }
+
+    def prefixed(self, prefix: str) -> "ValuesRepresentation":
+        """ Return: representation read from lookups of a related model, e.g. "book__title" for "title" """
+        if self.computed:
+            raise ImproperlyConfigured(
+                f"{self.serializer_class.__name__} with computed fields can not be nested."
+            )
+        return self.with_columns([(name, prefix + lookup, convert) for name, lookup, convert in self.columns])
+
+    def with_columns(self, columns: list) -> "ValuesRepresentation":
+        representation = copy.copy(self)
+        representation.__dict__.pop("lookups", None)
+        representation.columns = columns
+        return representation
+
+    def narrow(self, fields: list[str] | None = None, expand: list[str] = ()) -> "ValuesRepresentation":
+        """ Return: representation of the requested fields only (id is always kept, None keeps all),
+            expanded fields are nested objects of their Meta.expandable serializer, read by the same row """
+        keep = None if fields is None else {"id", *fields, *expand}
+        return self.with_columns([
+            (name, None, self.expanded[name]) if name in expand else (name, lookup, convert)
+            for name, lookup, convert in self.columns
+            if keep is None or name in keep
+        ])
+
+    def resolve(self) -> list:
+        """ Return: columns with converters of the current request,
+            resolved per call as the current time zone may differ between requests """
+        columns = []
+        for name, lookup, convert in self.columns:
+            if isinstance(convert, serializers.Field):
+                convert = value_converter(convert)
+            elif isinstance(convert, ValuesRepresentation):
+                convert = partial(represent_row, convert.resolve())
+            columns.append((name, lookup, convert))
+        return columns
+
+    def represent(self, rows: Iterable[dict]) -> list[dict]:
+        """ Return: serializer representation of every values() row """
+        columns = self.resolve()
+        return [represent_row(columns, row) for row in rows]
+
+
+class ValuesListMixin:
+    """List action serialized from values() rows by values_representation instead of model instances,
+    the JSON is the same as the one of the serializer"""
+
+    values_representation: ValuesRepresentation = None
+
+    def get_values_representation(self) -> ValuesRepresentation:
+        return self.values_representation
+
+    def list_values(self, data: list[dict]) -> None:
+        """Complete represented rows of the page in place, e.g. with nested lists read by one query"""
+
+    def list(self, request, *args, **kwargs):
+        representation = self.get_values_representation()
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        rows = queryset.values(*representation.lookups)
+
+        page = self.paginate_queryset(rows)
+        data = representation.represent(rows if page is None else page)
+        self.list_values(data)
+
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
@@ -54,13 +54,16 @@ INSTALLED_APPS = [
     "debug_toolbar",
     "drf_spectacular",
     "django_celery_beat",
+    "library_service",
     "books",
     "users",
     "borrowings",
     "payments",
+    "notifications",
 ]
 
 MIDDLEWARE = [
+    "library_service.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -163,13 +166,17 @@ INTERNAL_IPS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
     ),
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
+    "DEFAULT_PAGINATION_CLASS": "library_service.pagination.LibraryPagination",
     "PAGE_SIZE": 3,
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
+# pagination: largest ?limit= accepted, row cap for ?count=approx outside PostgreSQL
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 100))
+APPROX_COUNT_LIMIT = int(os.environ.get("APPROX_COUNT_LIMIT", 10000))
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60 * 24 * 10),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=100),
@@ -177,9 +184,30 @@ SIMPLE_JWT = {
 
     "AUTH_HEADER_TYPES": ("Bearer",),
     "AUTH_HEADER_NAME": "HTTP_AUTHORIZE",
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.UserTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.UserTokenRefreshSerializer",
 }
 
+# Users of authenticated requests: in-process LRU (entries, seconds) in front of the shared cache (seconds).
+# A user save is seen by other processes within AUTH_USER_LOCAL_TTL
+AUTH_USER_LOCAL_SIZE = int(os.environ.get("AUTH_USER_LOCAL_SIZE", 1024))
+AUTH_USER_LOCAL_TTL = float(os.environ.get("AUTH_USER_LOCAL_TTL", 5))
+AUTH_USER_CACHE_TTL = int(os.environ.get("AUTH_USER_CACHE_TTL", 60))
+# Embed email & staff flags in issued tokens, so permission checks need no lookup.
+# Tradeoff: requests of an access token do not see the user row, a deactivated user, a changed password
+# or revoked staff flags take effect only when it expires. Access tokens live JWT_EMBEDDED_ACCESS_MINUTES
+# then, a refresh checks the user (active, password not changed) & embeds its current claims
+JWT_EMBED_USER_CLAIMS = os.environ.get("JWT_EMBED_USER_CLAIMS", "") == "True"
+JWT_EMBEDDED_ACCESS_MINUTES = int(os.environ.get("JWT_EMBEDDED_ACCESS_MINUTES", 5))
+if JWT_EMBED_USER_CLAIMS:
+    SIMPLE_JWT["ACCESS_TOKEN_LIFETIME"] = timedelta(minutes=JWT_EMBEDDED_ACCESS_MINUTES)
+
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+
+# Expired payments sweep: payments checked per run & concurrent Stripe requests
+EXPIRED_SWEEP_CHUNK_SIZE = int(os.getenv("EXPIRED_SWEEP_CHUNK_SIZE", 100))
+EXPIRED_SWEEP_WORKERS = int(os.getenv("EXPIRED_SWEEP_WORKERS", 8))
 
 DEBUG_TOOLBAR_CONFIG = {
     "IS_RUNNING_TESTS": False,
@@ -204,6 +232,50 @@ CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 DJANGO_CELERY_BEAT_TZ_AWARE = False
 
+# Overdue sweep: borrowing ids per shard task & rows fetched per database round trip
+OVERDUE_SHARD_SIZE = int(os.environ.get("OVERDUE_SHARD_SIZE", 5000))
+OVERDUE_CHUNK_SIZE = int(os.environ.get("OVERDUE_CHUNK_SIZE", 500))
+
+CELERY_TASK_ROUTES = {
+    "notifications.tasks.flush_notifications": {"queue": "notifications"},
+}
+
+# Cache: book catalog list pages & details, on the Redis used by Celery
+if LOCAL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("CACHE_REDIS_URL", CELERY_BROKER_URL),
+        }
+    }
+BOOK_CACHE_TTL = int(os.environ.get("BOOK_CACHE_TTL", 300))
+
+# Rows fetched per database round trip by streamed CSV / NDJSON exports
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 2000))
+
+# Rows validated & upserted per transaction by bulk book imports
+BOOK_IMPORT_BATCH_SIZE = int(os.environ.get("BOOK_IMPORT_BATCH_SIZE", 1000))
+
+# Books borrowed at once by POST /api/borrowings/bulk/, one checkout line item each (Stripe allows up to 100)
+BORROWING_BULK_MAX_BOOKS = int(os.environ.get("BORROWING_BULK_MAX_BOOKS", 20))
+# Borrowings checked in at once by staff with POST /api/borrowings/return/
+BORROWING_BULK_RETURN_MAX = int(os.environ.get("BORROWING_BULK_RETURN_MAX", 1000))
+
+# Telegram notifications queue, drained by a dedicated worker of the "notifications" queue
+NOTIFICATIONS_REDIS_URL = os.environ.get("NOTIFICATIONS_REDIS_URL", CELERY_BROKER_URL)
+# seconds to connect & per command, notify() runs in request threads
+NOTIFICATIONS_REDIS_TIMEOUT = float(os.environ.get("NOTIFICATIONS_REDIS_TIMEOUT", 1))
+NOTIFICATIONS_FLUSH_INTERVAL = float(os.environ.get("NOTIFICATIONS_FLUSH_INTERVAL", 5))
+NOTIFICATIONS_BATCH_SIZE = int(os.environ.get("NOTIFICATIONS_BATCH_SIZE", 50))
+TELEGRAM_RATE_PER_SECOND = float(os.environ.get("TELEGRAM_RATE_PER_SECOND", 1))
+TELEGRAM_BURST = int(os.environ.get("TELEGRAM_BURST", 3))
+
 
 CELERY_BEAT_SCHEDULE = {
     "check_overdue_borrowings": {
@@ -214,4 +286,8 @@ CELERY_BEAT_SCHEDULE = {
         "task": "payments.tasks.check_expired_session",
         "schedule": crontab(minute="*/1"),
     },
+    "flush_notifications": {
+        "task": "notifications.tasks.flush_notifications",
+        "schedule": NOTIFICATIONS_FLUSH_INTERVAL,
+    },
 }
@@ -0,0 +1,43 @@
+"""
+Production settings profile: library_service.settings without debug tooling,
+with persistent database connections, for the gunicorn entry point (gunicorn.conf.py).
+
+Select it with DJANGO_SETTINGS_MODULE=library_service.settings_production
+"""
+import os
+
+from library_service.settings import *  # noqa: F401, F403
+from library_service.settings import BASE_DIR, DATABASES, INSTALLED_APPS, MIDDLEWARE
+
+# SECURITY WARNING: a missing key fails the start instead of falling back to the development one
+SECRET_KEY = os.environ["DJANGO_SECRET_KEY"]
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.environ.get("DJANGO_ALLOWED_HOSTS", "").split(",") if host]
+
+# the toolbar instruments every request (SQL, templates, signals panels) even when it is not shown
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != "debug_toolbar"]
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if not middleware.startswith("debug_toolbar.")]
+
+# Persistent connections: a worker thread keeps its connection for DB_CONN_MAX_AGE seconds instead of
+# connecting per request, a connection broken meanwhile is detected before the request uses it.
+# Connections open at once: gunicorn workers * threads (+ celery processes), keep it below max_connections
+DATABASES = {
+    "default": {
+        **DATABASES["default"],
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+    }
+}
+
+# TLS is terminated by the reverse proxy in front of gunicorn
+SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
+SESSION_COOKIE_SECURE = os.environ.get("DJANGO_SECURE_COOKIES", "True") == "True"
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE
+CSRF_TRUSTED_ORIGINS = [
+    origin for origin in os.environ.get("DJANGO_CSRF_TRUSTED_ORIGINS", "").split(",") if origin
+]
+
+# collected by "manage.py collectstatic" & served by the reverse proxy
+STATIC_ROOT = os.environ.get("DJANGO_STATIC_ROOT", BASE_DIR / "static")
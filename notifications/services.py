@@ -1,8 +1,31 @@
+import logging
 import os
+import re
+import threading
+import time
+from functools import partial
 
+import redis
+import requests
 import telebot
+from django.conf import settings
+from django.db import transaction
 from telebot.apihelper import ApiException
 
+from library_service.metrics import TELEGRAM_FAILURES, TELEGRAM_LATENCY
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+MESSAGES_SEPARATOR = "\n\n"
+MARKDOWN_ENTITIES = re.compile(r"([_*`\[])")
+
+
+def escape_markdown(value) -> str:
+    """Escape Markdown entity characters of a value interpolated into a notification
+    (emails, book titles), so Telegram parses the message"""
+    return MARKDOWN_ENTITIES.sub(r"\\\1", str(value))
+
 
 class TelegramSender:
     def __init__(self):
@@ -12,12 +35,122 @@ class TelegramSender:
         self.tb = telebot.TeleBot(token=BOT_TOKEN, parse_mode="Markdown")
         self.chat_id = CHAT_ID
 
-    def send_message(self, message):
+    def send_message(self, message, parse_mode=None):
         try:
-            mess = self.tb.send_message(chat_id=self.chat_id, text=message)
+            with TELEGRAM_LATENCY.time():
+                mess = self.tb.send_message(chat_id=self.chat_id, text=message, parse_mode=parse_mode)
             return mess
         except ApiException as e:
+            TELEGRAM_FAILURES.labels(getattr(e, "error_code", None) or type(e).__name__).inc()
             return e
+        except requests.RequestException:
+            TELEGRAM_FAILURES.labels("connection").inc()
+            raise
+
+
+class NotificationQueue:
+    """Redis list buffering messages until the notifications worker drains them"""
+
+    key = "notifications:telegram"
+
+    def __init__(self, url: str, timeout: float = None):
+        self.url = url
+        self.timeout = timeout
+        self._client = None
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            # a hung Redis fails the push instead of blocking the request thread
+            self._client = redis.Redis.from_url(
+                self.url, socket_timeout=self.timeout, socket_connect_timeout=self.timeout
+            )
+        return self._client
+
+    def push(self, *messages: str) -> None:
+        self.client.rpush(self.key, *messages)
+
+    def pop_batch(self, size: int) -> list[str]:
+        """Atomically take up to size oldest messages"""
+        with self.client.pipeline() as pipe:
+            pipe.lrange(self.key, 0, size - 1)
+            pipe.ltrim(self.key, size, -1)
+            messages, _ = pipe.execute()
+        return [message.decode("utf-8") for message in messages]
+
+    def push_back(self, messages: list[str]) -> None:
+        """Return undelivered messages to the head of the queue, keeping their order"""
+        if messages:
+            self.client.lpush(self.key, *reversed(messages))
+
+    def __len__(self):
+        return self.client.llen(self.key)
+
+
+class TokenBucket:
+    """Rate limiter: up to capacity messages at once, refilled with rate tokens per second"""
+
+    def __init__(self, rate: float, capacity: int, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        """Take one token, waiting until it is available
+        Return: seconds waited"""
+        with self._lock:
+            self._refill()
+            wait = 0.0
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                self.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+            return wait
+
+
+def batch(messages: list[str], limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[list[str]]:
+    """Group messages into as few batches as possible, each batch joined fits Telegram message length limit"""
+    batches = []
+    size = 0
+    for message in messages:
+        message = message[:limit]
+        if batches and size + len(MESSAGES_SEPARATOR) + len(message) <= limit:
+            batches[-1].append(message)
+            size += len(MESSAGES_SEPARATOR) + len(message)
+        else:
+            batches.append([message])
+            size = len(message)
+    return batches
+
+
+def coalesce(messages: list[str], limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """Join messages into as few as possible, each one fitting Telegram message length limit"""
+    return [MESSAGES_SEPARATOR.join(messages) for messages in batch(messages, limit)]
+
+
+def _enqueue(*messages: str) -> None:
+    try:
+        queue.push(*messages)
+    except redis.RedisError:
+        logger.exception("Notification is not queued: %s", MESSAGES_SEPARATOR.join(messages))
+
+
+def notify(*messages: str) -> None:
+    """Queue messages for Telegram (with one push) once the current transaction commits.
+    Delivery is done by notifications.tasks.flush_notifications, off the request path"""
+    if messages:
+        transaction.on_commit(partial(_enqueue, *messages))
 
 
 bot = TelegramSender()
+queue = NotificationQueue(settings.NOTIFICATIONS_REDIS_URL, settings.NOTIFICATIONS_REDIS_TIMEOUT)
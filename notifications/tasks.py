@@ -0,0 +1,70 @@
+import logging
+
+from celery.app import shared_task
+from django.conf import settings
+from requests import RequestException
+from telebot.apihelper import ApiException, ApiTelegramException
+
+from notifications.services import bot, queue, batch, TokenBucket, MESSAGES_SEPARATOR
+
+logger = logging.getLogger(__name__)
+
+# single consumer of the notifications queue, so an in-process bucket holds the chat rate limit
+bucket = TokenBucket(rate=settings.TELEGRAM_RATE_PER_SECOND, capacity=settings.TELEGRAM_BURST)
+
+
+def _retry_later(result) -> bool:
+    return result is None or (isinstance(result, ApiTelegramException) and result.error_code == 429)
+
+
+def _rejected(result) -> bool:
+    return isinstance(result, ApiException) and not _retry_later(result)
+
+
+def _send(message: str, plain: bool = False):
+    bucket.acquire()
+    try:
+        return bot.send_message(message, parse_mode="") if plain else bot.send_message(message)
+    except RequestException:
+        return None
+
+
+def _send_separately(messages: list[str], rejection: ApiException) -> list[str]:
+    """Send messages of a batch Telegram rejected (e.g. Markdown it can not parse) one by one,
+    a message rejected again is sent as plain text
+    Return: messages left to send later"""
+
+    for sent, message in enumerate(messages):
+        result = _send(message) if len(messages) > 1 else rejection
+        if _rejected(result):
+            result = _send(message, plain=True)
+
+        if _retry_later(result):
+            return messages[sent:]
+        if isinstance(result, ApiException):
+            logger.error("Notification is dropped: %s", result)
+    return []
+
+
+@shared_task
+def flush_notifications() -> int:
+    '''Drain queued notifications: coalesce them & send within Telegram rate limit'''
+
+    batches = batch(queue.pop_batch(settings.NOTIFICATIONS_BATCH_SIZE))
+    messages = [MESSAGES_SEPARATOR.join(messages) for messages in batches]
+
+    for sent, message in enumerate(messages):
+        result = _send(message)
+        if _rejected(result):
+            # one malformed message must not lose the whole batch
+            unsent = _send_separately(batches[sent], result)
+        elif _retry_later(result):
+            unsent = [message]
+        else:
+            continue
+
+        if unsent:
+            queue.push_back(unsent + messages[sent + 1:])
+            return sent
+
+    return len(messages)
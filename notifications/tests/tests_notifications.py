@@ -0,0 +1,191 @@
+from unittest.mock import call, patch
+
+from django.test import TestCase, SimpleTestCase
+from telebot.apihelper import ApiTelegramException
+
+from notifications.services import (
+    TelegramSender,
+    NotificationQueue,
+    TokenBucket,
+    coalesce,
+    escape_markdown,
+    notify,
+    TELEGRAM_MESSAGE_LIMIT,
+)
+from notifications.tasks import flush_notifications
+from tests.init_sample import init_sample_user, init_sample_book, init_sample_borrowing
+
+
+class Queue_Mock:
+    def __init__(self, messages=None):
+        self.messages = list(messages or [])
+
+    def push(self, *messages):
+        self.messages.extend(messages)
+
+    def pop_batch(self, size):
+        batch, self.messages = self.messages[:size], self.messages[size:]
+        return batch
+
+    def push_back(self, messages):
+        self.messages = list(messages) + self.messages
+
+
+class Clock_Mock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class CoalesceTests(SimpleTestCase):
+    def test_coalesce_burst_into_one_message(self):
+        self.assertEqual(coalesce(["first", "second", "third"]), ["first\n\nsecond\n\nthird"])
+
+    def test_coalesce_respect_message_limit(self):
+        messages = ["a" * 3000, "b" * 3000, "c" * 10]
+        combined = coalesce(messages)
+
+        self.assertEqual(combined, ["a" * 3000, "b" * 3000 + "\n\n" + "c" * 10])
+        self.assertTrue(all(len(message) <= TELEGRAM_MESSAGE_LIMIT for message in combined))
+
+    def test_coalesce_truncate_too_long_message(self):
+        self.assertEqual(coalesce(["x" * (TELEGRAM_MESSAGE_LIMIT + 1)]), ["x" * TELEGRAM_MESSAGE_LIMIT])
+
+
+class EscapeMarkdownTests(SimpleTestCase):
+    def test_escape_markdown_entities(self):
+        self.assertEqual(escape_markdown("first_user@mail.com"), "first\\_user@mail.com")
+        self.assertEqual(escape_markdown("*Dune* `[2]`"), "\\*Dune\\* \\`\\[2]\\`")
+
+    def test_queue_client_timeouts(self):
+        client = NotificationQueue("redis://localhost:6379/0", timeout=0.5).client
+        self.assertEqual(client.connection_pool.connection_kwargs["socket_timeout"], 0.5)
+        self.assertEqual(client.connection_pool.connection_kwargs["socket_connect_timeout"], 0.5)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_token_bucket_burst_then_wait(self):
+        clock = Clock_Mock()
+        bucket = TokenBucket(rate=1, capacity=2, clock=clock, sleep=clock.sleep)
+
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 1)
+        self.assertEqual(clock.now, 1)
+
+    def test_token_bucket_refill_over_time(self):
+        clock = Clock_Mock()
+        bucket = TokenBucket(rate=2, capacity=1, clock=clock, sleep=clock.sleep)
+
+        bucket.acquire()
+        clock.now += 0.5
+        self.assertEqual(bucket.acquire(), 0)
+
+
+@patch("notifications.tasks.bucket", TokenBucket(rate=1000, capacity=1000))
+class FlushNotificationsTests(SimpleTestCase):
+    @patch.object(TelegramSender, "send_message")
+    def test_flush_send_coalesced_messages(self, mock_method):
+        queue = Queue_Mock(["first", "second"])
+
+        with patch("notifications.tasks.queue", queue):
+            self.assertEqual(flush_notifications(), 1)
+
+        mock_method.assert_called_once_with("first\n\nsecond")
+        self.assertEqual(queue.messages, [])
+
+    @patch.object(TelegramSender, "send_message")
+    def test_flush_rate_limited_push_back(self, mock_method):
+        mock_method.return_value = ApiTelegramException(
+            "sendMessage", None, {"error_code": 429, "description": "Too Many Requests"}
+        )
+        queue = Queue_Mock(["first", "second"])
+
+        with patch("notifications.tasks.queue", queue):
+            self.assertEqual(flush_notifications(), 0)
+
+        self.assertEqual(queue.messages, ["first\n\nsecond"])
+
+    @patch.object(TelegramSender, "send_message")
+    def test_flush_bad_message_dropped(self, mock_method):
+        mock_method.return_value = ApiTelegramException(
+            "sendMessage", None, {"error_code": 400, "description": "Bad Request"}
+        )
+        queue = Queue_Mock(["first"])
+
+        with patch("notifications.tasks.queue", queue):
+            flush_notifications()
+
+        self.assertEqual(queue.messages, [])
+
+    @patch.object(TelegramSender, "send_message")
+    def test_flush_rejected_batch_sent_one_by_one(self, mock_method):
+        rejected = ApiTelegramException(
+            "sendMessage", None, {"error_code": 400, "description": "Bad Request: can't parse entities"}
+        )
+        mock_method.side_effect = lambda message, parse_mode=None: (
+            rejected if "*broken" in message and parse_mode is None else "sent"
+        )
+        queue = Queue_Mock(["first", "*broken", "third"])
+
+        with patch("notifications.tasks.queue", queue):
+            self.assertEqual(flush_notifications(), 1)
+
+        self.assertEqual(mock_method.call_args_list, [
+            call("first\n\n*broken\n\nthird"),
+            call("first"),
+            call("*broken"),
+            call("*broken", parse_mode=""),
+            call("third"),
+        ])
+        self.assertEqual(queue.messages, [])
+
+    @patch.object(TelegramSender, "send_message")
+    def test_flush_rejected_batch_rate_limited_push_back(self, mock_method):
+        results = iter([
+            ApiTelegramException("sendMessage", None, {"error_code": 400, "description": "Bad Request"}),
+            "sent",
+            ApiTelegramException(
+                "sendMessage", None, {"error_code": 429, "description": "Too Many Requests"}
+            ),
+        ])
+        mock_method.side_effect = lambda *args, **kwargs: next(results)
+        queue = Queue_Mock(["first", "second", "x" * TELEGRAM_MESSAGE_LIMIT])
+
+        with patch("notifications.tasks.queue", queue):
+            self.assertEqual(flush_notifications(), 0)
+
+        self.assertEqual(queue.messages, ["second", "x" * TELEGRAM_MESSAGE_LIMIT])
+
+
+@patch.object(TelegramSender, "send_message")
+@patch.object(NotificationQueue, "push")
+class NotifyTests(TestCase):
+    def test_notify_queued_after_commit(self, mock_push, mock_method):
+        with self.captureOnCommitCallbacks(execute=True):
+            notify("message")
+            mock_push.assert_not_called()
+
+        mock_push.assert_called_once_with("message")
+        mock_method.assert_not_called()
+
+    def test_notify_several_messages_one_push(self, mock_push, mock_method):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            notify("first", "second")
+            notify()
+
+        self.assertEqual(len(callbacks), 1)
+        mock_push.assert_called_once_with("first", "second")
+
+    def test_borrowing_created_no_telegram_request(self, mock_push, mock_method):
+        with self.captureOnCommitCallbacks(execute=True):
+            init_sample_borrowing(init_sample_book(), init_sample_user(1))
+
+        mock_push.assert_called_once()
+        self.assertIn("Borrowing has been created", mock_push.call_args.args[0])
+        mock_method.assert_not_called()
@@ -1,5 +1,7 @@
 from django.contrib import admin
 
-from payments.models import Payment
+from payments.models import CheckoutSession, Payment, StripeEvent
 
+admin.site.register(CheckoutSession)
 admin.site.register(Payment)
+admin.site.register(StripeEvent)
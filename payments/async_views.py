@@ -0,0 +1,55 @@
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect
+from django.views.decorators.http import require_GET
+
+from payments.models import Payment
+from payments.serializers import PaymentSuccessSerializer
+from payments.services import (
+    aset_payment_status_paid,
+    arenew_stripe_checkout_session,
+    closes_stripe_client_under_wsgi,
+)
+from users.authentication import jwt_required
+
+
+@require_GET
+@jwt_required
+@closes_stripe_client_under_wsgi
+async def payment_success(request):
+    """Async endpoint for success payment, the Stripe session is retrieved without holding a thread"""
+    serializer = PaymentSuccessSerializer(data=request.GET)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    try:
+        result = await aset_payment_status_paid(serializer.validated_data["session_id"])
+    except Http404 as error:
+        return JsonResponse({"detail": str(error)}, status=404)
+
+    if result is True:
+        return JsonResponse("Payment Successful", safe=False)
+    return JsonResponse({"error": str(result)}, status=400)
+
+
+@require_GET
+@jwt_required
+@closes_stripe_client_under_wsgi
+async def payment_renew(request, pk: int):
+    """Async endpoint for renew payment session, if expired. Otherwise - redirect"""
+    payments = Payment.objects.select_related("borrowing__book")
+    if not request.user.is_superuser:
+        payments = payments.filter(borrowing__user_id=request.user.id)
+    try:
+        payment = await payments.aget(pk=pk)
+    except Payment.DoesNotExist:
+        return JsonResponse({"detail": "No Payment matches the given query."}, status=404)
+
+    if payment.status == Payment.StatusType.PAID:
+        return JsonResponse("Payment is already paid", safe=False)
+
+    if payment.status == Payment.StatusType.PENDING and payment.session_url:
+        return redirect(payment.session_url)
+
+    if (payment := await arenew_stripe_checkout_session(payment, request)) is None:
+        return JsonResponse({"error": "Checkout session is not created. Retry later."}, status=502)
+    return redirect(payment.session_url)
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.6 on 2026-10-18 07:21
+
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+
+
+def backfill_expires_at(apps, schema_editor):
+    """Stripe sessions live at most 24h: pending sessions created before this field existed
+    are checked once that upper bound has passed"""
+    Payment = apps.get_model("payments", "Payment")
+    Payment.objects.filter(
+        status="pending", session_id__isnull=False, expires_at__isnull=True
+    ).update(expires_at=datetime.now() + timedelta(hours=24))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0001_initial"),
+        ("payments", "0004_stripeevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SweepWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("expires_at", models.DateTimeField(blank=True, null=True)),
+                ("payment_id", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["status", "expires_at"], name="payments_status_expires_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_expires_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0004_borrowing_hot_filter_indexes"),
+        ("payments", "0006_payment_updated_at"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="payment",
+            name="payments_status_expires_idx",
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="session_id",
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("status", "pending")),
+                fields=["expires_at", "id"],
+                name="payments_pending_expires_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def create_checkout_sessions(apps, schema_editor):
+    """One checkout session per distinct session id of payments, the payments point to it"""
+    CheckoutSession = apps.get_model("payments", "CheckoutSession")
+    Payment = apps.get_model("payments", "Payment")
+
+    sessions = Payment.objects.filter(session_id__isnull=False).values("session_id").annotate(
+        url=Max("session_url"), expires_at=Max("expires_at")
+    ).order_by()
+    CheckoutSession.objects.bulk_create(
+        (CheckoutSession(**session) for session in sessions.iterator()), batch_size=1000
+    )
+    Payment.objects.filter(session_id__isnull=False).update(
+        checkout_session_id=Subquery(
+            CheckoutSession.objects.filter(session_id=OuterRef("session_id")).values("id")[:1]
+        )
+    )
+
+
+def restore_session_ids(apps, schema_editor):
+    CheckoutSession = apps.get_model("payments", "CheckoutSession")
+    Payment = apps.get_model("payments", "Payment")
+
+    Payment.objects.filter(checkout_session__isnull=False).update(
+        session_id=Subquery(
+            CheckoutSession.objects.filter(pk=OuterRef("checkout_session_id")).values("session_id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0008_payment_shared_session"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CheckoutSession",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("session_id", models.CharField(max_length=255, unique=True)),
+                ("url", models.URLField(blank=True, max_length=510, null=True)),
+                ("expires_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="checkout_session",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="payments",
+                to="payments.checkoutsession",
+            ),
+        ),
+        migrations.RunPython(create_checkout_sessions, restore_session_ids),
+    ]
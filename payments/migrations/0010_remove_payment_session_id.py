@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # a migration of its own: PostgreSQL does not alter a table with pending deferred FK checks
+
+    dependencies = [
+        ("payments", "0009_checkoutsession"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="payment",
+            name="session_id",
+        ),
+    ]
@@ -1,9 +1,23 @@
-from django.db import models
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.db.models import F, Q
 
 from borrowings.models import Borrowing
+from library_service.models import TimestampedModel
 
 
-class Payment(models.Model):
+class CheckoutSession(models.Model):
+    """Stripe checkout session: of one payment or shared by the payments of books borrowed together"""
+
+    session_id = models.CharField(max_length=255, unique=True)
+    url = models.URLField(max_length=510, null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.session_id
+
+
+class Payment(TimestampedModel):
     FINE_MULTIPLIER = 2.0
 
     class StatusType(models.TextChoices):
@@ -18,9 +32,73 @@ class Payment(models.Model):
     status = models.CharField(max_length=255, choices=StatusType.choices, default=StatusType.PENDING)
     type = models.CharField(max_length=255, choices=Type.choices, default=Type.PAYMENT)
     borrowing = models.ForeignKey(Borrowing, on_delete=models.CASCADE, related_name="payments")
+    # url & expiry are copied from the checkout session,
+    # checkout redirects & the expiry sweep read the payment only
     session_url = models.URLField(max_length=510, null=True, blank=True)
-    session_id = models.CharField(max_length=255, null=True, blank=True)
+    checkout_session = models.ForeignKey(
+        CheckoutSession, on_delete=models.SET_NULL, null=True, blank=True, related_name="payments"
+    )
     money_to_pay = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # check_expired_session: WHERE status = 'pending' AND expires_at <= ? ORDER BY expires_at, id
+            models.Index(
+                fields=["expires_at", "id"],
+                condition=Q(status="pending"),
+                name="payments_pending_expires_idx",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "status" not in update_fields:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            previous_status = None
+            if not self._state.adding:
+                # locked read, so concurrent transitions of one payment are counted once
+                previous_status = Payment.objects.select_for_update().filter(
+                    pk=self.pk
+                ).values_list("status", flat=True).first()
+
+            super().save(*args, **kwargs)
+            self.count_pending(
+                int(self.status == self.StatusType.PENDING)
+                - int(previous_status == self.StatusType.PENDING)
+            )
+
+    def count_pending(self, delta: int) -> None:
+        """Shift pending counters of the borrowing user by delta payments"""
+        if delta:
+            get_user_model().objects.filter(pk=self.borrowing.user_id).update(
+                pending_payments=F("pending_payments") + delta,
+                pending_amount=F("pending_amount") + delta * self.money_to_pay,
+            )
 
     def __str__(self):
         return f"{self.type} : {self.status} [ USD {self.money_to_pay} ] {self.borrowing}"
+
+
+class StripeEvent(models.Model):
+    """Stripe webhook events already applied, so redelivered events are skipped"""
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=255)
+    processed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.type} : {self.event_id}"
+
+
+class SweepWatermark(models.Model):
+    """Keyset position (expires_at, payment id) reached by a periodic sweep, kept between runs"""
+
+    name = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    payment_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} : {self.expires_at} | {self.payment_id}"
@@ -1,12 +1,25 @@
 from rest_framework import serializers
 
+from library_service.fieldsets import FieldsetSerializerMixin
 from payments.models import Payment
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    session_id = serializers.CharField(source="checkout_session.session_id", read_only=True, allow_null=True)
+
     class Meta:
         model = Payment
-        fields = '__all__'
+        fields = (
+            "id",
+            "updated_at",
+            "status",
+            "type",
+            "session_url",
+            "session_id",
+            "money_to_pay",
+            "expires_at",
+            "borrowing",
+        )
 
 
 class PaymentSuccessSerializer(serializers.Serializer):
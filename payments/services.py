@@ -1,47 +1,122 @@
-import decimal
+import asyncio
+import weakref
+from collections import defaultdict
+from datetime import datetime
 from decimal import Decimal
+from functools import wraps
 
 import stripe
-from django.http import HttpRequest
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F
+from django.http import HttpRequest, Http404
 from rest_framework.generics import get_object_or_404
 from rest_framework.reverse import reverse
 
 from borrowings.models import Borrowing
+from library_service.metrics import stripe_call
 from library_service.settings import STRIPE_API_KEY
-from payments.models import Payment
+from notifications.services import escape_markdown
+from payments.models import CheckoutSession, Payment, StripeEvent
 
 stripe.api_key = STRIPE_API_KEY
 
+# Stripe clients of async views with their HTTP clients, one per event loop: the pooled httpx connections
+# of a client can not be used by another loop (under WSGI every async view request runs in a new one)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def stripe_async_client() -> stripe.StripeClient:
+    """ Return: Stripe client with a non-blocking HTTP client of the running event loop """
+    loop = asyncio.get_running_loop()
+    if (clients := _async_clients.get(loop)) is None:
+        http_client = stripe.HTTPXClient()
+        client = stripe.StripeClient(STRIPE_API_KEY, http_client=http_client)
+        clients = _async_clients[loop] = client, http_client
+    return clients[0]
+
+
+async def aclose_stripe_async_client() -> None:
+    """ Close the Stripe client of the running event loop & its connections, if it was created """
+    if (clients := _async_clients.pop(asyncio.get_running_loop(), None)) is not None:
+        await clients[1].close_async()
 
-def _create_stripe_checkout_session(
-        borrowing: Borrowing,
-        sum: decimal,
-        type: Payment.Type,
-        request: HttpRequest
-):
-    """ Create a Stripe checkout session with success & cancel urls
-        Return: Session object or None, if error occurs """
 
-    success_url = (request.build_absolute_uri(reverse("payments:payment-success"))
+def closes_stripe_client_under_wsgi(view):
+    """Async view decorator: under WSGI the event loop of a request ends with it, the Stripe client
+    created in it is closed on return. Under ASGI the client of the server loop is kept for next requests"""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        finally:
+            if not isinstance(request, ASGIRequest):
+                await aclose_stripe_async_client()
+
+    return wrapper
+
+
+def checkout_urls(request: HttpRequest, success_view: str = "payments:payment-success") -> tuple[str, str]:
+    """ Build absolute success & cancel urls for a Stripe checkout session """
+
+    success_url = (request.build_absolute_uri(reverse(success_view))
                    + "?session_id={CHECKOUT_SESSION_ID}")
     cancel_url = request.build_absolute_uri(reverse("payments:payment-cancel"))
+    return success_url, cancel_url
+
+
+def _line_item(payment: Payment) -> dict:
+    return {
+        "price_data": {
+            "currency": "usd",
+            "product_data": {
+                "name": f"Borrowing {payment.type} for {payment.borrowing.book.title}",
+            },
+            "unit_amount_decimal": payment.money_to_pay * 100,
+        },
+        "quantity": 1,
+    }
+
+
+def _checkout_session_params(payments: list[Payment], success_url: str, cancel_url: str) -> dict:
+    return {
+        "line_items": [_line_item(payment) for payment in payments],
+        "mode": "payment",
+        "client_reference_id": "-".join(str(payment.id) for payment in payments),
+        "success_url": success_url,
+        "cancel_url": cancel_url,
+    }
+
+
+def _create_stripe_checkout_session(payments: list[Payment], success_url: str, cancel_url: str):
+    """ Create one Stripe checkout session for the payments, a line item per payment
+        Return: Session object or None, if error occurs """
 
     try:
-        session = stripe.checkout.Session.create(
-            line_items=[{
-                "price_data": {
-                    "currency": "usd",
-                    "product_data": {
-                        "name": f"Borrowing {type} for {borrowing.book.title}",
-                    },
-                    "unit_amount_decimal": sum * 100,
-                },
-                "quantity": 1,
-            }],
-            mode="payment",
-            success_url=success_url,
-            cancel_url=cancel_url,
-        )
+        with stripe_call("session_create"):
+            session = stripe.checkout.Session.create(
+                **_checkout_session_params(payments, success_url, cancel_url)
+            )
+
+    except stripe.error.InvalidRequestError:
+        session = None
+
+    return session
+
+
+async def _acreate_stripe_checkout_session(payments: list[Payment], success_url: str, cancel_url: str):
+    """ Create one Stripe checkout session without blocking the event loop,
+        borrowings & books of the payments must be loaded
+        Return: Session object or None, if error occurs """
+
+    try:
+        with stripe_call("session_create"):
+            session = await stripe_async_client().checkout.sessions.create_async(
+                params=_checkout_session_params(payments, success_url, cancel_url)
+            )
 
     except stripe.error.InvalidRequestError:
         session = None
@@ -53,103 +128,333 @@ def _create_payment(
         borrowing: Borrowing,
         sum: Decimal,
         type: Payment.Type,
-        session
 ) -> Payment:
-    """ Create payment object based on session
+    """ Create pending payment object, its checkout session is attached later
         Return: Payment object """
 
     payment = Payment.objects.create(
         type=type,
         borrowing=borrowing,
-        session_url=session.url,
-        session_id=session.id,
         money_to_pay=sum
     )
     return payment
 
 
-def _update_payment(payment: Payment, session) -> Payment:
-    """ Update payment object based on session.
-        Return: Payment object """
+def _session_expires_at(session) -> datetime:
+    """ Local time when Stripe expires the checkout session """
+
+    return datetime.fromtimestamp(session.expires_at)
 
+
+def _checkout_session(session) -> CheckoutSession:
+    """ Return: not saved CheckoutSession row of a Stripe session """
+
+    return CheckoutSession(session_id=session.id, url=session.url, expires_at=_session_expires_at(session))
+
+
+def _session_fields(checkout_session: CheckoutSession) -> dict:
+    """ Return: payment fields pointing to the checkout session """
+
+    return {
+        "checkout_session": checkout_session,
+        "session_url": checkout_session.url,
+        "expires_at": checkout_session.expires_at,
+    }
+
+
+SESSION_UPDATE_FIELDS = ["status", "session_url", "checkout_session", "expires_at"]
+
+
+def _set_session(payment: Payment, checkout_session: CheckoutSession) -> None:
     payment.status = Payment.StatusType.PENDING
-    payment.session_url = session.url
-    payment.session_id = session.id
-    payment.save(update_fields=["status", 'session_url', 'session_id'])
+    for field, value in _session_fields(checkout_session).items():
+        setattr(payment, field, value)
+
+
+def _update_payment(payment: Payment, checkout_session: CheckoutSession) -> Payment:
+    """ Update payment object based on checkout session.
+        Return: Payment object """
+
+    _set_session(payment, checkout_session)
+    payment.save(update_fields=SESSION_UPDATE_FIELDS)
     return payment
 
 
-def _create_payment_stripe_checkout_session(
-        borrowing: Borrowing,
-        sum: decimal,
-        type: Payment.Type,
-        request: HttpRequest
-):
-    """ Create a Stripe checkout session & Payment """
+def borrowing_price(borrowing: Borrowing) -> Decimal:
+    days = (borrowing.expected_return_date - borrowing.borrow_date).days + 1
+    return borrowing.book.daily_fee * days
 
-    if session := _create_stripe_checkout_session(borrowing, sum, type, request):
-        payment = _create_payment(borrowing, sum, type, session)
-        return payment
 
-    return None
+def create_borrowing_payment(borrowing: Borrowing) -> Payment:
+    return _create_payment(borrowing, borrowing_price(borrowing), Payment.Type.PAYMENT)
 
 
-def create_payment_stripe_checkout_session(borrowing: Borrowing, request: HttpRequest) -> Payment:
-    days = (borrowing.expected_return_date - borrowing.borrow_date).days + 1
-    total_price = borrowing.book.daily_fee * days
-    return _create_payment_stripe_checkout_session(borrowing, total_price, Payment.Type.PAYMENT, request)
+def _bulk_create_payments(payments: list[Payment]) -> list[Payment]:
+    """ Create pending payments with a single INSERT, pending counters are shifted once per reader
+        (bulk_create skips Payment.save & its signals)
+        Return: Payment objects """
 
+    payments = Payment.objects.bulk_create(payments)
 
-def create_fine_stripe_checkout_session(borrowing: Borrowing, request: HttpRequest) -> Payment | None:
+    readers = defaultdict(list)
+    for payment in payments:
+        readers[payment.borrowing.user_id].append(payment.money_to_pay)
+    for user_id, amounts in readers.items():
+        get_user_model().objects.filter(pk=user_id).update(
+            pending_payments=F("pending_payments") + len(amounts),
+            pending_amount=F("pending_amount") + sum(amounts),
+        )
+    return payments
+
+
+def create_borrowing_payments(borrowings: list[Borrowing]) -> list[Payment]:
+    """ Create pending payments of borrowings with a single INSERT
+        Return: Payment objects """
+
+    return _bulk_create_payments([
+        Payment(type=Payment.Type.PAYMENT, borrowing=borrowing, money_to_pay=borrowing_price(borrowing))
+        for borrowing in borrowings
+    ])
+
+
+def fine_price(borrowing: Borrowing) -> Decimal:
     overdue_days = max((borrowing.actual_return_date - borrowing.expected_return_date).days, 0)
-    if overdue_days > 0:
-        fine_price = borrowing.book.daily_fee * overdue_days * Decimal(Payment.FINE_MULTIPLIER)
-        return _create_payment_stripe_checkout_session(borrowing, fine_price, Payment.Type.FINE, request)
+    return borrowing.book.daily_fee * overdue_days * Decimal(Payment.FINE_MULTIPLIER)
+
+
+def create_borrowing_fine(borrowing: Borrowing) -> Payment | None:
+    if price := fine_price(borrowing):
+        return _create_payment(borrowing, price, Payment.Type.FINE)
+    return None
+
+
+def create_borrowing_fines(borrowings: list[Borrowing]) -> list[Payment]:
+    """ Create pending fines of returned overdue borrowings with a single INSERT
+        Return: Payment objects """
+
+    return _bulk_create_payments([
+        Payment(type=Payment.Type.FINE, borrowing=borrowing, money_to_pay=price)
+        for borrowing in borrowings if (price := fine_price(borrowing))
+    ])
+
+
+def create_checkout_session(
+        payments: list[Payment], success_url: str, cancel_url: str
+) -> list[Payment] | None:
+    """ Create one Stripe checkout session for payments still waiting for one """
+
+    if session := _create_stripe_checkout_session(payments, success_url, cancel_url):
+        checkout_session = _checkout_session(session)
+        checkout_session.save()
+        session_fields = _session_fields(checkout_session)
+        Payment.objects.filter(pk__in=[payment.pk for payment in payments]).update(**session_fields)
+        for payment in payments:
+            for field, value in session_fields.items():
+                setattr(payment, field, value)
+        return payments
+
+    return None
+
+
+def expire_payments_without_session(payment_ids: list[int]) -> list[Payment]:
+    """ Set Expired the pending payments, whose checkout session could not be created:
+        the reader renews them & they no longer block borrowing
+        Return: expired Payment objects """
+
+    payments = list(
+        Payment.objects.select_related("borrowing").filter(
+            pk__in=payment_ids, status=Payment.StatusType.PENDING, checkout_session__isnull=True
+        ).order_by("id")
+    )
+    for payment in payments:
+        payment.status = Payment.StatusType.EXPIRED
+        payment.save(update_fields=["status"])
+    return payments
+
+
+async def acreate_checkout_session(
+        payments: list[Payment], success_url: str, cancel_url: str
+) -> list[Payment] | None:
+    """ Async create_checkout_session: Stripe is awaited, payments are updated by the async ORM """
+
+    if session := await _acreate_stripe_checkout_session(payments, success_url, cancel_url):
+        checkout_session = _checkout_session(session)
+        await checkout_session.asave()
+        session_fields = _session_fields(checkout_session)
+        await Payment.objects.filter(pk__in=[payment.pk for payment in payments]).aupdate(**session_fields)
+        for payment in payments:
+            for field, value in session_fields.items():
+                setattr(payment, field, value)
+        return payments
+
     return None
 
 
-def renew_stripe_checkout_session(payment: Payment, request: HttpRequest) -> Payment:
-    """ Create a Stripe checkout session & ReNew Payment """
+def renew_stripe_checkout_session(payment: Payment, request: HttpRequest) -> Payment | None:
+    """ Create a Stripe checkout session & ReNew Payment,
+        together with the other expired payments of its session
+        Return: renewed Payment object or None, if the session was not created """
 
-    if session := _create_stripe_checkout_session(
-            payment.borrowing,
-            payment.money_to_pay,
-            payment.type,
-            request
-    ):
-        payment = _update_payment(payment, session)
+    payments = [payment]
+    if payment.checkout_session_id:
+        payments += Payment.objects.filter(
+            checkout_session_id=payment.checkout_session_id, status=Payment.StatusType.EXPIRED
+        ).exclude(pk=payment.pk).select_related("borrowing__book").order_by("id")
+
+    if session := _create_stripe_checkout_session(payments, *checkout_urls(request)):
+        checkout_session = _checkout_session(session)
+        checkout_session.save()
+        for other in payments[1:]:
+            _update_payment(other, checkout_session)
+        payment = _update_payment(payment, checkout_session)
         return payment
+    return None
+
+
+async def arenew_stripe_checkout_session(payment: Payment, request: HttpRequest) -> Payment | None:
+    """ Async renew_stripe_checkout_session, the borrowing & book of the payment must be loaded
+        Return: renewed Payment object or None, if the session was not created """
+
+    payments = [payment]
+    if payment.checkout_session_id:
+        payments += [
+            other async for other in Payment.objects.filter(
+                checkout_session_id=payment.checkout_session_id, status=Payment.StatusType.EXPIRED
+            ).exclude(pk=payment.pk).select_related("borrowing__book").order_by("id")
+        ]
+
+    session = await _acreate_stripe_checkout_session(
+        payments, *checkout_urls(request, "payments:payment-success-async")
+    )
+    if session is None:
+        return None
+
+    checkout_session = _checkout_session(session)
+    await checkout_session.asave()
+    for renewed in payments:
+        _set_session(renewed, checkout_session)
+        await renewed.asave(update_fields=SESSION_UPDATE_FIELDS)
+    return payment
 
 
 def set_payment_status_paid(session_id: str) -> bool | stripe.error.StripeError:
+    checkout_session = get_object_or_404(CheckoutSession, session_id=session_id)
+    payments = checkout_session.payments.exclude(status=Payment.StatusType.PAID)
+    if not payments.exists():
+        # already confirmed by the webhook, no Stripe round trip needed
+        return True
+
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        with stripe_call("session_retrieve"):
+            session = stripe.checkout.Session.retrieve(session_id)
 
         if session.payment_status == "paid":
-            payment = get_object_or_404(Payment, session_id=session_id)
-            payment.status = Payment.StatusType.PAID
-            payment.save(update_fields=["status"])
+            for payment in payments.select_related("borrowing"):
+                payment.status = Payment.StatusType.PAID
+                payment.save(update_fields=["status"])
             return True
 
     except stripe.error.StripeError as e:
         return e
 
 
-def set_payment_status_expired(payment: Payment) -> bool:
-    ''' Set payment status Expired, if session is expired '''
+async def aset_payment_status_paid(session_id: str) -> bool | stripe.error.StripeError | None:
+    """ Async set_payment_status_paid: the session is retrieved without blocking the event loop
+        Return: True, if the payments are paid, StripeError or None, if not paid yet. Raise: Http404 """
 
-    session_id = payment.session_id
-    try:
-        session = stripe.checkout.Session.retrieve(session_id)
-        if session.status == "expired":
-            payment.status = Payment.StatusType.EXPIRED
-            payment.save(update_fields=["status"])
-            return True
+    checkout_session = await CheckoutSession.objects.filter(session_id=session_id).afirst()
+    if checkout_session is None:
+        raise Http404("No CheckoutSession matches the given query.")
 
+    payments = checkout_session.payments.exclude(status=Payment.StatusType.PAID)
+    if not await payments.aexists():
+        # already confirmed by the webhook, no Stripe round trip needed
+        return True
+
+    try:
+        with stripe_call("session_retrieve"):
+            session = await stripe_async_client().checkout.sessions.retrieve_async(session_id)
     except stripe.error.StripeError as e:
-        pass
+        return e
+
+    if session.payment_status != "paid":
+        return None
+
+    async for payment in payments.select_related("borrowing"):
+        payment.status = Payment.StatusType.PAID
+        await payment.asave(update_fields=["status"])
+    return True
+
+
+def retrieve_stripe_checkout_session(session_id: str):
+    """ Retrieve a Stripe checkout session
+        Return: Session object or None, if error occurs """
+
+    try:
+        with stripe_call("session_retrieve"):
+            return stripe.checkout.Session.retrieve(session_id)
+    except stripe.error.StripeError:
+        return None
+
+
+def apply_checkout_session_status(payment: Payment, session) -> bool:
+    """ Set payment status Expired, if session is expired, or Paid, if it was paid meanwhile
+        Return: True, if status changed """
+
+    if session is None:
+        return False
+
+    if session.status == "expired":
+        payment.status = Payment.StatusType.EXPIRED
+    elif session.status == "complete" and session.payment_status == "paid":
+        payment.status = Payment.StatusType.PAID
+    else:
+        return False
+
+    payment.save(update_fields=["status"])
+    return True
+
+
+def construct_stripe_event(payload: bytes, signature: str) -> stripe.Event:
+    """ Verify the Stripe-Signature header of a webhook request
+        Return: Event object. Raise: ValueError or SignatureVerificationError """
+
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        raise ValueError("Stripe webhook secret is not configured.")
+    return stripe.Webhook.construct_event(payload, signature, settings.STRIPE_WEBHOOK_SECRET)
+
+
+STRIPE_EVENT_STATUSES = {
+    "checkout.session.completed": Payment.StatusType.PAID,
+    "checkout.session.async_payment_succeeded": Payment.StatusType.PAID,
+    "checkout.session.expired": Payment.StatusType.EXPIRED,
+}
+
+
+def handle_stripe_event(event: stripe.Event) -> bool:
+    """ Apply status transition of a verified Stripe event only once
+        Return: False, if event was already processed """
+
+    with transaction.atomic():
+        _, created = StripeEvent.objects.get_or_create(event_id=event["id"], defaults={"type": event["type"]})
+        if not created:
+            return False
+
+        session = event["data"]["object"]
+        new_status = STRIPE_EVENT_STATUSES.get(event["type"])
+        if new_status == Payment.StatusType.PAID and session.get("payment_status") != "paid":
+            # completed, but delayed payment method: wait for async_payment_succeeded
+            new_status = None
+
+        if new_status:
+            payments = Payment.objects.filter(
+                checkout_session__session_id=session["id"], status=Payment.StatusType.PENDING
+            ).select_related("borrowing", "checkout_session")
+            for payment in payments:
+                payment.status = new_status
+                payment.save(update_fields=["status"])
 
-    return False
+    return True
 
 
 def detail_payment_info(instance: Payment, action: str = "created") -> str:
@@ -163,7 +468,8 @@ def detail_payment_info(instance: Payment, action: str = "created") -> str:
 
     return (f"*{instance.type.capitalize()} Checkout has been {action}.* \n"
             f"Amount: {instance.money_to_pay}\n"
-            f"Borrowing id: {instance.borrowing.id} | Book: {instance.borrowing.book.title} | "
-            f"User: {instance.borrowing.user}\n"
+            f"Borrowing id: {instance.borrowing.id} | "
+            f"Book: {escape_markdown(instance.borrowing.book.title)} | "
+            f"User: {escape_markdown(instance.borrowing.user)}\n"
             f"From: {date_from} To: {date_to}\n"
             f"Status: {instance.type} : {instance.status}")
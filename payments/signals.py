@@ -1,7 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
-from notifications.services import bot
+from notifications.services import escape_markdown, notify
 from payments.models import Payment
 from payments.services import detail_payment_info
 
@@ -10,17 +10,23 @@ from payments.services import detail_payment_info
 def send_msg_after_save(sender, instance, created, **kwargs):
     if created:
         message = detail_payment_info(instance)
-        bot.send_message(message)
+        notify(message)
 
     if kwargs.get("update_fields") and "status" in kwargs.get("update_fields"):
         if instance.status == Payment.StatusType.PAID:
             message = (f"*Payment Successful.* Amount: {instance.money_to_pay} | "
                        f"Borrowing id: {instance.borrowing.id}")
-            bot.send_message(message)
+            notify(message)
         if instance.status == Payment.StatusType.EXPIRED:
-            message = f"*Session Expired.* {instance.session_id}\n"\
+            message = f"*Session Expired.* {escape_markdown(instance.checkout_session)}\n"\
                       f"*Borrowing id:* {instance.borrowing.id}"
-            bot.send_message(message)
+            notify(message)
         if instance.status == Payment.StatusType.PENDING:
             message = f"{detail_payment_info(instance, "Renewed")}"
-            bot.send_message(message)
+            notify(message)
+
+
+@receiver(post_delete, sender=Payment)
+def count_pending_after_delete(sender, instance, **kwargs):
+    if instance.status == Payment.StatusType.PENDING:
+        instance.count_pending(-1)
@@ -1,14 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import stripe
+from celery import Task
 from celery.app import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpRequest
 
-from payments.models import Payment
-from payments.services import set_payment_status_expired
+from payments.models import Payment, SweepWatermark
+from payments.services import (
+    checkout_urls,
+    create_checkout_session,
+    expire_payments_without_session,
+    retrieve_stripe_checkout_session,
+    apply_checkout_session_status,
+)
 
 
 @shared_task
 def check_expired_session():
-    '''Check Stripe Sessions for expiration'''
+    '''Check Stripe Sessions for expiration.
+    Only payments past their session expiry are checked, one bounded chunk per run,
+    continuing from the watermark left by the previous run'''
+
+    watermark, _ = SweepWatermark.objects.get_or_create(name="check_expired_session")
+
+    payments = Payment.objects.filter(
+        status=Payment.StatusType.PENDING,
+        expires_at__lte=datetime.now(),
+        checkout_session__isnull=False,
+    )
+    if watermark.expires_at:
+        payments = payments.filter(
+            Q(expires_at__gt=watermark.expires_at)
+            | Q(expires_at=watermark.expires_at, id__gt=watermark.payment_id)
+        )
+    payments = list(
+        payments.select_related("borrowing", "checkout_session").order_by(
+            "expires_at", "id"
+        )[:settings.EXPIRED_SWEEP_CHUNK_SIZE]
+    )
+
+    # payments borrowed together share a session, it is retrieved once
+    session_ids = list(dict.fromkeys(payment.checkout_session.session_id for payment in payments))
+    with ThreadPoolExecutor(max_workers=settings.EXPIRED_SWEEP_WORKERS) as executor:
+        sessions = dict(zip(session_ids, executor.map(retrieve_stripe_checkout_session, session_ids)))
+
+    res = {payment.checkout_session.session_id : payment.status
+           for payment in payments
+           if apply_checkout_session_status(payment, sessions[payment.checkout_session.session_id])}
+
+    # a full chunk means more may follow; otherwise start over to recheck still open sessions
+    if len(payments) == settings.EXPIRED_SWEEP_CHUNK_SIZE:
+        watermark.expires_at, watermark.payment_id = payments[-1].expires_at, payments[-1].id
+    else:
+        watermark.expires_at, watermark.payment_id = None, 0
+    watermark.save(update_fields=["expires_at", "payment_id"])
 
-    payments = Payment.objects.filter(status=Payment.StatusType.PENDING).select_related()
-    res = {payment.session_id : payment.status
-           for payment in payments if set_payment_status_expired(payment)}
     return res
+
+
+STRIPE_RETRY = {
+    "autoretry_for": (stripe.error.APIConnectionError, stripe.error.APIError, stripe.error.RateLimitError),
+    "retry_backoff": True,
+    "max_retries": 5,
+}
+
+
+class CheckoutSessionTask(Task):
+    '''The session of a payment is not created, if the task failed for good (an error not retried
+    or retries exhausted): its payments are expired, so checkout redirects to renew'''
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        payment_ids = args[0] if isinstance(args[0], list) else [args[0]]
+        expire_payments_without_session(payment_ids)
+
+
+@shared_task(base=CheckoutSessionTask, **STRIPE_RETRY)
+def create_payment_checkout_session(payment_id: int, success_url: str, cancel_url: str) -> str | None:
+    '''Create the Stripe Session for a payment committed without one'''
+
+    return create_payments_checkout_session([payment_id], success_url, cancel_url)
+
+
+@shared_task(base=CheckoutSessionTask, **STRIPE_RETRY)
+def create_payments_checkout_session(payment_ids: list[int], success_url: str, cancel_url: str) -> str | None:
+    '''Create one Stripe Session for payments committed without one, borrowed together'''
+
+    payments = list(
+        Payment.objects.select_related("borrowing__book").filter(
+            pk__in=payment_ids, checkout_session__isnull=True
+        ).order_by("id")
+    )
+    if not payments:
+        return None
+    if create_checkout_session(payments, success_url, cancel_url):
+        return payments[0].checkout_session.session_id
+
+    # the request was rejected by Stripe, a retry gets the same answer
+    expire_payments_without_session(payment_ids)
+    return None
+
+
+def schedule_checkout_session(payment: Payment, request: HttpRequest) -> None:
+    '''Queue Stripe Session creation once the payment row is committed'''
+
+    success_url, cancel_url = checkout_urls(request)
+    transaction.on_commit(partial(create_payment_checkout_session.delay, payment.id, success_url, cancel_url))
+
+
+def schedule_payments_checkout_session(payments: list[Payment], request: HttpRequest) -> None:
+    '''Queue one Stripe Session creation for payments borrowed together, once they are committed'''
+
+    success_url, cancel_url = checkout_urls(request)
+    payment_ids = [payment.id for payment in payments]
+    transaction.on_commit(
+        partial(create_payments_checkout_session.delay, payment_ids, success_url, cancel_url)
+    )
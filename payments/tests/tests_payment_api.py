@@ -1,8 +1,14 @@
+import csv
+import json
 from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
+import stripe
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.shortcuts import get_object_or_404
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from django.urls import reverse
 from django.utils import timezone
@@ -17,9 +23,11 @@ from tests.init_sample import (
     init_sample_borrowing,
     init_sample_payment
 )
-from notifications.services import TelegramSender
-from payments.models import Payment
+from borrowings.models import Borrowing
+from notifications.services import TelegramSender, NotificationQueue
+from payments.models import Payment, SweepWatermark
 from payments.serializers import PaymentSerializer
+from payments.tasks import create_payment_checkout_session, check_expired_session
 
 
 BORROWING_URL = reverse("borrowings:borrowing-list")
@@ -27,10 +35,12 @@ BORROWING_URL = reverse("borrowings:borrowing-list")
 PAYMENT_URL = reverse("payments:payment-list")
 PAYMENT_DETAIL_URL = "payments:payment-detail"
 PAYMENT_RENEW_URL = "payments:payment-renew"
+PAYMENT_CHECKOUT_URL = "payments:payment-checkout"
 
 PAYMENT_SUCCESS_URL = reverse("payments:payment-success") + "?session_id="
 PAYMENT_CANCEL_URL = reverse("payments:payment-cancel")
 PAYMENT_CHECK_EXPIRED_URL = reverse("payments:payment-check-expired")
+PAYMENT_EXPORT_URL = reverse("payments:payment-export")
 
 
 def detail_url(url, instance_id):
@@ -139,7 +149,9 @@ class PaymentAPITestCase(APITestCase):
 
         session = Session_Mock()
 
-        response = self.client.post(BORROWING_URL, self.payload)
+        with (patch("payments.tasks.create_payment_checkout_session.delay", create_payment_checkout_session),
+              self.captureOnCommitCallbacks(execute=True)):
+            response = self.client.post(BORROWING_URL, self.payload)
         self.assertEqual(response.status_code, status.HTTP_302_FOUND)
 
         payments = Payment.objects.filter(borrowing__user=self.user1)
@@ -148,15 +160,91 @@ class PaymentAPITestCase(APITestCase):
         self.assertEqual(session.url, serializer.data[0].get("session_url"))
         self.assertEqual(session.id, serializer.data[0].get("session_id"))
 
-    @patch.object(TelegramSender, "send_message")
+    @patch("payments.tasks.create_payment_checkout_session.delay")
+    def test_create_borrowing_payment_session_created_after_commit(self, mock_method):
+        self.payload = {
+            "expected_return_date": timezone.now().date() + timedelta(days=1),
+            "book": self.book1.id,
+        }
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(BORROWING_URL, self.payload)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+
+        payment = Payment.objects.get(borrowing__user=self.user1)
+        self.assertIsNone(payment.checkout_session)
+        self.assertEqual(response.url, detail_url(PAYMENT_CHECKOUT_URL, payment.pk))
+        mock_method.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        mock_method.assert_called_once()
+        self.assertEqual(mock_method.call_args.args[0], payment.pk)
+
+    def test_payment_checkout_session_not_created_yet(self):
+        self.payment1 = init_sample_payment(self.borrowing1)
+        response = self.client.get(detail_url(PAYMENT_CHECKOUT_URL, self.payment1.pk))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response["Retry-After"], "1")
+
+    def test_payment_checkout_session_created_redirect(self):
+        self.payment1 = init_sample_payment(self.borrowing1, session_url="http://test.test")
+        response = self.client.get(detail_url(PAYMENT_CHECKOUT_URL, self.payment1.pk))
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response.url, "http://test.test")
+
+    @patch("payments.services._create_stripe_checkout_session", Session_Mock)
+    def test_create_payment_checkout_session_task_once(self):
+        self.payment1 = init_sample_payment(self.borrowing1)
+
+        session_id = create_payment_checkout_session(self.payment1.pk, "http://s.test", "http://c.test")
+        self.assertEqual(session_id, Session_Mock().id)
+
+        self.assertIsNone(create_payment_checkout_session(self.payment1.pk, "http://s.test", "http://c.test"))
+
+    @patch.object(NotificationQueue, "push")
+    @patch("payments.services._create_stripe_checkout_session", return_value=None)
+    def test_create_payment_checkout_session_rejected_expired(self, mock_create, mock_push):
+        self.payment1 = init_sample_payment(self.borrowing1)
+
+        self.assertIsNone(create_payment_checkout_session(self.payment1.pk, "http://s.test", "http://c.test"))
+        self.payment1.refresh_from_db()
+        self.assertEqual(self.payment1.status, Payment.StatusType.EXPIRED)
+        self.assertEqual(get_user_model().objects.get(pk=self.user1.pk).pending_payments, 0)
+
+        response = self.client.get(detail_url(PAYMENT_CHECKOUT_URL, self.payment1.pk))
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response.url, detail_url(PAYMENT_RENEW_URL, self.payment1.pk))
+
+        response = self.client.get(response.url)
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+
+    @patch.object(NotificationQueue, "push")
+    def test_create_payment_checkout_session_failed_for_good_expired(self, mock_push):
+        for error in (stripe.error.AuthenticationError("no key"), stripe.error.APIConnectionError("down")):
+            payment = Payment.objects.create(borrowing=self.borrowing1, money_to_pay=10)
+
+            with patch("payments.services._create_stripe_checkout_session", side_effect=error) as mock_create:
+                result = create_payment_checkout_session.apply(
+                    args=(payment.pk, "http://s.test", "http://c.test")
+                )
+            self.assertTrue(result.failed())
+            payment.refresh_from_db()
+            self.assertEqual(payment.status, Payment.StatusType.EXPIRED)
+
+        # connection errors are retried before the payment is given up
+        self.assertEqual(mock_create.call_count, create_payment_checkout_session.max_retries + 1)
+
+    @patch.object(NotificationQueue, "push")
     @patch("payments.services.stripe.checkout.Session.retrieve", Session_Mock)
     def test_payment_success_correct_session_id(self, mock_method):
         self.payment1 = init_sample_payment(self.borrowing1, session_id="111")
-        success_url = PAYMENT_SUCCESS_URL + self.payment1.session_id
+        success_url = PAYMENT_SUCCESS_URL + self.payment1.checkout_session.session_id
 
         session = Session_Mock()
 
-        response = self.client.get(success_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(success_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         mock_method.assert_called()
 
@@ -164,7 +252,7 @@ class PaymentAPITestCase(APITestCase):
     @patch("payments.services.stripe.checkout.Session.retrieve", Session_Mock_not_paid)
     def test_payment_success_bad_session_id_error(self, mock_method):
         self.payment1 = init_sample_payment(self.borrowing1, session_id="111")
-        success_url = PAYMENT_SUCCESS_URL + self.payment1.session_id
+        success_url = PAYMENT_SUCCESS_URL + self.payment1.checkout_session.session_id
 
         session = Session_Mock_not_paid()
 
@@ -213,7 +301,9 @@ class PaymentAPITestCase(APITestCase):
         self.client.force_authenticate(self.user2)
 
         self.payment1 = init_sample_payment(self.borrowing1,
-                                            status=Payment.StatusType.PENDING, )
+                                            status=Payment.StatusType.PENDING,
+                                            session_id="333",
+                                            expires_at=timezone.now() - timedelta(minutes=1), )
 
         session = Session_Mock_not_paid()
 
@@ -222,3 +312,186 @@ class PaymentAPITestCase(APITestCase):
 
         payment = get_object_or_404(Payment, id=self.payment1.pk)
         self.assertEqual(payment.status, Payment.StatusType.EXPIRED)
+
+
+@patch.object(TelegramSender, "send_message")
+class CheckExpiredSessionTaskTestCase(TestCase):
+    def setUp(self):
+        self.user1 = init_sample_user(1)
+        self.book1 = init_sample_book()
+        self.borrowing1 = init_sample_borrowing(self.book1, self.user1)
+
+    def init_expired_payment(self, number: int, minutes_ago: int = 1) -> Payment:
+        return init_sample_payment(self.borrowing1,
+                                   session_id=f"cs_{number}",
+                                   expires_at=timezone.now() - timedelta(minutes=minutes_ago))
+
+    @patch("payments.services.stripe.checkout.Session.retrieve")
+    def test_check_expired_skip_not_yet_expired(self, mock_retrieve, mock_method):
+        init_sample_payment(self.borrowing1,
+                            session_id="cs_1",
+                            expires_at=timezone.now() + timedelta(hours=1))
+        init_sample_payment(self.borrowing1, session_id=None)
+
+        self.assertEqual(check_expired_session(), {})
+        mock_retrieve.assert_not_called()
+
+    @patch("payments.services.stripe.checkout.Session.retrieve", Session_Mock_expired)
+    def test_check_expired_bounded_chunks_with_watermark(self, mock_method):
+        payments = [self.init_expired_payment(number, minutes_ago=10 - number) for number in range(3)]
+
+        with override_settings(EXPIRED_SWEEP_CHUNK_SIZE=2):
+            self.assertEqual(len(check_expired_session()), 2)
+            watermark = SweepWatermark.objects.get(name="check_expired_session")
+            self.assertEqual(watermark.payment_id, payments[1].id)
+
+            self.assertEqual(len(check_expired_session()), 1)
+            watermark.refresh_from_db()
+            self.assertIsNone(watermark.expires_at)
+
+        self.assertFalse(Payment.objects.filter(status=Payment.StatusType.PENDING).exists())
+
+    @patch("payments.services.stripe.checkout.Session.retrieve", return_value=Session_Mock_expired())
+    def test_check_expired_shared_session_retrieved_once(self, mock_retrieve, mock_method):
+        payment1 = self.init_expired_payment(1)
+        payment2 = init_sample_payment(self.borrowing1, money_to_pay=20,
+                                       session_id=payment1.checkout_session.session_id,
+                                       expires_at=payment1.expires_at)
+
+        check_expired_session()
+
+        mock_retrieve.assert_called_once_with(payment1.checkout_session.session_id)
+        payments = Payment.objects.filter(pk__in=[payment1.pk, payment2.pk])
+        self.assertEqual(set(payments.values_list("status", flat=True)), {Payment.StatusType.EXPIRED})
+
+    @patch("payments.services.stripe.checkout.Session.retrieve", Session_Mock)
+    def test_check_expired_paid_meanwhile_set_paid(self, mock_method):
+        payment = self.init_expired_payment(1)
+
+        check_expired_session()
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.StatusType.PAID)
+
+
+@patch.object(NotificationQueue, "push")
+class PendingCountersTestCase(TestCase):
+    def setUp(self):
+        self.user1 = init_sample_user(1)
+        self.book1 = init_sample_book()
+        self.borrowing1 = init_sample_borrowing(self.book1, self.user1)
+
+    def assertCounters(self, count, amount):
+        self.user1.refresh_from_db()
+        self.assertEqual((self.user1.pending_payments, self.user1.pending_amount), (count, amount))
+
+    def test_counters_follow_status_changes(self, mock_push):
+        payment1 = init_sample_payment(self.borrowing1, money_to_pay=10)
+        payment2 = init_sample_payment(self.borrowing1, money_to_pay=5, type=Payment.Type.FINE)
+        self.assertCounters(2, 15)
+
+        payment1.status = Payment.StatusType.PAID
+        payment1.save(update_fields=["status"])
+        self.assertCounters(1, 5)
+
+        payment2.status = Payment.StatusType.EXPIRED
+        payment2.save()
+        self.assertCounters(0, 0)
+
+        payment2.status = Payment.StatusType.PENDING
+        payment2.save(update_fields=["status"])
+        self.assertCounters(1, 5)
+
+        payment2.delete()
+        self.assertCounters(0, 0)
+
+    def test_counters_not_changed_twice_by_stale_instance(self, mock_push):
+        payment = init_sample_payment(self.borrowing1)
+        stale = Payment.objects.get(pk=payment.pk)
+
+        payment.status = Payment.StatusType.PAID
+        payment.save(update_fields=["status"])
+        stale.status = Payment.StatusType.EXPIRED
+        stale.save(update_fields=["status"])
+
+        self.assertCounters(0, 0)
+
+    def test_repair_pending_counters_command(self, mock_push):
+        init_sample_payment(self.borrowing1, money_to_pay=10)
+        init_sample_payment(self.borrowing1, money_to_pay=7, status=Payment.StatusType.PAID)
+        get_user_model().objects.filter(pk=self.user1.pk).update(pending_payments=5, pending_amount=1)
+
+        call_command("repair_pending_counters", "--dry-run", stdout=StringIO())
+        self.assertCounters(5, 1)
+
+        out = StringIO()
+        call_command("repair_pending_counters", stdout=out)
+        self.assertCounters(1, 10)
+        self.assertIn("repaired: 1 user(s)", out.getvalue())
+
+
+class PaymentExportAPITestCase(APITestCase):
+    def setUp(self):
+        self.user = init_sample_user(1)
+        self.admin = init_sample_admin_user(2)
+        book = init_sample_book()
+        today = timezone.now().date()
+        old_borrowing = init_sample_borrowing(book, self.user)
+        # borrow_date is auto_now_add, backdate it
+        Borrowing.objects.filter(pk=old_borrowing.pk).update(borrow_date=today - timedelta(days=40))
+        self.old_paid = init_sample_payment(old_borrowing, status=Payment.StatusType.PAID, session_id="cs_1")
+        self.pending = init_sample_payment(init_sample_borrowing(book, self.user), session_id="cs_2")
+        self.other = init_sample_payment(init_sample_borrowing(book, self.admin), session_id="cs_3")
+        self.client.force_authenticate(self.admin)
+
+    def export(self, **params):
+        response = self.client.get(PAYMENT_EXPORT_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_payment_export_csv(self):
+        response, content = self.export()
+
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn('filename="payments.csv"', response["Content-Disposition"])
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(
+            [row["id"] for row in rows], [str(self.old_paid.id), str(self.pending.id), str(self.other.id)]
+        )
+        self.assertEqual(rows[0]["user"], self.user.email)
+        self.assertEqual(rows[0]["money_to_pay"], "10.00")
+
+    def test_payment_export_ndjson_filtered(self):
+        today = timezone.now().date()
+        _, content = self.export(
+            output="ndjson", status="pending", date_from=(today - timedelta(days=1)).isoformat()
+        )
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [self.pending.id, self.other.id])
+        self.assertEqual(rows[0]["borrow_date"], today.isoformat())
+
+        _, content = self.export(output="ndjson", date_to=(today - timedelta(days=1)).isoformat())
+        self.assertEqual([json.loads(line)["id"] for line in content.splitlines()], [self.old_paid.id])
+
+    def test_payment_export_one_query_without_instances(self):
+        response = self.client.get(PAYMENT_EXPORT_URL)
+
+        with self.assertNumQueries(1), patch.object(Payment, "__init__", side_effect=AssertionError):
+            b"".join(response.streaming_content)
+
+    def test_payment_export_own_payments(self):
+        self.client.force_authenticate(self.user)
+        _, content = self.export(output="ndjson")
+
+        self.assertEqual(
+            [json.loads(line)["id"] for line in content.splitlines()], [self.old_paid.id, self.pending.id]
+        )
+
+    def test_payment_export_invalid_params(self):
+        for params in (
+            {"status": "lost"}, {"output": "xml"}, {"date_from": "2024-02-02", "date_to": "2024-01-01"}
+        ):
+            response = self.client.get(PAYMENT_EXPORT_URL, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,101 @@
+from unittest.mock import patch
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+
+from notifications.services import TelegramSender, NotificationQueue
+from payments.models import Payment, StripeEvent
+from tests.init_sample import (
+    init_sample_user,
+    init_sample_book,
+    init_sample_borrowing,
+    init_sample_payment
+)
+from tests.init_stripe_webhook import (
+    STRIPE_WEBHOOK_TEST_SECRET,
+    init_stripe_event,
+    send_fake_webhook,
+)
+
+PAYMENT_SUCCESS_URL = reverse("payments:payment-success") + "?session_id="
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=STRIPE_WEBHOOK_TEST_SECRET)
+@patch.object(TelegramSender, "send_message")
+class StripeWebhookAPITestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.user1 = init_sample_user(1)
+        self.book1 = init_sample_book()
+        self.borrowing1 = init_sample_borrowing(self.book1, self.user1)
+        self.payment1 = init_sample_payment(self.borrowing1, session_id="cs_test_1")
+
+    def test_webhook_session_completed_set_paid(self, mock_method):
+        event = init_stripe_event("checkout.session.completed", "cs_test_1")
+        response = send_fake_webhook(self.client, event)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.payment1.refresh_from_db()
+        self.assertEqual(self.payment1.status, Payment.StatusType.PAID)
+
+    def test_webhook_shared_session_completed_set_all_paid(self, mock_method):
+        borrowing2 = init_sample_borrowing(init_sample_book(title="Book2"), self.user1)
+        payment2 = init_sample_payment(borrowing2, session_id="cs_test_1")
+
+        send_fake_webhook(self.client, init_stripe_event("checkout.session.completed", "cs_test_1"))
+
+        payments = Payment.objects.filter(pk__in=[self.payment1.pk, payment2.pk])
+        self.assertEqual(set(payments.values_list("status", flat=True)), {Payment.StatusType.PAID})
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.pending_payments, 0)
+
+    def test_webhook_session_completed_unpaid_stays_pending(self, mock_method):
+        event = init_stripe_event("checkout.session.completed", "cs_test_1", payment_status="unpaid")
+        response = send_fake_webhook(self.client, event)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.payment1.refresh_from_db()
+        self.assertEqual(self.payment1.status, Payment.StatusType.PENDING)
+
+    def test_webhook_session_expired_set_expired(self, mock_method):
+        response = send_fake_webhook(self.client, init_stripe_event("checkout.session.expired", "cs_test_1"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.payment1.refresh_from_db()
+        self.assertEqual(self.payment1.status, Payment.StatusType.EXPIRED)
+
+    @patch.object(NotificationQueue, "push")
+    def test_webhook_duplicate_event_processed_once(self, mock_push, mock_method):
+        event = init_stripe_event("checkout.session.completed", "cs_test_1")
+        with self.captureOnCommitCallbacks(execute=True):
+            send_fake_webhook(self.client, event)
+        mock_push.assert_called_once()
+        mock_push.reset_mock()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = send_fake_webhook(self.client, event)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(StripeEvent.objects.filter(event_id=event["id"]).count(), 1)
+        mock_push.assert_not_called()
+
+    def test_webhook_bad_signature_error(self, mock_method):
+        event = init_stripe_event("checkout.session.completed", "cs_test_1")
+        response = send_fake_webhook(self.client, event, secret="whsec_wrong")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.payment1.refresh_from_db()
+        self.assertEqual(self.payment1.status, Payment.StatusType.PENDING)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    @patch("payments.services.stripe.checkout.Session.retrieve")
+    def test_success_after_webhook_no_stripe_call(self, mock_retrieve, mock_method):
+        send_fake_webhook(self.client, init_stripe_event("checkout.session.completed", "cs_test_1"))
+
+        self.client.force_authenticate(self.user1)
+        response = self.client.get(PAYMENT_SUCCESS_URL + "cs_test_1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_retrieve.assert_not_called()
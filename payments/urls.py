@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework import routers
 
+from payments.async_views import payment_success, payment_renew
 from payments.views import PaymentsViewSet
 
 
@@ -10,5 +11,8 @@ router = routers.DefaultRouter()
 router.register("", PaymentsViewSet)
 
 urlpatterns = [
+    # async variants for an ASGI server, ahead of the router detail routes
+    path("async/success/", payment_success, name="payment-success-async"),
+    path("async/<int:pk>/renew/", payment_renew, name="payment-renew-async"),
     path("", include(router.urls)),
 ]
@@ -1,19 +1,43 @@
+import stripe
 from django.shortcuts import render, redirect
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter, OpenApiResponse
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from library_service.exports import ExportParamsSerializer, export_response
+from library_service.fieldsets import FIELDSET_PARAMETERS, FieldsetMixin
+from library_service.projections import ValuesRepresentation, ValuesListMixin
 from payments.models import Payment
 from payments.serializers import PaymentSerializer, PaymentSuccessSerializer
-from payments.services import set_payment_status_paid, renew_stripe_checkout_session
+from payments.services import (
+    set_payment_status_paid,
+    renew_stripe_checkout_session,
+    construct_stripe_event,
+    handle_stripe_event,
+)
 from payments.tasks import check_expired_session
 
 
+PAYMENT_EXPORT_COLUMNS = {
+    "id": "id",
+    "borrowing_id": "borrowing_id",
+    "user": "borrowing__user__email",
+    "book": "borrowing__book__title",
+    "borrow_date": "borrowing__borrow_date",
+    "type": "type",
+    "status": "status",
+    "money_to_pay": "money_to_pay",
+    "session_id": "checkout_session__session_id",
+    "expires_at": "expires_at",
+    "updated_at": "updated_at",
+}
+
+
 @extend_schema_view(
     list=extend_schema(
         summary="List of all payments",
@@ -24,14 +48,26 @@ from payments.tasks import check_expired_session
                 description="Filter by user id ( for Admin users ONLY ) "
                             "(ex. ?user_id=value). ",
             ),
+            *FIELDSET_PARAMETERS,
         ]
     ),
     retrieve=extend_schema(
         summary="Get payments object by id",
+        parameters=FIELDSET_PARAMETERS,
+    ),
+    checkout=extend_schema(
+        summary="Redirect to payment checkout session, once it is created",
+        responses={
+            status.HTTP_302_FOUND: OpenApiResponse(description="Redirect to Stripe checkout session"),
+            status.HTTP_202_ACCEPTED: OpenApiResponse(description="Checkout session is being created"),
+        }
     ),
     renew=extend_schema(
         summary="Renew payment session, if expired",
-        responses={status.HTTP_200_OK: OpenApiResponse(description="")}
+        responses={
+            status.HTTP_200_OK: OpenApiResponse(description=""),
+            status.HTTP_502_BAD_GATEWAY: OpenApiResponse(description="Checkout session is not created"),
+        }
     ),
     success=extend_schema(
         summary="Success payment session",
@@ -46,15 +82,37 @@ from payments.tasks import check_expired_session
             description="Payment can be paid later. Session is available for only 24h."
         )}
     ),
+    webhook=extend_schema(
+        summary="Stripe webhook for checkout session completed & expired events",
+        request=None,
+        responses={
+            status.HTTP_200_OK: OpenApiResponse(description="Event accepted"),
+            status.HTTP_400_BAD_REQUEST: OpenApiResponse(description="Invalid payload or signature"),
+        }
+    ),
+    export=extend_schema(
+        summary="Stream payments ledger as CSV or NDJSON",
+        description="Filter by borrowing date range & payment status. "
+                    "Rows are streamed from a database cursor, export size is not limited.",
+        parameters=[
+            OpenApiParameter("output", type=OpenApiTypes.STR, enum=["csv", "ndjson"],
+                             description="Export format (default: csv)"),
+            OpenApiParameter("date_from", type=OpenApiTypes.DATE, description="Borrowed on or after"),
+            OpenApiParameter("date_to", type=OpenApiTypes.DATE, description="Borrowed on or before"),
+            OpenApiParameter("status", type=OpenApiTypes.STR, enum=Payment.StatusType.values),
+        ],
+        responses={status.HTTP_200_OK: OpenApiResponse(description="CSV with a header line or NDJSON")},
+    ),
     check_expired=extend_schema(
         summary="Check expired payment sessions ( only for Admin users )",
         responses={status.HTTP_200_OK: OpenApiResponse(description="session_id : expired")}
     ),
 )
-class PaymentsViewSet(ReadOnlyModelViewSet):
+class PaymentsViewSet(FieldsetMixin, ValuesListMixin, ReadOnlyModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = (IsAuthenticated,)
+    values_representation = ValuesRepresentation(PaymentSerializer)
 
     def get_queryset(self):
         user = self.request.user
@@ -63,6 +121,29 @@ class PaymentsViewSet(ReadOnlyModelViewSet):
             queryset = queryset.filter(borrowing__user_id=user.id)
         return queryset
 
+    @action(
+        methods=["GET", ],
+        detail=False,
+        url_path="export",
+    )
+    def export(self, request):
+        """Endpoint for streaming export of payments"""
+        params = ExportParamsSerializer(data=request.query_params, statuses=Payment.StatusType.choices)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        payments = self.get_queryset()
+        if "date_from" in filters:
+            payments = payments.filter(borrowing__borrow_date__gte=filters["date_from"])
+        if "date_to" in filters:
+            payments = payments.filter(borrowing__borrow_date__lte=filters["date_to"])
+        if "status" in filters:
+            payments = payments.filter(status=filters["status"])
+
+        return export_response(
+            payments.order_by("id"), PAYMENT_EXPORT_COLUMNS, filters["output"], "payments"
+        )
+
     @action(
         methods=["GET", ],
         detail=False,
@@ -95,6 +176,23 @@ class PaymentsViewSet(ReadOnlyModelViewSet):
             status=status.HTTP_200_OK
         )
 
+    @action(
+        methods=["POST", ],
+        detail=False,
+        url_path="webhook",
+        authentication_classes=(),
+        permission_classes=(AllowAny,),
+    )
+    def webhook(self, request):
+        """Endpoint for Stripe events. Signed by Stripe, duplicates are acknowledged & skipped"""
+        try:
+            event = construct_stripe_event(request.body, request.META.get("HTTP_STRIPE_SIGNATURE", ""))
+        except (ValueError, stripe.error.SignatureVerificationError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        handle_stripe_event(event)
+        return Response(status=status.HTTP_200_OK)
+
     @action(
         methods=["GET", ],
         detail=False,
@@ -106,6 +204,30 @@ class PaymentsViewSet(ReadOnlyModelViewSet):
         res = check_expired_session()
         return Response(res, status=status.HTTP_200_OK)
 
+    @action(
+        methods=["GET", ],
+        detail=True,
+        url_path="checkout",
+    )
+    def checkout(self, request, pk=None):
+        """Endpoint for redirect to payment session. Until the session is created - poll again later"""
+        payment = self.get_object()
+
+        if payment.status == Payment.StatusType.PAID:
+            return Response("Payment is already paid")
+
+        if payment.status == Payment.StatusType.EXPIRED:
+            return redirect("payments:payment-renew", pk=payment.id)
+
+        if payment.session_url:
+            return redirect(payment.session_url)
+
+        return Response(
+            "Checkout session is being created. Retry later.",
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Retry-After": "1"},
+        )
+
     @action(
         methods=["GET", ],
         detail=True,
@@ -114,14 +236,18 @@ class PaymentsViewSet(ReadOnlyModelViewSet):
     def renew(self, request, pk=None):
         """Endpoint for renew payment session, if expired. Otherwise - redirect"""
         payment = get_object_or_404(Payment, pk=pk)
-        status = payment.status
+        payment_status = payment.status
 
-        if status == Payment.StatusType.PAID:
+        if payment_status == Payment.StatusType.PAID:
             return Response("Payment is already paid")
 
-        if status == Payment.StatusType.PENDING:
+        if payment_status == Payment.StatusType.PENDING and payment.session_url:
             return redirect(payment.session_url)
 
-        new_payment = renew_stripe_checkout_session(payment, request)
+        if (new_payment := renew_stripe_checkout_session(payment, request)) is None:
+            return Response(
+                {"error": "Checkout session is not created. Retry later."},
+                status=status.HTTP_502_BAD_GATEWAY
+            )
 
         return redirect(new_payment.session_url)
@@ -1,8 +1,13 @@
+import time
+
+
 class Session_Mock:
     def __init__(self, *args, **kwargs):
         self.url = "http://test.url"
         self.id = "111"
         self.payment_status = "paid"
+        self.status = "complete"
+        self.expires_at = int(time.time()) + 24 * 60 * 60
 
 
 class Session_Mock_not_paid:
@@ -10,6 +15,8 @@ class Session_Mock_not_paid:
         self.url = "http://test.url"
         self.id = "333"
         self.payment_status = ""
+        self.status = "open"
+        self.expires_at = int(time.time()) + 24 * 60 * 60
 
 
 class Session_Mock_expired:
@@ -18,3 +25,4 @@ class Session_Mock_expired:
         self.id = "333"
         self.payment_status = ""
         self.status = "expired"
+        self.expires_at = int(time.time()) - 60
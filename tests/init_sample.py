@@ -5,7 +5,7 @@ from django.utils import timezone
 
 from books.models import Book
 from borrowings.models import Borrowing
-from payments.models import Payment
+from payments.models import CheckoutSession, Payment
 
 
 def init_sample_user(number: int):
@@ -52,5 +52,10 @@ def init_sample_payment(borrowing, **params):
         "borrowing": borrowing,
         "money_to_pay": 10,
     }
+    if session_id := params.pop("session_id", None):
+        params["checkout_session"] = CheckoutSession.objects.get_or_create(
+            session_id=session_id,
+            defaults={"url": params.get("session_url"), "expires_at": params.get("expires_at")},
+        )[0]
     defaults.update(params)
     return Payment.objects.get_or_create(**defaults)[0]
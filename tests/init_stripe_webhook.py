@@ -0,0 +1,50 @@
+import hashlib
+import hmac
+import json
+import time
+import uuid
+
+from django.urls import reverse
+
+STRIPE_WEBHOOK_URL = reverse("payments:payment-webhook")
+STRIPE_WEBHOOK_TEST_SECRET = "whsec_test"
+
+
+def stripe_signature(
+        payload: str,
+        secret: str = STRIPE_WEBHOOK_TEST_SECRET,
+        timestamp: int | None = None
+) -> str:
+    """Sign payload the way Stripe does: t=<timestamp>,v1=<HMAC-SHA256 of "timestamp.payload">"""
+    timestamp = timestamp or int(time.time())
+    signature = hmac.new(
+        secret.encode("utf-8"), f"{timestamp}.{payload}".encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def init_stripe_event(event_type: str, session_id: str, **session_params) -> dict:
+    session = {
+        "id": session_id,
+        "object": "checkout.session",
+        "payment_status": "paid" if event_type == "checkout.session.completed" else "unpaid",
+        "status": "expired" if event_type == "checkout.session.expired" else "complete",
+    }
+    session.update(session_params)
+    return {
+        "id": f"evt_{uuid.uuid4().hex}",
+        "object": "event",
+        "type": event_type,
+        "data": {"object": session},
+    }
+
+
+def send_fake_webhook(client, event: dict, secret: str = STRIPE_WEBHOOK_TEST_SECRET):
+    """Local stand-in for Stripe: post a signed event to the webhook endpoint"""
+    payload = json.dumps(event)
+    return client.post(
+        STRIPE_WEBHOOK_URL,
+        data=payload,
+        content_type="application/json",
+        HTTP_STRIPE_SIGNATURE=stripe_signature(payload, secret),
+    )
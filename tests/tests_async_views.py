@@ -0,0 +1,193 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import AsyncMock, Mock, patch
+
+import stripe
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from notifications.services import NotificationQueue
+from payments.models import Payment
+from payments.services import closes_stripe_client_under_wsgi, stripe_async_client
+from tests.init_mock_classes import Session_Mock, Session_Mock_not_paid
+from tests.init_sample import init_sample_user, init_sample_book, init_sample_borrowing, init_sample_payment
+
+BORROWING_ASYNC_URL = reverse("borrowings:borrowing-create-async")
+PAYMENT_SUCCESS_ASYNC_URL = reverse("payments:payment-success-async") + "?session_id="
+PAYMENT_RENEW_ASYNC_URL = "payments:payment-renew-async"
+
+
+def stripe_client_mock(create=Session_Mock, retrieve=Session_Mock):
+    client = Mock()
+    client.checkout.sessions.create_async = AsyncMock(side_effect=create)
+    client.checkout.sessions.retrieve_async = AsyncMock(side_effect=retrieve)
+    return client
+
+
+@patch.object(NotificationQueue, "push")
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = init_sample_user(1)
+        self.client.credentials(HTTP_AUTHORIZE=f"Bearer {AccessToken.for_user(self.user1)}")
+
+        self.book1 = init_sample_book(inventory=1)
+        self.payload = {
+            "expected_return_date": (timezone.now().date() + timedelta(days=1)).isoformat(),
+            "book": self.book1.id,
+        }
+
+    def test_borrowing_create_unauthorized(self, mock_push):
+        self.client.credentials()
+        response = self.client.post(BORROWING_ASYNC_URL, self.payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZE="Bearer wrong")
+        response = self.client.post(BORROWING_ASYNC_URL, self.payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json()["code"], "token_not_valid")
+
+    def test_borrowing_create_redirects_to_session(self, mock_push):
+        client = stripe_client_mock()
+        with patch("payments.services.stripe_async_client", return_value=client):
+            response = self.client.post(BORROWING_ASYNC_URL, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response.url, Session_Mock().url)
+
+        payment = Payment.objects.get(borrowing__user=self.user1)
+        self.assertEqual(payment.checkout_session.session_id, Session_Mock().id)
+        self.book1.refresh_from_db()
+        self.assertEqual(self.book1.inventory, 0)
+
+        params = client.checkout.sessions.create_async.call_args.kwargs["params"]
+        self.assertEqual(params["client_reference_id"], str(payment.id))
+        self.assertIn(reverse("payments:payment-success-async"), params["success_url"])
+
+    def test_borrowing_create_invalid(self, mock_push):
+        response = self.client.post(BORROWING_ASYNC_URL, {"book": self.book1.id}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("expected_return_date", response.json())
+
+        self.book1.inventory = 0
+        self.book1.save()
+        response = self.client.post(BORROWING_ASYNC_URL, self.payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_borrowing_create_pending_payments_forbidden(self, mock_push):
+        borrowing = init_sample_borrowing(init_sample_book(title="Other"), self.user1)
+        init_sample_payment(borrowing, status=Payment.StatusType.PENDING)
+
+        response = self.client.post(BORROWING_ASYNC_URL, self.payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.json()["Count of pending payments"], 1)
+
+    @patch("payments.tasks.create_payment_checkout_session.delay")
+    def test_borrowing_create_stripe_unavailable_scheduled(self, mock_delay, mock_push):
+        client = stripe_client_mock(create=stripe.error.APIConnectionError("unavailable"))
+        with (patch("payments.services.stripe_async_client", return_value=client),
+              self.captureOnCommitCallbacks(execute=True)):
+            response = self.client.post(BORROWING_ASYNC_URL, self.payload, format="json")
+
+        payment = Payment.objects.get(borrowing__user=self.user1)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response.url, reverse("payments:payment-checkout", args=[payment.id]))
+        self.assertIsNone(payment.checkout_session)
+        mock_delay.assert_called_once()
+
+    def test_payment_success(self, mock_push):
+        payment = init_sample_payment(init_sample_borrowing(self.book1, self.user1), session_id="111")
+
+        with patch("payments.services.stripe_async_client", return_value=stripe_client_mock()):
+            response = self.client.get(PAYMENT_SUCCESS_ASYNC_URL + "111")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.StatusType.PAID)
+
+        # confirmed already, Stripe is not asked again
+        with patch("payments.services.stripe_async_client") as client:
+            response = self.client.get(PAYMENT_SUCCESS_ASYNC_URL + "111")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        client.assert_not_called()
+
+        response = self.client.get(PAYMENT_SUCCESS_ASYNC_URL + "999")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_payment_success_not_paid(self, mock_push):
+        payment = init_sample_payment(init_sample_borrowing(self.book1, self.user1), session_id="333")
+
+        client = stripe_client_mock(retrieve=Session_Mock_not_paid)
+        with patch("payments.services.stripe_async_client", return_value=client):
+            response = self.client.get(PAYMENT_SUCCESS_ASYNC_URL + "333")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.StatusType.PENDING)
+
+    def test_payment_renew(self, mock_push):
+        borrowing = init_sample_borrowing(self.book1, self.user1)
+        payment = init_sample_payment(borrowing, status=Payment.StatusType.EXPIRED, session_id="old")
+        other = init_sample_payment(
+            borrowing, type=Payment.Type.FINE, status=Payment.StatusType.EXPIRED, session_id="old"
+        )
+
+        client = stripe_client_mock()
+        with patch("payments.services.stripe_async_client", return_value=client):
+            response = self.client.get(reverse(PAYMENT_RENEW_ASYNC_URL, args=[payment.id]))
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response.url, Session_Mock().url)
+
+        for renewed in (payment, other):
+            renewed.refresh_from_db()
+            self.assertEqual(renewed.status, Payment.StatusType.PENDING)
+            self.assertEqual(renewed.checkout_session.session_id, Session_Mock().id)
+        params = client.checkout.sessions.create_async.call_args.kwargs["params"]
+        self.assertEqual(len(params["line_items"]), 2)
+
+    def test_payment_renew_paid_or_foreign(self, mock_push):
+        payment = init_sample_payment(
+            init_sample_borrowing(self.book1, self.user1), status=Payment.StatusType.PAID
+        )
+        response = self.client.get(reverse(PAYMENT_RENEW_ASYNC_URL, args=[payment.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.credentials(HTTP_AUTHORIZE=f"Bearer {AccessToken.for_user(init_sample_user(2))}")
+        response = self.client.get(reverse(PAYMENT_RENEW_ASYNC_URL, args=[payment.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StripeAsyncClientTests(TestCase):
+    @patch("payments.services.STRIPE_API_KEY", "sk_test")
+    def test_client_per_event_loop(self):
+        async def client():
+            return stripe_async_client(), stripe_async_client()
+
+        first, same = asyncio.run(client())
+        other, _ = asyncio.run(client())
+        self.assertIs(first, same)
+        self.assertIsNot(first, other)
+
+    @patch("payments.services.STRIPE_API_KEY", "sk_test")
+    def test_client_closed_after_wsgi_request(self):
+        clients = []
+
+        @closes_stripe_client_under_wsgi
+        async def view(request):
+            clients.append(stripe_async_client())
+            return HttpResponse()
+
+        async def client_kept(factory):
+            await view(factory.get("/"))
+            return clients[-1] is stripe_async_client()
+
+        with patch("stripe.HTTPXClient.close_async") as close:
+            self.assertTrue(asyncio.run(client_kept(AsyncRequestFactory())))
+            close.assert_not_called()
+
+            self.assertFalse(asyncio.run(client_kept(RequestFactory())))
+            close.assert_awaited_once()
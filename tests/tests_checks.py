@@ -0,0 +1,64 @@
+import importlib
+import os
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.checks import Error
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from library_service.checks import (
+    check_debug_tooling,
+    check_persistent_connections,
+    check_metrics_directory,
+    check_database_connection,
+)
+
+
+class ProductionSettingsTests(SimpleTestCase):
+    def test_production_profile(self):
+        with patch.dict(os.environ, {"DJANGO_SECRET_KEY": "secret", "DJANGO_ALLOWED_HOSTS": "a.test,b.test"}):
+            production = importlib.import_module("library_service.settings_production")
+
+        self.assertFalse(production.DEBUG)
+        self.assertEqual(production.ALLOWED_HOSTS, ["a.test", "b.test"])
+        self.assertNotIn("debug_toolbar", production.INSTALLED_APPS)
+        self.assertFalse([name for name in production.MIDDLEWARE if "debug_toolbar" in name])
+        self.assertEqual(production.DATABASES["default"]["CONN_MAX_AGE"], 600)
+        self.assertTrue(production.DATABASES["default"]["CONN_HEALTH_CHECKS"])
+        self.assertFalse(settings.DATABASES["default"]["CONN_HEALTH_CHECKS"])
+
+    def test_debug_toolbar_error(self):
+        self.assertEqual([error.id for error in check_debug_tooling(None)], ["library.E001"])
+
+        with override_settings(
+            INSTALLED_APPS=[app for app in settings.INSTALLED_APPS if app != "debug_toolbar"],
+            MIDDLEWARE=[name for name in settings.MIDDLEWARE if "debug_toolbar" not in name],
+        ):
+            self.assertEqual(check_debug_tooling(None), [])
+
+    def test_persistent_connections_warning(self):
+        database = {"ENGINE": "django.db.backends.postgresql", "CONN_MAX_AGE": 0}
+        with patch.dict(settings.DATABASES["default"], database):
+            self.assertEqual([error.id for error in check_persistent_connections(None)], ["library.W001"])
+        with patch.dict(settings.DATABASES["default"], {**database, "CONN_MAX_AGE": 60}):
+            self.assertEqual(check_persistent_connections(None), [])
+
+    def test_metrics_directory(self):
+        with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": "/not/a/directory"}):
+            self.assertEqual([error.id for error in check_metrics_directory(None)], ["library.E002"])
+
+
+class DatabaseConnectionCheckTests(TestCase):
+    def test_database_connection(self):
+        self.assertEqual(check_database_connection(None, databases=["default"]), [])
+        self.assertEqual(check_database_connection(None), [])
+
+    def test_database_unavailable(self):
+        from django.db.utils import OperationalError
+
+        with patch("django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection",
+                   side_effect=OperationalError("refused")):
+            errors = check_database_connection(None, databases=["default"])
+
+        self.assertIsInstance(errors[0], Error)
+        self.assertEqual(errors[0].id, "library.E003")
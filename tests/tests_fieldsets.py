@@ -0,0 +1,93 @@
+from django.db import connection
+from django.db.models import Prefetch
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from books.models import Book
+from borrowings.models import Borrowing
+from borrowings.serializers import BorrowingSerializer
+from payments.models import Payment
+from tests.init_sample import (
+    init_sample_book,
+    init_sample_admin_user,
+    init_sample_borrowing,
+    init_sample_payment,
+)
+
+BORROWING_URL = reverse("borrowings:borrowing-list")
+PAYMENT_URL = reverse("payments:payment-list")
+BOOK_URL = reverse("books:book-list")
+
+
+def detail_url(pk: int) -> str:
+    return reverse("borrowings:borrowing-detail", args=[pk])
+
+
+class FieldsetAPITestCase(APITestCase):
+    def setUp(self):
+        self.admin = init_sample_admin_user(1)
+        self.book = init_sample_book(title="Book1", cover=Book.CoverType.HARD)
+        self.borrowing = init_sample_borrowing(self.book, self.admin)
+        self.payment = init_sample_payment(self.borrowing, money_to_pay="3.10")
+        self.client.force_authenticate(self.admin)
+
+    def test_list_fields_narrow_output_and_queries(self):
+        self.client.get(BORROWING_URL)
+        with CaptureQueriesContext(connection) as full:
+            self.client.get(BORROWING_URL)
+        with CaptureQueriesContext(connection) as narrow:
+            response = self.client.get(BORROWING_URL, {"fields": "borrow_date,user"})
+
+        self.assertEqual(list(response.data["results"][0]), ["id", "user", "borrow_date"])
+        self.assertEqual(len(narrow), len(full) - 1)
+        page_sql = narrow.captured_queries[-1]["sql"]
+        self.assertNotIn("books_book", page_sql)
+        self.assertNotIn("expected_return_date", page_sql)
+
+    def test_list_expand_same_as_serializer(self):
+        response = self.client.get(BORROWING_URL, {"expand": "book", "fields": "book,payments"})
+
+        borrowings = Borrowing.objects.select_related("book").prefetch_related(
+            Prefetch("payments", queryset=Payment.objects.order_by("id"))
+        )
+        serializer = BorrowingSerializer(
+            borrowings, many=True, context={"fieldset": {"fields": ["book", "payments"], "expand": ["book"]}}
+        )
+        self.assertEqual(
+            JSONRenderer().render(response.data["results"]), JSONRenderer().render(serializer.data)
+        )
+        self.assertEqual(response.data["results"][0]["book"]["cover"], Book.CoverType.HARD)
+
+    def test_retrieve_fields_and_expand(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                detail_url(self.borrowing.id), {"fields": "is_active", "expand": "book"}
+            )
+
+        self.assertEqual(list(response.data), ["id", "book", "is_active"])
+        self.assertEqual(response.data["book"]["title"], "Book1")
+        self.assertTrue(response.data["is_active"])
+        sql = " ".join(query["sql"] for query in queries.captured_queries)
+        self.assertNotIn("users_user", sql)
+        self.assertNotIn("FROM \"payments_payment\"", sql)
+
+    def test_payment_and_book_fields(self):
+        response = self.client.get(PAYMENT_URL, {"fields": "status"})
+        self.assertEqual(
+            response.data["results"], [{"id": self.payment.id, "status": Payment.StatusType.PENDING}]
+        )
+
+        response = self.client.get(BOOK_URL, {"fields": "title,inventory"})
+        self.assertEqual(response.data["results"], [{"id": self.book.id, "title": "Book1", "inventory": 11}])
+
+    def test_invalid_fieldset(self):
+        response = self.client.get(BORROWING_URL, {"fields": "id,secret"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("fields", response.data)
+
+        response = self.client.get(PAYMENT_URL, {"expand": "borrowing"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("expand", response.data)
@@ -0,0 +1,105 @@
+from unittest.mock import patch, MagicMock
+
+import requests
+import stripe
+from django.conf import settings
+from django.test import AsyncClient, SimpleTestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from rest_framework.test import APITestCase
+from telebot.apihelper import ApiTelegramException
+
+from library_service.metrics import queue_depth, stripe_call
+from notifications.services import TelegramSender, NotificationQueue
+from tests.init_sample import init_sample_book
+
+METRICS_URL = reverse("metrics")
+# without the sync only toolbar middleware, as in production, the middleware stack stays async under ASGI
+ASYNC_MIDDLEWARE = [
+    middleware for middleware in settings.MIDDLEWARE if not middleware.startswith("debug_toolbar.")
+]
+
+
+def sample_value(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsEndpointTests(APITestCase):
+    def setUp(self):
+        self.book = init_sample_book()
+        redis_client = MagicMock()
+        redis_client.llen.return_value = 3
+        patcher = patch.object(queue_depth, "_client", redis_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(NotificationQueue, "__len__", return_value=2)
+    def test_metrics_exposed(self, mock_len):
+        self.client.get(reverse("books:book-list"))
+
+        response = self.client.get(METRICS_URL)
+
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn("library_http_request_duration_seconds_bucket", content)
+        self.assertIn('library_celery_queue_depth{queue="notifications"} 3.0', content)
+        self.assertIn('library_celery_queue_depth{queue="telegram_buffer"} 2.0', content)
+
+    def test_request_labelled_by_viewset_action(self):
+        labels = {"view": "BookViewSet", "action": "retrieve"}
+        request = {**labels, "method": "GET", "status": "200"}
+        count = sample_value("library_http_request_duration_seconds_count", **request)
+        queries = sample_value("library_http_request_db_queries_sum", **labels)
+
+        self.client.get(reverse("books:book-detail", args=[self.book.id]))
+
+        self.assertEqual(sample_value("library_http_request_duration_seconds_count", **request), count + 1)
+        self.assertGreater(sample_value("library_http_request_db_queries_sum", **labels), queries)
+
+    @override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)
+    async def test_sync_view_queries_counted_under_asgi(self):
+        labels = {"view": "BookViewSet", "action": "retrieve"}
+        count = sample_value("library_http_request_db_queries_count", **labels)
+        queries = sample_value("library_http_request_db_queries_sum", **labels)
+
+        response = await AsyncClient().get(reverse("books:book-detail", args=[self.book.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sample_value("library_http_request_db_queries_count", **labels), count + 1)
+        self.assertGreater(sample_value("library_http_request_db_queries_sum", **labels), queries)
+
+
+class ServiceMetricsTests(SimpleTestCase):
+    def test_stripe_error_counted_and_raised(self):
+        error = {"operation": "session_retrieve", "error": "InvalidRequestError"}
+        errors = sample_value("library_stripe_errors_total", **error)
+        calls = sample_value("library_stripe_request_duration_seconds_count", operation="session_retrieve")
+
+        with self.assertRaises(stripe.error.InvalidRequestError):
+            with stripe_call("session_retrieve"):
+                raise stripe.error.InvalidRequestError("No such checkout.session", "id")
+
+        self.assertEqual(sample_value("library_stripe_errors_total", **error), errors + 1)
+        self.assertEqual(
+            sample_value("library_stripe_request_duration_seconds_count", operation="session_retrieve"),
+            calls + 1,
+        )
+
+    def test_telegram_failures_counted(self):
+        sender = TelegramSender()
+        rate_limited = ApiTelegramException(
+            "sendMessage", None, {"error_code": 429, "description": "Too Many Requests"}
+        )
+        limited = sample_value("library_telegram_send_failures_total", reason="429")
+        unreachable = sample_value("library_telegram_send_failures_total", reason="connection")
+
+        with patch.object(sender.tb, "send_message", side_effect=rate_limited):
+            self.assertIs(sender.send_message("message"), rate_limited)
+        with patch.object(sender.tb, "send_message", side_effect=requests.ConnectionError):
+            with self.assertRaises(requests.ConnectionError):
+                sender.send_message("message")
+
+        self.assertEqual(sample_value("library_telegram_send_failures_total", reason="429"), limited + 1)
+        self.assertEqual(
+            sample_value("library_telegram_send_failures_total", reason="connection"), unreachable + 1
+        )
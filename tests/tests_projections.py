@@ -0,0 +1,117 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Prefetch
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from books.models import Book
+from books.serializers import BookSerializer
+from borrowings.models import Borrowing
+from borrowings.serializers import BorrowingSerializer, BorrowingDetailSerializer
+from library_service.projections import ValuesRepresentation
+from payments.models import Payment
+from payments.serializers import PaymentSerializer
+from tests.init_sample import (
+    init_sample_user,
+    init_sample_book,
+    init_sample_admin_user,
+    init_sample_borrowing,
+    init_sample_payment,
+)
+
+
+def render(data) -> bytes:
+    return JSONRenderer().render(data)
+
+
+class ValuesListAPITestCase(APITestCase):
+    """List pages built from values() rows render the same JSON as the serializers"""
+
+    def setUp(self):
+        self.admin = init_sample_admin_user(1)
+        user = init_sample_user(2)
+        book1 = init_sample_book(title="Book1", daily_fee="0.50")
+        book2 = init_sample_book(title="Book2", cover=Book.CoverType.HARD, daily_fee="12.00")
+        borrowing1 = init_sample_borrowing(book1, user)
+        self.borrowings = [
+            borrowing1,
+            init_sample_borrowing(book2, user, actual_return_date=timezone.now().date()),
+            init_sample_borrowing(book2, self.admin),
+        ]
+        init_sample_payment(borrowing1, money_to_pay="3.10")
+        init_sample_payment(
+            borrowing1,
+            type=Payment.Type.FINE,
+            session_id="cs_1",
+            session_url="https://checkout.stripe.com/c/pay/cs_1",
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+        self.client.force_authenticate(self.admin)
+
+    def assertSameContent(self, url, expected):
+        response = self.client.get(url, {"limit": 100})
+        self.assertEqual(response.content, render(response.data | {"results": expected}))
+
+    def test_book_list(self):
+        self.assertSameContent(
+            reverse("books:book-list"), BookSerializer(Book.objects.all(), many=True).data
+        )
+
+    def test_borrowing_list(self):
+        borrowings = Borrowing.objects.select_related("book", "user").prefetch_related(
+            Prefetch("payments", queryset=Payment.objects.order_by("id"))
+        )
+        self.assertSameContent(
+            reverse("borrowings:borrowing-list"), BorrowingSerializer(borrowings, many=True).data
+        )
+
+    def test_payment_list(self):
+        self.assertSameContent(
+            reverse("payments:payment-list"), PaymentSerializer(Payment.objects.all(), many=True).data
+        )
+
+    def test_borrowing_list_cursor_pagination(self):
+        response = self.client.get(reverse("borrowings:borrowing-list"), {"pagination": "cursor", "limit": 2})
+        ids = [borrowing.id for borrowing in self.borrowings]
+        self.assertEqual([item["id"] for item in response.data["results"]], ids[:2])
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual([item["id"] for item in response.data["results"]], ids[2:])
+
+
+class ValuesRepresentationTestCase(TestCase):
+    def setUp(self):
+        borrowing = init_sample_borrowing(init_sample_book(), init_sample_user(1))
+        self.payment = init_sample_payment(
+            borrowing, money_to_pay="7.5", expires_at=timezone.now() + timedelta(days=1)
+        )
+
+    @override_settings(USE_TZ=True, TIME_ZONE="Europe/Kyiv")
+    def test_payment_representation_with_time_zone(self):
+        representation = ValuesRepresentation(PaymentSerializer)
+        payments = Payment.objects.all()
+
+        self.assertEqual(
+            render(representation.represent(payments.values(*representation.lookups))),
+            render(PaymentSerializer(payments, many=True).data),
+        )
+
+    def test_not_computed_nested_field_error(self):
+        representation = ValuesRepresentation(BorrowingDetailSerializer)
+
+        with self.assertRaises(ImproperlyConfigured):
+            representation.lookups
+
+    def test_decimal_representation(self):
+        class FeeSerializer(serializers.Serializer):
+            fee = serializers.DecimalField(max_digits=5, decimal_places=1)
+
+        representation = ValuesRepresentation(FeeSerializer)
+
+        self.assertEqual(representation.represent([{"fee": Decimal("7.55")}]), [{"fee": "7.6"}])
@@ -0,0 +1,85 @@
+import re
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from borrowings.models import Borrowing
+from borrowings.tasks import overdue_borrowings
+from payments.models import Payment
+
+SQLITE_TABLE_SCAN = re.compile(r"\bSCAN (\w+)")
+POSTGRES_TABLE_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def explain(queryset) -> str:
+    """ Return: query plan of the queryset on the current database """
+    if connection.vendor == "postgresql":
+        # only a missing index can make the planner fall back to a sequential scan
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            return queryset.explain()
+    return queryset.explain()
+
+
+def table_scans(plan: str) -> list[str]:
+    """ Return: tables read by a full sequential scan in the plan """
+    pattern = POSTGRES_TABLE_SCAN if connection.vendor == "postgresql" else SQLITE_TABLE_SCAN
+    return pattern.findall(plan)
+
+
+class HotQueryPlansTestCase(TestCase):
+    """Hot filters of the API & periodic tasks are served by indexes on a seeded dataset"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            "seed_library", books=200, users=50, borrowings=3000, batch_size=1000, stdout=StringIO()
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.payment = Payment.objects.exclude(checkout_session=None).select_related(
+            "checkout_session"
+        ).first()
+        cls.user_id = Borrowing.objects.values_list("user_id", flat=True).first()
+
+    def assertNoTableScan(self, queryset):
+        plan = explain(queryset)
+        self.assertEqual(table_scans(plan), [], f"Sequential scan in the plan:\n{plan}")
+
+    def assertUsesIndex(self, queryset, index: str):
+        """ Plan reads this very index: with seq scans off PostgreSQL takes any usable one (FK ones too) """
+        plan = explain(queryset)
+        self.assertEqual(table_scans(plan), [], f"Sequential scan in the plan:\n{plan}")
+        self.assertRegex(plan, rf"\b{index}\b", f"{index} is not used by the plan:\n{plan}")
+
+    def test_payment_by_session_id(self):
+        self.assertNoTableScan(
+            Payment.objects.filter(checkout_session__session_id=self.payment.checkout_session.session_id)
+        )
+
+    def test_expired_pending_payments_sweep(self):
+        self.assertUsesIndex(
+            Payment.objects.filter(
+                status=Payment.StatusType.PENDING,
+                expires_at__lte=timezone.now(),
+                checkout_session__isnull=False,
+            ).order_by("expires_at", "id")[:100],
+            "payments_pending_expires_idx",
+        )
+
+    def test_active_borrowings_of_reader(self):
+        self.assertUsesIndex(
+            Borrowing.objects.filter(user_id=self.user_id, actual_return_date__isnull=True).order_by("id"),
+            "borrowings_user_active_idx",
+        )
+
+    def test_overdue_borrowings(self):
+        due_date = timezone.now().date() + timedelta(days=1)
+
+        self.assertUsesIndex(overdue_borrowings(due_date).order_by("id"), "borrowings_overdue_idx")
+        self.assertNoTableScan(overdue_borrowings(due_date).filter(id__range=(1, 500)).order_by("id"))
@@ -0,0 +1,77 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from users.models import User
+from users.services import cached_user, cache_user, claims_user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWT authentication resolving the token user from the users cache, the database is read on a miss only.
+    With JWT_EMBED_USER_CLAIMS access tokens carrying user claims need no lookup at all,
+    the user is checked (active, password not changed) on token refresh"""
+
+    def get_user(self, validated_token: Token) -> User:
+        if settings.JWT_EMBED_USER_CLAIMS and (
+            user := claims_user(validated_token.payload, self.get_user_id(validated_token))
+        ):
+            return user
+        return self.get_stored_user(validated_token)
+
+    @staticmethod
+    def get_user_id(validated_token: Token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def get_stored_user(self, validated_token: Token) -> User:
+        """ User of the token from the users cache or the database, checked active & not changed password """
+        user_id = self.get_user_id(validated_token)
+        if (user := cached_user(user_id)) is None:
+            user = super().get_user(validated_token)
+            cache_user(user)
+            return user
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+def jwt_required(view):
+    """Async (non DRF) view decorator: request.user is resolved by CachedJWTAuthentication
+    in a worker thread (cache or database on a miss), 401 Unauthorized without a valid token"""
+
+    authentication = CachedJWTAuthentication()
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            authenticated = await sync_to_async(authentication.authenticate)(request)
+        except exceptions.AuthenticationFailed as error:
+            # the body of DRF exception_handler
+            data = error.detail if isinstance(error.detail, dict) else {"detail": error.detail}
+            return JsonResponse(data, status=error.status_code)
+        if authenticated is None:
+            return JsonResponse(
+                {"detail": exceptions.NotAuthenticated.default_detail},
+                status=exceptions.NotAuthenticated.status_code,
+            )
+
+        request.user = authenticated[0]
+        return await view(request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.6 on 2026-10-18 07:39
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def count_pending_payments(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    Payment = apps.get_model("payments", "Payment")
+
+    totals = Payment.objects.filter(status="pending").values("borrowing__user_id").annotate(
+        count=Count("id"), amount=Sum("money_to_pay")
+    )
+    users = []
+    for total in totals:
+        users.append(
+            User(
+                pk=total["borrowing__user_id"],
+                pending_payments=total["count"],
+                pending_amount=total["amount"],
+            )
+        )
+    User.objects.bulk_update(users, ["pending_payments", "pending_amount"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+        ("payments", "0005_payment_expires_at_sweepwatermark"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="pending_amount",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="pending_payments",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_pending_payments, migrations.RunPython.noop),
+    ]
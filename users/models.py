@@ -9,12 +9,28 @@ from users.managers import UserManager
 class User(AbstractUser):
     username = None
     email = models.EmailField(_("email address"), unique=True, db_index=True)
+    # denormalized from payments, maintained by Payment.save & repair_pending_counters command
+    pending_payments = models.PositiveIntegerField(default=0)
+    pending_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    PENDING_COUNTERS = ("pending_payments", "pending_amount")
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
     objects = UserManager()
 
+    def save(self, *args, **kwargs):
+        """Pending counters are left out of a full update: it would write back the values read
+        with the user, overwriting F() shifts of payments committed meanwhile"""
+        full_update = not (self._state.adding or args or kwargs.get("force_insert"))
+        if full_update and kwargs.get("update_fields") is None:
+            skipped = {*self.PENDING_COUNTERS, *self.get_deferred_fields()}
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}".strip()
@@ -1,5 +1,11 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.authentication import CachedJWTAuthentication
+from users.services import user_claims
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -22,3 +28,28 @@ class UserSerializer(serializers.ModelSerializer):
             user.save()
 
         return user
+
+
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        """Token pair, with JWT_EMBED_USER_CLAIMS carrying email & staff flags of the user"""
+        token = super().get_token(user)
+        if settings.JWT_EMBED_USER_CLAIMS:
+            for claim, value in user_claims(user).items():
+                token[claim] = value
+        return token
+
+
+class UserTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        """New access token for an active user (with the password of the token), with JWT_EMBED_USER_CLAIMS
+        carrying current claims: the user is checked here, not on requests of the access token"""
+        data = super().validate(attrs)
+        if settings.JWT_EMBED_USER_CLAIMS:
+            user = CachedJWTAuthentication().get_stored_user(self.token_class(attrs["refresh"]))
+            access = AccessToken(data["access"])
+            for claim, value in user_claims(user).items():
+                access[claim] = value
+            data["access"] = str(access)
+        return data
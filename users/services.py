@@ -0,0 +1,105 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from users.models import User
+
+
+class LRUCache:
+    """In-process LRU of up to maxsize entries, each one expiring ttl seconds after it was set"""
+
+    def __init__(self, maxsize: int, ttl: float, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (value, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# User fields embedded in issued tokens with JWT_EMBED_USER_CLAIMS
+USER_CLAIMS = ("email", "is_staff", "is_superuser")
+
+# Users resolved from tokens: a short-lived in-process LRU in front of the shared cache.
+# A save deletes both tiers of this process, other processes drop the user within AUTH_USER_LOCAL_TTL
+local_users = LRUCache(maxsize=settings.AUTH_USER_LOCAL_SIZE, ttl=settings.AUTH_USER_LOCAL_TTL)
+
+
+def _user_key(user_id) -> str:
+    return f"users:auth:{user_id}"
+
+
+def cached_user(user_id) -> User | None:
+    """ Return: copy of the cached user (so request changes stay local) or None on a miss of both tiers """
+    user = local_users.get(user_id)
+    if user is None:
+        user = cache.get(_user_key(user_id))
+        if user is None:
+            return None
+        local_users.set(user_id, user)
+    return copy.copy(user)
+
+
+def cache_user(user: User) -> None:
+    local_users.set(user.pk, copy.copy(user))
+    cache.set(_user_key(user.pk), user, settings.AUTH_USER_CACHE_TTL)
+
+
+def _delete_user(user_id) -> None:
+    local_users.delete(user_id)
+    cache.delete(_user_key(user_id))
+
+
+def invalidate_user(user_id) -> None:
+    """ Drop the cached user now & once the transaction commits,
+        so a concurrent request can not cache the row read before the change """
+    _delete_user(user_id)
+    transaction.on_commit(partial(_delete_user, user_id))
+
+
+def user_claims(user: User) -> dict:
+    """ Return: claims embedded in issued tokens, enough for permission checks """
+    return {claim: getattr(user, claim) for claim in USER_CLAIMS}
+
+
+def claims_user(payload: dict, user_id) -> User | None:
+    """ User built from embedded token claims, no database or cache lookup
+        Return: User object or None, if the token has no embedded claims """
+    if not all(claim in payload for claim in USER_CLAIMS):
+        return None
+
+    user = User(pk=user_id, is_active=True, **{claim: payload[claim] for claim in USER_CLAIMS})
+    user._state.adding = False
+    return user
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from users.models import User
+from users.services import invalidate_user
+
+
+@receiver(post_save, sender=User)
+def invalidate_cache_after_save(sender, instance, **kwargs):
+    # on create too: ids of deleted users may be reused (e.g. by the test database)
+    invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_cache_after_delete(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
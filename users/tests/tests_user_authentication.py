@@ -0,0 +1,149 @@
+from django.core.cache import cache
+from django.test import TestCase, SimpleTestCase, override_settings
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from users.authentication import CachedJWTAuthentication
+from users.services import LRUCache, local_users
+from tests.init_sample import init_sample_user
+
+
+USER_TOKEN_URL = reverse("users:token_obtain_pair")
+USER_TOKEN_REFRESH_URL = reverse("users:token_refresh")
+BORROWING_URL = reverse("borrowings:borrowing-list")
+
+
+class Clock_Mock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_lru_cache_evict_least_recently_used(self):
+        lru = LRUCache(maxsize=2, ttl=10)
+        lru.set(1, "first")
+        lru.set(2, "second")
+        lru.get(1)
+        lru.set(3, "third")
+
+        self.assertEqual((lru.get(1), lru.get(2), lru.get(3)), ("first", None, "third"))
+
+    def test_lru_cache_expire_after_ttl(self):
+        clock = Clock_Mock()
+        lru = LRUCache(maxsize=2, ttl=5, clock=clock)
+        lru.set(1, "first")
+
+        clock.now = 4.9
+        self.assertEqual(lru.get(1), "first")
+        clock.now = 5
+        self.assertIsNone(lru.get(1))
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        local_users.clear()
+        cache.clear()
+        self.user1 = init_sample_user(1)
+        self.auth = CachedJWTAuthentication()
+
+    def authenticate(self, token=None):
+        token = token or AccessToken.for_user(self.user1)
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZE=f"Bearer {token}")
+        user, _ = self.auth.authenticate(request)
+        return user
+
+    def test_user_read_once_then_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(), self.user1)
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+
+        self.assertEqual(user.email, self.user1.email)
+        self.assertIsNot(user, self.authenticate())
+
+    def test_shared_cache_tier_after_local_miss(self):
+        self.authenticate()
+        local_users.clear()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(), self.user1)
+
+    def test_user_save_invalidates_cache(self):
+        self.authenticate()
+
+        self.user1.is_staff = True
+        self.user1.save()
+        self.assertTrue(self.authenticate().is_staff)
+
+        self.user1.is_active = False
+        self.user1.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_api_request_no_user_query(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZE=f"Bearer {AccessToken.for_user(self.user1)}")
+        client.get(BORROWING_URL)
+
+        # the page count only, no user lookup
+        with self.assertNumQueries(1):
+            response = client.get(BORROWING_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(JWT_EMBED_USER_CLAIMS=True)
+class EmbeddedUserClaimsTests(TestCase):
+    def setUp(self):
+        local_users.clear()
+        cache.clear()
+        self.user1 = init_sample_user(1)
+        self.auth = CachedJWTAuthentication()
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZE=f"Bearer {token}")
+        user, _ = self.auth.authenticate(request)
+        return user
+
+    def test_token_claims_user_no_lookup(self):
+        response = APIClient().post(USER_TOKEN_URL, {"email": self.user1.email, "password": "testpass"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            user = self.authenticate(response.data["access"])
+
+        self.assertEqual((user.pk, user.email, user.is_staff), (self.user1.pk, self.user1.email, False))
+        self.assertTrue(user.is_authenticated)
+
+    def test_refreshed_token_keeps_claims(self):
+        refresh = APIClient().post(USER_TOKEN_URL, {"email": self.user1.email, "password": "testpass"})
+        access = RefreshToken(refresh.data["refresh"]).access_token
+
+        self.assertEqual(access["email"], self.user1.email)
+
+    def test_refresh_deactivated_user_rejected(self):
+        refresh = APIClient().post(USER_TOKEN_URL, {"email": self.user1.email, "password": "testpass"})
+        self.user1.is_active = False
+        self.user1.save()
+
+        response = APIClient().post(USER_TOKEN_REFRESH_URL, {"refresh": refresh.data["refresh"]})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_embeds_current_claims(self):
+        refresh = APIClient().post(USER_TOKEN_URL, {"email": self.user1.email, "password": "testpass"})
+        self.user1.is_staff = True
+        self.user1.save()
+
+        response = APIClient().post(USER_TOKEN_REFRESH_URL, {"refresh": refresh.data["refresh"]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(AccessToken(response.data["access"])["is_staff"])
+        self.assertTrue(self.authenticate(response.data["access"]).is_staff)
+
+    def test_token_without_claims_falls_back_to_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(AccessToken.for_user(self.user1)), self.user1)
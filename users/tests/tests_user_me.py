@@ -4,7 +4,7 @@ from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
 
-from tests.init_sample import init_sample_user
+from tests.init_sample import init_sample_user, init_sample_book, init_sample_borrowing, init_sample_payment
 
 
 USER_ME_URL = reverse("users:manage")
@@ -40,3 +40,15 @@ class ApiUserMeTests(TestCase):
         response = self.client.put(USER_ME_URL, payload)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["email"], "new-test-1@test.com")
+
+    def test_user_me_update_keeps_pending_counters(self):
+        # the payment is counted after the request user was loaded
+        init_sample_payment(init_sample_borrowing(init_sample_book(), self.user1), money_to_pay="2.50")
+
+        response = self.client.put(USER_ME_URL, {"email": "new-test-1@test.com", "password": "new-testpass"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        user = get_user_model().objects.get(pk=self.user1.pk)
+        self.assertEqual(user.email, "new-test-1@test.com")
+        self.assertTrue(user.check_password("new-testpass"))
+        self.assertEqual((user.pending_payments, user.pending_amount), (1, 2.5))